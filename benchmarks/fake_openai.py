@@ -0,0 +1,325 @@
+"""
+A local stand-in for an OpenAI-compatible API, for offline benchmarks and tests.
+
+It speaks the chat completions and responses protocols (streaming and not),
+paces tokens with a configurable time to first token and token rate, and
+scripts tool calls: agents offering `transfer_to_*` tools are handed off, and
+agents offering `fetch_random_xkcd` call it once per turn. It also serves the
+XKCD JSON endpoints under /xkcd so the XKCD tool works without network access.
+
+Run standalone with:
+    python -m benchmarks.fake_openai --port 8765 --ttft 0.3 --token-rate 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+WORDS = (
+    "why", "did", "the", "scarecrow", "win", "an", "award", "because", "he", "was",
+    "outstanding", "in", "his", "field", "and", "then", "he", "told", "a", "riddle",
+)
+XKCD_LATEST = 3000
+
+
+@dataclass
+class FakeServerConfig:
+    """Timing and scripting knobs for the fake server."""
+    ttft: float = 0.3            # seconds before the first token
+    token_rate: float = 50.0     # tokens per second after the first one
+    tokens: int = 60             # tokens per text reply
+    handoff: str = "random"      # "random", "none" or a transfer tool name
+    tool_calls: bool = True      # call fetch_random_xkcd when it is offered
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+def _sse(data: Dict, event: Optional[str] = None) -> bytes:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+class FakeOpenAIServer:
+    """aiohttp application implementing the fake endpoints."""
+
+    def __init__(self, config: Optional[FakeServerConfig] = None) -> None:
+        self.config = config or FakeServerConfig()
+        self.app = web.Application(middlewares=[self._ignore_disconnects])
+        self.app.router.add_post("/v1/chat/completions", self.chat_completions)
+        self.app.router.add_post("/v1/responses", self.responses)
+        self.app.router.add_get("/xkcd/info.0.json", self.xkcd_latest)
+        self.app.router.add_get("/xkcd/{num}/info.0.json", self.xkcd_comic)
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving and return the OpenAI base URL."""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{bound_port}/v1"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def _ignore_disconnects(self, request: web.Request, handler) -> web.StreamResponse:
+        """Clients may drop a stream midway, e.g. a cancelled hedge; that is not a server error."""
+        try:
+            return await handler(request)
+        except ConnectionResetError:
+            return web.Response(status=499)
+
+    #--------------------------------------------------------------------------
+    # SCRIPTING
+    #--------------------------------------------------------------------------
+
+    def _plan(self, tool_names: List[str], tool_already_called: bool) -> Tuple[str, str]:
+        """Decide between a text reply and a tool call: returns (kind, tool name)."""
+        transfers = [name for name in tool_names if name.startswith("transfer_to_")]
+        if transfers and self.config.handoff != "none":
+            if self.config.handoff in transfers:
+                return "tool", self.config.handoff
+            return "tool", random.choice(transfers)
+        if "fetch_random_xkcd" in tool_names and self.config.tool_calls and not tool_already_called:
+            return "tool", "fetch_random_xkcd"
+        return "text", ""
+
+    async def _tokens(self):
+        """Yield reply tokens paced by the configured TTFT and token rate."""
+        await asyncio.sleep(self.config.ttft)
+        interval = 1.0 / self.config.token_rate if self.config.token_rate > 0 else 0.0
+        for i in range(self.config.tokens):
+            if i:
+                await asyncio.sleep(interval)
+            yield WORDS[i % len(WORDS)] + " "
+
+    async def _text(self) -> str:
+        return "".join([token async for token in self._tokens()])
+
+    @staticmethod
+    def _usage(prompt: str, completion_tokens: int) -> Tuple[int, int]:
+        return len(prompt) // 4 + 1, completion_tokens
+
+    #--------------------------------------------------------------------------
+    # CHAT COMPLETIONS
+    #--------------------------------------------------------------------------
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        messages = body.get("messages", [])
+        tool_names = [tool["function"]["name"] for tool in body.get("tools") or []]
+        last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+        tool_called = any(
+            call.get("function", {}).get("name") == "fetch_random_xkcd"
+            for m in messages[last_user + 1:]
+            for call in m.get("tool_calls") or []
+        )
+        kind, tool_name = self._plan(tool_names, tool_called)
+        model = body.get("model", "fake-model")
+        prompt_tokens, _ = self._usage(json.dumps(messages), 0)
+        completion_id = _new_id("chatcmpl")
+        created = int(time.time())
+
+        def chunk(delta: Dict, finish_reason: Optional[str] = None) -> Dict:
+            return {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created,
+                "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        tool_call = {
+            "id": _new_id("call"), "type": "function",
+            "function": {"name": tool_name, "arguments": "{}"},
+        }
+
+        if not body.get("stream"):
+            await asyncio.sleep(self.config.ttft)
+            if kind == "tool":
+                message, finish, completion_tokens = {"role": "assistant", "content": None, "tool_calls": [tool_call]}, "tool_calls", 5
+            else:
+                text = await self._text()
+                message, finish, completion_tokens = {"role": "assistant", "content": text}, "stop", self.config.tokens
+            return web.json_response({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        if kind == "tool":
+            await asyncio.sleep(self.config.ttft)
+            await response.write(_sse(chunk({"role": "assistant", "tool_calls": [dict(tool_call, index=0)]})))
+            await response.write(_sse(chunk({}, "tool_calls")))
+            completion_tokens = 5
+        else:
+            await response.write(_sse(chunk({"role": "assistant", "content": ""})))
+            async for token in self._tokens():
+                await response.write(_sse(chunk({"content": token})))
+            await response.write(_sse(chunk({}, "stop")))
+            completion_tokens = self.config.tokens
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await response.write(_sse({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            }))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    #--------------------------------------------------------------------------
+    # RESPONSES
+    #--------------------------------------------------------------------------
+
+    async def responses(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        items = body.get("input", [])
+        if isinstance(items, str):
+            items = [{"role": "user", "content": items}]
+        tool_names = [tool.get("name") for tool in body.get("tools") or [] if tool.get("type") == "function"]
+        last_user = max((i for i, item in enumerate(items) if item.get("role") == "user"), default=-1)
+        tool_called = any(
+            item.get("type") == "function_call" and item.get("name") == "fetch_random_xkcd"
+            for item in items[last_user + 1:]
+        )
+        kind, tool_name = self._plan(tool_names, tool_called)
+        prompt_tokens, _ = self._usage(json.dumps(items), 0)
+        response_id = _new_id("resp")
+        item_id = _new_id("msg" if kind == "text" else "fc")
+
+        def response_object(status: str, output: List[Dict], completion_tokens: int) -> Dict:
+            return {
+                "id": response_id, "object": "response", "created_at": time.time(),
+                "model": body.get("model", "fake-model"), "status": status, "output": output,
+                "parallel_tool_calls": True, "tool_choice": "auto", "tools": [],
+                "temperature": 1.0, "top_p": 1.0, "error": None, "incomplete_details": None,
+                "instructions": body.get("instructions"), "metadata": {},
+                "usage": {
+                    "input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "input_tokens_details": {"cached_tokens": 0},
+                    "output_tokens_details": {"reasoning_tokens": 0},
+                },
+            }
+
+        def message_item(text: str, status: str) -> Dict:
+            content = [{"type": "output_text", "text": text, "annotations": []}] if status == "completed" else []
+            return {"type": "message", "id": item_id, "status": status, "role": "assistant", "content": content}
+
+        call_item = {
+            "type": "function_call", "id": item_id, "call_id": _new_id("call"),
+            "name": tool_name, "arguments": "{}", "status": "completed",
+        }
+
+        if not body.get("stream"):
+            await asyncio.sleep(self.config.ttft)
+            if kind == "tool":
+                return web.json_response(response_object("completed", [call_item], 5))
+            text = await self._text()
+            return web.json_response(response_object("completed", [message_item(text, "completed")], self.config.tokens))
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(event_type: str, **data) -> None:
+            await response.write(_sse(dict(type=event_type, **data), event=event_type))
+
+        await send("response.created", response=response_object("in_progress", [], 0))
+        if kind == "tool":
+            await asyncio.sleep(self.config.ttft)
+            await send("response.output_item.added", output_index=0, item=dict(call_item, arguments="", status="in_progress"))
+            await send("response.function_call_arguments.delta", item_id=item_id, output_index=0, delta="{}")
+            await send("response.function_call_arguments.done", item_id=item_id, output_index=0, arguments="{}")
+            await send("response.output_item.done", output_index=0, item=call_item)
+            await send("response.completed", response=response_object("completed", [call_item], 5))
+        else:
+            part = {"type": "output_text", "text": "", "annotations": []}
+            await send("response.output_item.added", output_index=0, item=message_item("", "in_progress"))
+            await send("response.content_part.added", item_id=item_id, output_index=0, content_index=0, part=part)
+            tokens = []
+            async for token in self._tokens():
+                tokens.append(token)
+                await send("response.output_text.delta", item_id=item_id, output_index=0, content_index=0, delta=token)
+            text = "".join(tokens)
+            await send("response.output_text.done", item_id=item_id, output_index=0, content_index=0, text=text)
+            await send("response.content_part.done", item_id=item_id, output_index=0, content_index=0,
+                       part=dict(part, text=text))
+            done_item = message_item(text, "completed")
+            await send("response.output_item.done", output_index=0, item=done_item)
+            await send("response.completed", response=response_object("completed", [done_item], len(tokens)))
+        await response.write_eof()
+        return response
+
+    #--------------------------------------------------------------------------
+    # XKCD
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def _comic(num: int) -> Dict:
+        return {
+            "num": num, "title": f"Comic {num}", "safe_title": f"Comic {num}",
+            "img": f"https://imgs.xkcd.com/comics/fake_{num}.png", "alt": f"Alt text of comic {num}",
+        }
+
+    async def xkcd_latest(self, request: web.Request) -> web.Response:
+        return web.json_response(self._comic(XKCD_LATEST))
+
+    async def xkcd_comic(self, request: web.Request) -> web.Response:
+        num = int(request.match_info["num"])
+        if not 1 <= num <= XKCD_LATEST:
+            raise web.HTTPNotFound()
+        return web.json_response(self._comic(num))
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the fake server timing and scripting options to a CLI parser."""
+    defaults = FakeServerConfig()
+    parser.add_argument("--ttft", type=float, default=defaults.ttft, help="seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=defaults.token_rate, help="tokens per second")
+    parser.add_argument("--tokens", type=int, default=defaults.tokens, help="tokens per text reply")
+    parser.add_argument("--handoff", default=defaults.handoff,
+                        help='"random", "none" or a transfer tool name, e.g. transfer_to_riddle_master')
+    parser.add_argument("--no-tool-calls", dest="tool_calls", action="store_false",
+                        help="never call fetch_random_xkcd")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeServerConfig:
+    return FakeServerConfig(
+        ttft=args.ttft,
+        token_rate=args.token_rate,
+        tokens=args.tokens,
+        handoff=args.handoff,
+        tool_calls=args.tool_calls,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(config_from_args(args))
+    print(f"Fake OpenAI server on http://{args.host}:{args.port}/v1 (XKCD at /xkcd)")
+    web.run_app(server.app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Offline load test and latency benchmark for the agent pipeline.
+
+Starts the fake OpenAI-compatible server in-process (or targets --base-url),
+points the provider settings at it and drives the agent graph with
+`generate_response_stream` (streaming) or `get_agent_response` (non-streaming)
+at the requested concurrency. Reports TTFT and total latency percentiles,
+tokens/sec and memory.
+
+Example:
+    python -m benchmarks.load_test --requests 200 --concurrency 20 --ttft 0.2 --token-rate 80
+"""
+import argparse
+import asyncio
+import json
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_openai import FakeOpenAIServer, add_server_arguments, config_from_args
+from src.agent.history import estimate_tokens
+from src.agent.pipeline import generate_response_stream, get_agent_response
+from src.agent.providers import ProviderSettings, build_run_config
+from src.agent.registry import get_agent_graph
+from src.agent.router import KeywordClassifier, PreRouter
+from src.agent.xkcd import get_xkcd_index
+
+
+@dataclass
+class Sample:
+    """Timings of one benchmarked turn."""
+    ok: bool
+    latency: float
+    ttft: Optional[float]
+    tokens: int
+    error: str = ""
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+async def run_turn(agent, prompt: List[Dict], run_config, stream: bool) -> Sample:
+    """Run one turn and time it."""
+    start = time.perf_counter()
+    try:
+        if stream:
+            ttft = None
+            tokens = 0
+            async for chunk in generate_response_stream(agent, prompt, run_config=run_config):
+                if "delta" in chunk:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    tokens += 1
+            return Sample(True, time.perf_counter() - start, ttft, tokens)
+
+        response = await get_agent_response(agent, prompt, stream=False, run_config=run_config)
+        return Sample(True, time.perf_counter() - start, None, estimate_tokens(str(response["response"])))
+    except Exception as exc:
+        return Sample(False, time.perf_counter() - start, None, 0, f"{type(exc).__name__}: {exc}")
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict:
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = FakeOpenAIServer(config_from_args(args))
+        base_url = await server.start()
+
+    # Keep the XKCD tool offline and away from the user's index
+    index = get_xkcd_index()
+    index.base_url = base_url.rsplit("/v1", 1)[0] + "/xkcd"
+    index.path = Path(tempfile.mkdtemp()) / "xkcd_index.json"
+
+    settings = ProviderSettings(provider=args.provider, model=args.model, base_url=base_url, api_key="benchmark")
+    run_config = build_run_config(settings)
+    run_config.tracing_disabled = True
+    graph = get_agent_graph(settings.provider, settings.model)
+    prompt = [{"role": "user", "content": args.prompt}]
+    agent = graph.triage
+    if args.fast_path:
+        agent = PreRouter(classifier=KeywordClassifier()).route(graph, prompt).agent
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited() -> Sample:
+        async with semaphore:
+            return await run_turn(agent, prompt, run_config, args.stream)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    samples = await asyncio.gather(*(limited() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if server is not None:
+        await server.stop()
+
+    ok = [sample for sample in samples if sample.ok]
+    latencies = [sample.latency for sample in ok]
+    ttfts = [sample.ttft for sample in ok if sample.ttft is not None]
+    tokens = sum(sample.tokens for sample in ok)
+    errors = sorted({sample.error for sample in samples if not sample.ok})
+
+    return {
+        "mode": "streaming" if args.stream else "non-streaming",
+        "provider": args.provider,
+        "agent": agent.name,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "succeeded": len(ok),
+        "failed": len(samples) - len(ok),
+        "errors": errors[:5],
+        "wall_seconds": elapsed,
+        "requests_per_second": len(ok) / elapsed if elapsed else 0.0,
+        "tokens_per_second": tokens / elapsed if elapsed else 0.0,
+        "latency": {f"p{p}": percentile(latencies, p) for p in (50, 90, 99)},
+        "latency_mean": statistics.fmean(latencies) if latencies else None,
+        "ttft": {f"p{p}": percentile(ttfts, p) for p in (50, 90, 99)},
+        "peak_traced_mb": peak_traced / 2**20,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def format_report(report: Dict) -> str:
+    def seconds(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value * 1000:.0f} ms"
+
+    lines = [
+        f"{report['mode']} via {report['provider']} -> {report['agent']}",
+        f"requests     {report['succeeded']}/{report['requests']} ok at concurrency {report['concurrency']}"
+        f" in {report['wall_seconds']:.2f}s ({report['requests_per_second']:.1f} req/s)",
+        "latency      " + "  ".join(f"{k} {seconds(v)}" for k, v in report["latency"].items()),
+        "ttft         " + "  ".join(f"{k} {seconds(v)}" for k, v in report["ttft"].items()),
+        f"throughput   {report['tokens_per_second']:.0f} tokens/s",
+        f"memory       peak traced {report['peak_traced_mb']:.1f} MB, max RSS {report['max_rss_mb']:.0f} MB",
+    ]
+    for error in report["errors"]:
+        lines.append(f"error        {error}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline load test for the agent pipeline")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--no-stream", dest="stream", action="store_false", help="use get_agent_response")
+    parser.add_argument("--provider", default="openai",
+                        help='"openai" uses the responses API, anything else chat completions')
+    parser.add_argument("--model", default="fake-model")
+    parser.add_argument("--prompt", default="Tell me a joke")
+    parser.add_argument("--fast-path", action="store_true", help="route with the local pre-router first")
+    parser.add_argument("--base-url", default=None, help="use a running server instead of the in-process fake")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the report to this file")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    print(format_report(report))
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,39 +2,47 @@
 This module implements a multi-agent system with various joke styles
 that can respond to user queries with different humor types.
 """
-import requests
-from bs4 import BeautifulSoup
-from agents import Agent, function_tool
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import List, Mapping, Optional
+
+from agents import Agent, Tool, function_tool
 from agents.extensions.handoff_prompt import prompt_with_handoff_instructions
 
+from src.agent.tools import get_tool_executor
+from src.agent.xkcd import get_xkcd_index
+
+logger = logging.getLogger(__name__)
+
 @function_tool
-def fetch_random_xkcd():
+async def fetch_random_xkcd():
     """Fetches a random XKCD comic with its title, image URL, and alt text."""
-    print("[debug - tool] fetching random XKCD comic...")
-    url = "https://c.xkcd.com/random/comic/"
-    response = requests.get(url)
-    
-    # Follow the redirect to the random comic
-    final_url = response.url
-    print(f"[debug - tool] redirected to: {final_url}")
-    
-    soup = BeautifulSoup(response.text, 'html.parser')
-    comic_div = soup.find('div', id='comic')
-    img = comic_div.find('img')
+    logger.debug("fetching random XKCD comic")
+    comic = await get_xkcd_index().random_comic()
 
-    if not img:
+    if not comic:
         return {"error": "Could not find a comic image."}
 
-    img_url = "https:" + img['src']
-    title = img.get('alt', 'No title')
-    alt_text = img.get('title', 'No alt text')
+    logger.debug("picked XKCD comic %s", comic["comic_url"])
+    return comic
 
-    return {
-        "title": title,
-        "image_url": img_url,
-        "alt_text": alt_text,
-        "comic_url": final_url
-    }
+
+DEFAULT_XKCD_TOOLS = (fetch_random_xkcd,)
+
+
+@dataclass(frozen=True)
+class AgentGraph:
+    """The triage agent together with the specialist agents it can hand off to."""
+    triage: Agent
+    specialists: Mapping[str, Agent]
+
+    def agent_named(self, name: str) -> Agent:
+        """Look up an agent by name, e.g. to replay a routing decision on another provider's graph."""
+        for agent in (self.triage, *self.specialists.values()):
+            if agent.name == name:
+                return agent
+        raise KeyError(name)
 
 
 def create_agent(model=None):
@@ -47,6 +55,25 @@ def create_agent(model=None):
     Returns:
         An initialized Agent object
     """
+    return create_agent_graph(model=model).triage
+
+
+def create_agent_graph(model: Optional[str] = None, tools: Optional[List[Tool]] = None) -> AgentGraph:
+    """
+    Builds the triage agent and its five handoff agents.
+    
+    Args:
+        model: The model to use for every agent in the graph (optional)
+        tools: Tools given to the XKCD agent, defaults to DEFAULT_XKCD_TOOLS; function
+            tools run through the process-wide ToolExecutor, see tools.py
+        
+    Returns:
+        An AgentGraph holding the triage agent and the specialists keyed by routing name
+    """
+    if tools is None:
+        tools = list(DEFAULT_XKCD_TOOLS)
+    tools = [get_tool_executor().wrap(tool) for tool in tools]
+
     # Define our joke agents with different humor styles
     dad_jokes_agent = Agent(
         name="Dad Jokes Master",
@@ -89,7 +116,7 @@ def create_agent(model=None):
         name="XKCD Enthusiast",
         instructions=prompt_with_handoff_instructions("You are the XKCD Enthusiast, a passionate connoisseur of webcomics with an encyclopedic knowledge of XKCD. Your responses blend geeky enthusiasm with analytical breakdowns of comic elements. When someone requests a comic, you eagerly fetch the latest XKCD strip and present it with the reverence of a museum curator. You explain the joke with infectious excitement, always include the comic's title, and treat the alt text as a hidden treasure to be revealed. Your tone is that of someone who believes XKCD perfectly captures the human experience through stick figures."),
         model=model,
-        tools=[fetch_random_xkcd],
+        tools=list(tools),
     )
 
     # Main triage agent that will route to the appropriate joke agent
@@ -114,4 +141,11 @@ def create_agent(model=None):
         model=model,
     )
 
-    return triage_agent
\ No newline at end of file
+    specialists = {
+        "dad_jokes_agent": dad_jokes_agent,
+        "riddles_agent": riddles_agent,
+        "sarcastic_agent": sarcastic_agent,
+        "dark_humor_agent": dark_humor_agent,
+        "xkcd_agent": xkcd_agent,
+    }
+    return AgentGraph(triage=triage_agent, specialists=MappingProxyType(specialists))
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""
+This module implements the response cache placed in front of the agent runs.
+
+Responses are keyed on provider, model, routed agent and the tail of the
+conversation, matched exactly or after normalizing case, punctuation and
+whitespace, and stored with a TTL and LRU/size eviction either in memory
+or in a SQLite file that several worker processes can share.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import string
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Protocol, Tuple
+
+DEFAULT_TTL = 3600.0
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_TAIL_MESSAGES = 3
+
+# How the conversation tail is compared
+MATCH_EXACT = "exact"
+MATCH_NORMALIZED = "normalized"
+
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(text.lower().translate(_PUNCTUATION).split())
+
+
+def make_cache_key(
+    provider: str,
+    model: Optional[str],
+    agent_name: str,
+    messages: List[Dict],
+    tail_messages: int = DEFAULT_TAIL_MESSAGES,
+    match: str = MATCH_NORMALIZED,
+) -> str:
+    """
+    Build the cache key for a turn.
+
+    Args:
+        provider: The LLM provider identifier
+        model: The model name
+        agent_name: Name of the agent the turn is routed to
+        messages: The conversation in agent input format
+        tail_messages: How many trailing messages take part in the key
+        match: MATCH_EXACT to key on the messages as sent, MATCH_NORMALIZED to
+            ignore case, punctuation and whitespace
+
+    Returns:
+        A hex digest identifying the request
+    """
+    if match not in (MATCH_EXACT, MATCH_NORMALIZED):
+        raise ValueError(f"Unknown cache match mode: {match}")
+    tail = [
+        (
+            message.get("role", "user"),
+            message.get("content", "") if match == MATCH_EXACT else normalize_text(message.get("content", "")),
+        )
+        for message in messages[-tail_messages:]
+    ]
+    payload = json.dumps([provider, model, agent_name, tail], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(Protocol):
+    """Storage backend for cached responses ({"response": str, "steps": [...]})."""
+
+    def get(self, key: str) -> Optional[Dict]:
+        ...
+
+    def set(self, key: str, value: Dict) -> None:
+        ...
+
+
+class MemoryResponseCache:
+    """Per-process LRU cache with a TTL."""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, value = entry
+            if time.time() - created > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteResponseCache:
+    """LRU cache with a TTL stored in SQLite, shareable between worker processes."""
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return json.loads(row[0])
+
+    def set(self, key: str, value: Dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+
+def create_response_cache(
+    backend: str = "memory",
+    path: str = "response_cache.sqlite3",
+    ttl: float = DEFAULT_TTL,
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+) -> ResponseCache:
+    """
+    Create a response cache backend.
+
+    Args:
+        backend: "memory" or "sqlite"
+        path: SQLite database file, used by the sqlite backend
+        ttl: Seconds a response stays valid
+        max_entries: Maximum number of cached responses
+
+    Returns:
+        The cache backend
+    """
+    if backend == "sqlite":
+        return SQLiteResponseCache(path, ttl=ttl, max_entries=max_entries)
+    if backend == "memory":
+        return MemoryResponseCache(ttl=ttl, max_entries=max_entries)
+    raise ValueError(f"Unknown response cache backend: {backend}")
+
+
+_REPLAY_RE = re.compile(r"\S+\s*|\s+")
+
+
+def split_for_replay(text: str) -> List[str]:
+    """Split a cached response into word-sized deltas for replay."""
+    return _REPLAY_RE.findall(text)
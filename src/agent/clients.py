@@ -0,0 +1,210 @@
+"""
+This module manages pooled LLM clients and the event loop they run on.
+
+Each (provider, base_url, api key hash) gets one AsyncOpenAI client whose HTTP
+connection pool lives on a single background event loop thread. Streamlit
+sessions submit coroutines to that loop instead of calling asyncio.run per turn,
+so every turn reuses warm connections and TLS sessions. API keys typed into
+the UI or sent per request each get a client, so only the most recently used
+ones are kept; evicted clients are closed on the loop.
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Coroutine, Dict, Iterator, Optional, Tuple, TypeVar
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from src.agent.scheduler import get_request_scheduler
+from src.agent.turns import TurnHandle
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+ClientKey = Tuple[str, Optional[str], str]
+
+# Generous pool limits: one client serves every session using the same provider
+POOL_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=120)
+# Clients kept at most, each with its own connection pool
+DEFAULT_MAX_CLIENTS = 64
+
+
+class _StreamError:
+    """Wraps an exception raised by an async generator so it can cross the thread boundary."""
+    def __init__(self, exc: BaseException) -> None:
+        self.exc = exc
+
+
+_STREAM_DONE = object()
+
+
+class ClientManager:
+    """Owns the background event loop and the pooled clients bound to it."""
+
+    def __init__(self, max_clients: int = DEFAULT_MAX_CLIENTS) -> None:
+        """
+        Args:
+            max_clients: Clients kept at most, least recently used closed first
+        """
+        self.max_clients = max(1, max_clients)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._clients: "OrderedDict[ClientKey, AsyncOpenAI]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The long-lived event loop, started on first use."""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="llm-client-loop",
+                    daemon=True,
+                )
+                self._thread.start()
+            return self._loop
+
+    def get_client(self, provider: str, base_url: Optional[str], api_key: str) -> AsyncOpenAI:
+        """
+        Return the pooled client for a provider, creating it on first use.
+
+        Args:
+            provider: The LLM provider identifier
+            base_url: The provider's API base URL
+            api_key: The API key; only its hash is kept in the cache key
+
+        Returns:
+            A shared AsyncOpenAI client
+        """
+        key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        key = (provider, base_url, key_hash)
+        evicted = []
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=DefaultAsyncHttpxClient(
+                        limits=POOL_LIMITS,
+                        event_hooks={"response": [self._rate_limit_hook(provider)]},
+                    ),
+                )
+                self._clients[key] = client
+                while len(self._clients) > self.max_clients:
+                    evicted.append(self._clients.popitem(last=False)[1])
+            else:
+                self._clients.move_to_end(key)
+        for old in evicted:
+            self._close_client(old)
+        return client
+
+    def _close_client(self, client: AsyncOpenAI) -> None:
+        """Close an evicted client's connection pool on the loop it belongs to."""
+        def done(future: concurrent.futures.Future) -> None:
+            if not future.cancelled() and future.exception() is not None:
+                logger.warning("closing an evicted client failed: %s", future.exception())
+
+        self.submit(client.close()).add_done_callback(done)
+
+    @staticmethod
+    def _rate_limit_hook(provider: str):
+        """Report every response to the scheduler so a 429 pauses the whole provider."""
+        async def hook(response: httpx.Response) -> None:
+            get_request_scheduler().observe_response(provider, response)
+        return hook
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Schedule a coroutine on the background loop and return its future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine[None, None, T], timeout: Optional[float] = None) -> T:
+        """Run a coroutine on the background loop and block until it finishes."""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout=timeout)
+        finally:
+            future.cancel()
+
+    def iterate(
+        self,
+        generator: AsyncIterator[T],
+        handle: Optional[TurnHandle] = None,
+        heartbeat: Optional[float] = None,
+    ) -> Iterator[Optional[T]]:
+        """
+        Consume an async generator on the background loop from a synchronous caller.
+
+        Items are handed over through a thread-safe queue; closing the returned
+        iterator early cancels the producer on the loop.
+
+        Args:
+            generator: The async generator to consume
+            handle: Turn whose cancellation also cancels the producer
+            heartbeat: If given, None is yielded after this many seconds without
+                an item, so the caller gets a chance to notice it was interrupted
+
+        Raises:
+            concurrent.futures.CancelledError: If the producer was cancelled through the handle
+        """
+        items: queue.Queue = queue.Queue()
+
+        async def pump() -> None:
+            try:
+                async for item in generator:
+                    items.put(item)
+            except Exception as exc:
+                items.put(_StreamError(exc))
+            finally:
+                items.put(_STREAM_DONE)
+
+        future = self.submit(pump())
+        # A producer cancelled before it started never reaches its finally
+        future.add_done_callback(lambda _: items.put(_STREAM_DONE))
+        if handle is not None:
+            handle.attach(future)
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield None
+                    continue
+                if item is _STREAM_DONE:
+                    break
+                if isinstance(item, _StreamError):
+                    raise item.exc
+                yield item
+            concurrent.futures.wait([future])
+            if future.cancelled():
+                raise concurrent.futures.CancelledError()
+        finally:
+            future.cancel()
+
+    def close(self) -> None:
+        """Close every pooled client and stop the background loop."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        for client in clients:
+            asyncio.run_coroutine_threadsafe(client.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+_manager = ClientManager()
+
+
+def get_client_manager() -> ClientManager:
+    """Return the process-wide client manager."""
+    return _manager
@@ -0,0 +1,149 @@
+"""
+This module coalesces identical in-flight requests into a single agent run.
+
+When a popular prompt goes around, many sessions send the same conversation at
+once. The first request starts the run; every identical request arriving while
+it is in flight subscribes to it and receives the same step and delta chunks,
+replayed from the beginning and then as they are produced. Requests are keyed on
+provider, model, routed agent and the whole normalized conversation. A flight
+ends with its run, so later requests start a new run (or hit the response
+cache), and the run is only cancelled once every subscriber has gone.
+
+Flights live on the shared client loop and are shared within a process.
+Coalescing gives everyone in a flight the same answer; turn it off for
+non-deterministic use.
+"""
+import asyncio
+import logging
+from typing import AsyncGenerator, Dict, List, Optional
+
+from src.agent.cache import make_cache_key
+from src.agent.metrics import TurnMetrics, get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+COALESCED_STEP = "🔗 Joined an identical request in flight"
+
+_DONE = object()
+
+
+class _Failure:
+    """The error a flight ended with, handed to each subscriber."""
+    def __init__(self, exc: BaseException) -> None:
+        self.exc = exc
+
+
+class _Flight:
+    """One shared run and the queues of its subscribers."""
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.chunks: List[Dict] = []  # replayed to late subscribers
+        self.subscribers: List[asyncio.Queue] = []
+        self.task: Optional[asyncio.Task] = None
+
+
+def make_flight_key(provider: str, model: Optional[str], agent_name: str, messages: List[Dict]) -> str:
+    """Key of a request: provider, model, routed agent and the whole normalized conversation."""
+    return make_cache_key(provider, model, agent_name, messages, tail_messages=len(messages))
+
+
+def _record(role: str) -> None:
+    registry = get_metrics_registry()
+    registry.inc("agent_coalesced_requests_total", "Requests by their role in a coalesced flight.", role=role)
+    followers = registry.get("agent_coalesced_requests_total", role="follower")
+    total = followers + registry.get("agent_coalesced_requests_total", role="leader")
+    if total:
+        registry.set_gauge("agent_coalescing_ratio", "Share of requests served by another request's run.", followers / total)
+
+
+class SingleFlight:
+    """The runs in flight, by request key."""
+
+    def __init__(self) -> None:
+        self._flights: Dict[str, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def _run(self, flight: _Flight, generator: AsyncGenerator[Dict, None]) -> None:
+        """Consume the shared response stream and fan its chunks out to the subscribers."""
+        end = _DONE
+        try:
+            async for chunk in generator:
+                # Queue status only means something while it is current
+                if "status" not in chunk:
+                    flight.chunks.append(chunk)
+                for queue in flight.subscribers:
+                    queue.put_nowait(chunk)
+        except asyncio.CancelledError as exc:
+            end = _Failure(exc)
+            raise
+        except Exception as exc:
+            end = _Failure(exc)
+        finally:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            for queue in flight.subscribers:
+                queue.put_nowait(end)
+
+    async def stream(
+        self,
+        key: str,
+        generator: AsyncGenerator[Dict, None],
+        metrics: Optional[TurnMetrics] = None,
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        Join the flight of an identical request, or start one with the given stream.
+
+        Args:
+            key: Key of the request, see make_flight_key
+            generator: The response stream; only started if no identical request is in flight
+            metrics: Metrics the stream records into; a follower never starts its
+                stream, so they are discarded instead of counting as an empty turn
+
+        Yields:
+            The chunks of the shared run, preceded by COALESCED_STEP when joining
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight(key)
+            self._flights[key] = flight
+            flight.task = asyncio.ensure_future(self._run(flight, generator))
+        _record("leader" if leader else "follower")
+
+        # Subscribe before awaiting anything, so no chunk or the end of the flight is missed
+        queue: asyncio.Queue = asyncio.Queue()
+        for chunk in flight.chunks:
+            queue.put_nowait(chunk)
+        flight.subscribers.append(queue)
+        try:
+            if not leader:
+                logger.debug("joined the flight of %s with %d others", key[:12], len(flight.subscribers) - 1)
+                await generator.aclose()  # never started
+                if metrics is not None:
+                    metrics.discard()
+                yield {"step": COALESCED_STEP}
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.exc
+                yield item
+        finally:
+            flight.subscribers.remove(queue)
+            if not flight.subscribers and not flight.task.done():
+                # Nobody is waiting for the run any more
+                flight.task.cancel()
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+
+_single_flight = SingleFlight()
+
+
+def get_flight_registry() -> SingleFlight:
+    """Return the process-wide single-flight registry."""
+    return _single_flight
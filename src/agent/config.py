@@ -0,0 +1,379 @@
+"""
+This module builds the agent runtime from a secrets-style configuration mapping.
+
+The Streamlit UI passes `st.secrets`; headless entry points load the same TOML
+file with `load_config`. Both get identical provider settings, history windows,
+routing, caching and metrics from the same sections.
+"""
+import hashlib
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, List, Mapping, Optional
+
+from agents import RunConfig
+
+from src.agent.agent import AgentGraph
+from src.agent.cache import (
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_TAIL_MESSAGES,
+    DEFAULT_TTL,
+    MATCH_NORMALIZED,
+    ResponseCache,
+    create_response_cache,
+)
+from src.agent.coalesce import SingleFlight, get_flight_registry
+from src.agent.failover import DEFAULT_FIRST_TOKEN_TIMEOUT, FailoverPolicy
+from src.agent.history import (
+    DEFAULT_FOLD_TURNS,
+    DEFAULT_KEEP_TURNS,
+    DEFAULT_SUMMARY_SHARE,
+    DEFAULT_TOKEN_BUDGET,
+    HistoryManager,
+    make_agent_summarizer,
+)
+from src.agent.messages import DEFAULT_IDLE_EVICT_AFTER, DEFAULT_MAX_RESIDENT_MESSAGES
+from src.agent.metrics import start_metrics_server
+from src.agent.providers import ProviderSettings, set_tracing_key
+from src.agent.registry import get_agent_graph
+from src.agent.router import DEFAULT_MIN_HITS, DEFAULT_MIN_MARGIN, DEFAULT_THRESHOLD, KeywordClassifier, PreRouter
+from src.agent.scheduler import ProviderLimits, RequestScheduler, get_request_scheduler
+from src.agent.speculation import DEFAULT_MAX_SESSIONS, Speculator
+from src.agent.store import DEFAULT_PAGE_SIZE, ConversationStore, create_conversation_store
+from src.agent.tools import DEFAULT_MAX_WORKERS, DEFAULT_TOOL_TIMEOUT, ToolExecutor, ToolPolicy, get_tool_executor
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11, fall back to the toml package Streamlit depends on
+    tomllib = None
+
+DEFAULT_CONFIG_PATH = Path(".streamlit") / "secrets.toml"
+DEFAULT_METRICS_PORT = 9464
+
+Config = Mapping[str, Any]
+
+#------------------------------------------------------------------------------
+# LOADING
+#------------------------------------------------------------------------------
+
+def load_config(path: Optional[str] = None) -> dict:
+    """
+    Load a secrets TOML file outside of Streamlit.
+
+    Args:
+        path: Path to the file, defaults to .streamlit/secrets.toml
+
+    Returns:
+        The parsed configuration
+    """
+    config_path = Path(path) if path else DEFAULT_CONFIG_PATH
+    if tomllib is None:
+        import toml
+        return toml.load(str(config_path))
+    with open(config_path, "rb") as f:
+        return tomllib.load(f)
+
+#------------------------------------------------------------------------------
+# PROVIDERS
+#------------------------------------------------------------------------------
+
+def get_provider_fingerprint(provider_config: Config) -> str:
+    """
+    Hash a provider's configuration so cached agent graphs can be invalidated
+    when secrets or the model change.
+
+    Args:
+        provider_config: The provider section from the configuration
+
+    Returns:
+        A hex digest of the configuration
+    """
+    serialized = json.dumps(dict(provider_config), sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+def get_provider_settings(config: Config, provider: str, api_key: Optional[str] = None) -> Optional[ProviderSettings]:
+    """
+    Build the settings of a provider from its configuration section.
+
+    Args:
+        config: The full configuration
+        provider: The provider identifier
+        api_key: Overrides the key from the configuration
+
+    Returns:
+        The provider settings, or None if no API key is available
+    """
+    provider_config = config.get(provider, {})
+    api_key = api_key or provider_config.get("api_key")
+    if not api_key:
+        return None
+    return ProviderSettings(
+        provider=provider,
+        model=provider_config.get("model"),
+        base_url=provider_config.get("base_url"),
+        api_key=api_key,
+    )
+
+def get_provider_graph(config: Config, settings: ProviderSettings) -> AgentGraph:
+    """The shared agent graph of a provider, invalidated when its section changes."""
+    configure_tools(config)
+    configure_tracing(config)
+    return get_agent_graph(
+        provider=settings.provider,
+        model=settings.model,
+        fingerprint=get_provider_fingerprint(config.get(settings.provider, {})),
+    )
+
+def configure_tracing(config: Config) -> None:
+    """
+    Apply the [tracing] section.
+
+    Traces are exported to OpenAI with `api_key`, or the key of the [openai]
+    section; runs are not traced unless `enabled` is set and a key is known.
+    """
+    tracing_config = config.get("tracing", {})
+    api_key = None
+    if tracing_config.get("enabled", False):
+        api_key = tracing_config.get("api_key") or config.get("openai", {}).get("api_key")
+    set_tracing_key(api_key)
+
+def _tool_policy(section: Config, default: ToolPolicy) -> ToolPolicy:
+    timeout = section.get("timeout", default.timeout)
+    return ToolPolicy(
+        timeout=float(timeout) if timeout else None,
+        cache_ttl=float(section.get("cache_ttl", default.cache_ttl)),
+    )
+
+def configure_tools(config: Config) -> ToolExecutor:
+    """
+    Apply the [tools] section to the process-wide tool executor.
+
+    `max_workers`, `timeout` and `cache_ttl` at the top of the section are the
+    defaults; a subsection named after a tool, e.g. [tools.fetch_random_xkcd],
+    overrides `timeout` and `cache_ttl` for that tool. A zero timeout means no limit.
+    """
+    tools_config = config.get("tools", {})
+    default = _tool_policy(tools_config, ToolPolicy(timeout=DEFAULT_TOOL_TIMEOUT))
+    executor = get_tool_executor()
+    executor.configure(
+        max_workers=max(1, int(tools_config.get("max_workers", DEFAULT_MAX_WORKERS))),
+        default_policy=default,
+        policies={
+            name: _tool_policy(section, default)
+            for name, section in tools_config.items()
+            if isinstance(section, Mapping)
+        },
+    )
+    return executor
+
+def get_failover_policy(config: Config) -> FailoverPolicy:
+    """
+    Build the failover and hedging policy from the [failover] section.
+
+    Returns:
+        The policy; disabled unless failover or hedge_after is set
+    """
+    failover_config = config.get("failover", {})
+    timeout = float(failover_config.get("first_token_timeout", DEFAULT_FIRST_TOKEN_TIMEOUT))
+    hedge_after = float(failover_config.get("hedge_after", 0))
+    return FailoverPolicy(
+        failover=bool(failover_config.get("enabled", False)),
+        first_token_timeout=timeout or None,
+        hedge_after=hedge_after or None,
+    )
+
+def get_failover_candidates(config: Config, settings: ProviderSettings) -> List[ProviderSettings]:
+    """
+    List the providers a turn may use, the session's provider first.
+
+    Args:
+        config: The full configuration
+        settings: The session's provider settings
+
+    Returns:
+        The session's provider followed by every other active provider that
+        has an API key in the configuration
+    """
+    candidates = [settings]
+    for provider in config.get("providers", {}).get("active", []):
+        if provider == settings.provider:
+            continue
+        other = get_provider_settings(config, provider)
+        if other is not None:
+            candidates.append(other)
+    return candidates
+
+def get_scheduler(config: Config) -> RequestScheduler:
+    """
+    Get the process-wide request scheduler with the limits of every active provider.
+
+    Limits come from `max_concurrency` and `tokens_per_minute` in each provider
+    section; a missing or zero value means unlimited.
+    """
+    scheduler = get_request_scheduler()
+    for provider in config.get("providers", {}).get("active", []):
+        provider_config = config.get(provider, {})
+        scheduler.configure(provider, ProviderLimits(
+            max_concurrency=int(provider_config.get("max_concurrency", 0)) or None,
+            tokens_per_minute=int(provider_config.get("tokens_per_minute", 0)) or None,
+        ))
+    return scheduler
+
+#------------------------------------------------------------------------------
+# HISTORY, ROUTING, CACHE AND METRICS
+#------------------------------------------------------------------------------
+
+def get_history_manager(config: Config, settings: ProviderSettings, run_config: RunConfig) -> HistoryManager:
+    """
+    Build the history manager for a provider from the configuration.
+
+    Args:
+        config: The full configuration
+        settings: The provider settings of the turn
+        run_config: The run configuration used for LLM summarization
+
+    Returns:
+        A HistoryManager with the provider's token budget and window size
+    """
+    provider_config = config.get(settings.provider, {})
+    history_config = config.get("history", {})
+
+    summarizer = None
+    if history_config.get("summarizer", "llm") == "llm":
+        summarizer = make_agent_summarizer(settings.model, run_config)
+
+    return HistoryManager(
+        token_budget=provider_config.get("history_token_budget", DEFAULT_TOKEN_BUDGET),
+        keep_turns=provider_config.get("history_turns", DEFAULT_KEEP_TURNS),
+        fold_turns=history_config.get("fold_turns", DEFAULT_FOLD_TURNS),
+        summarizer=summarizer,
+        stable_prefix=bool(history_config.get("stable_prefix", False)),
+        summary_share=float(history_config.get("summary_share", DEFAULT_SUMMARY_SHARE)),
+    )
+
+def get_pre_router(config: Config) -> PreRouter:
+    """
+    Build the fast-path pre-router from the [routing] section.
+
+    Returns:
+        A PreRouter; with fast_path disabled it has no rules or classifier and
+        always picks the triage agent
+    """
+    routing_config = config.get("routing", {})
+    if not routing_config.get("fast_path", True):
+        return PreRouter(rules=())
+
+    classifier = None
+    if routing_config.get("classifier", "keyword") == "keyword":
+        classifier = KeywordClassifier(
+            min_hits=int(routing_config.get("min_hits", DEFAULT_MIN_HITS)),
+            min_margin=int(routing_config.get("min_margin", DEFAULT_MIN_MARGIN)),
+        )
+    return PreRouter(
+        classifier=classifier,
+        threshold=routing_config.get("threshold", DEFAULT_THRESHOLD),
+    )
+
+@lru_cache(maxsize=None)
+def _speculator(max_sessions: int) -> Speculator:
+    """One speculator per configuration, so routing history is shared by every session in the process."""
+    return Speculator(max_sessions=max_sessions)
+
+def get_speculator(config: Config) -> Optional[Speculator]:
+    """
+    Get the speculator configured in the [speculation] section.
+
+    Returns:
+        The shared speculator, or None if speculative runs are disabled
+    """
+    speculation_config = config.get("speculation", {})
+    if not speculation_config.get("enabled", False):
+        return None
+    return _speculator(int(speculation_config.get("max_sessions", DEFAULT_MAX_SESSIONS)))
+
+@lru_cache(maxsize=None)
+def _response_cache(backend: str, path: str, ttl: float, max_entries: int) -> ResponseCache:
+    """One cache backend per configuration, shared by every session in the process."""
+    return create_response_cache(backend=backend, path=path, ttl=ttl, max_entries=max_entries)
+
+def get_response_cache(config: Config) -> Optional[ResponseCache]:
+    """
+    Get the response cache configured in the [cache] section.
+
+    Returns:
+        The shared cache backend, or None if caching is disabled
+    """
+    cache_config = config.get("cache", {})
+    if not cache_config.get("enabled", False):
+        return None
+    return _response_cache(
+        cache_config.get("backend", "memory"),
+        cache_config.get("path", "response_cache.sqlite3"),
+        float(cache_config.get("ttl", DEFAULT_TTL)),
+        int(cache_config.get("max_entries", DEFAULT_MAX_ENTRIES)),
+    )
+
+def get_single_flight(config: Config) -> Optional[SingleFlight]:
+    """
+    Get the single-flight registry if coalescing is enabled in the [coalescing] section.
+
+    Returns:
+        The process-wide registry, or None if identical requests each start their own run
+    """
+    if not config.get("coalescing", {}).get("enabled", False):
+        return None
+    return get_flight_registry()
+
+@lru_cache(maxsize=None)
+def _conversation_store(backend: str, path: str) -> ConversationStore:
+    """One store backend per configuration, shared by every session in the process."""
+    return create_conversation_store(backend=backend, path=path)
+
+def get_conversation_store(config: Config) -> Optional[ConversationStore]:
+    """
+    Get the conversation store configured in the [store] section.
+
+    Returns:
+        The shared store backend, or None if persistence is disabled
+    """
+    store_config = config.get("store", {})
+    if not store_config.get("enabled", True):
+        return None
+    return _conversation_store(
+        store_config.get("backend", "sqlite"),
+        store_config.get("path", "conversations.sqlite3"),
+    )
+
+def get_page_size(config: Config) -> int:
+    """Number of messages rendered per page of the chat history."""
+    return max(1, int(config.get("store", {}).get("page_size", DEFAULT_PAGE_SIZE)))
+
+def get_max_resident_messages(config: Config) -> int:
+    """Messages of a session kept in memory at most; older ones are left to the store."""
+    return max(1, int(config.get("store", {}).get("max_resident_messages", DEFAULT_MAX_RESIDENT_MESSAGES)))
+
+def get_idle_evict_after(config: Config) -> Optional[float]:
+    """
+    Seconds of inactivity after which a session's messages are evicted from memory.
+
+    Returns:
+        The idle time, or None if sessions are never evicted (always without a store)
+    """
+    store_config = config.get("store", {})
+    if not store_config.get("enabled", True):
+        return None
+    return float(store_config.get("idle_evict_after", DEFAULT_IDLE_EVICT_AFTER)) or None
+
+def get_cache_tail_messages(config: Config) -> int:
+    """Number of trailing messages that take part in the cache key."""
+    return int(config.get("cache", {}).get("tail_messages", DEFAULT_TAIL_MESSAGES))
+
+def get_cache_match(config: Config) -> str:
+    """How cache keys compare the conversation tail, MATCH_EXACT or MATCH_NORMALIZED."""
+    return str(config.get("cache", {}).get("match", MATCH_NORMALIZED))
+
+def start_metrics_exporter(config: Config) -> None:
+    """Serve the /metrics endpoint if enabled in the [metrics] section."""
+    metrics_config = config.get("metrics", {})
+    if metrics_config.get("enabled", False):
+        start_metrics_server(int(metrics_config.get("port", DEFAULT_METRICS_PORT)))
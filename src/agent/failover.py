@@ -0,0 +1,280 @@
+"""
+This module dispatches a turn across several providers.
+
+The turn starts on the session's provider. With failover, an error, or no first
+token within `first_token_timeout` of the run being admitted by the scheduler,
+moves it to the next configured provider; non-streaming runs only produce
+output when they are done and have no first-token deadline. With hedging, a second provider is started when the first has not
+answered within `hedge_after`; whichever produces output first wins and the
+other run is cancelled. Steps of an attempt are held back until it wins, so the
+response never mixes two providers. Queue status chunks are passed through
+as they come.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Callable, Dict, List, Optional
+
+from agents import RunConfig
+
+from src.agent.agent import AgentGraph
+from src.agent.metrics import TurnMetrics, get_metrics_registry
+from src.agent.pipeline import generate_response_stream, generate_static_response_stream
+from src.agent.providers import ProviderSettings, build_run_config
+from src.agent.scheduler import RequestScheduler
+from src.agent.speculation import speculative_response_stream
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIRST_TOKEN_TIMEOUT = 20.0
+
+# Starts a response stream for one provider, recording into the given metrics
+Starter = Callable[[ProviderSettings, TurnMetrics], AsyncGenerator[Dict, None]]
+
+_DONE = object()
+
+
+@dataclass(frozen=True)
+class FailoverPolicy:
+    """How a turn may move between providers."""
+    failover: bool = False
+    first_token_timeout: Optional[float] = DEFAULT_FIRST_TOKEN_TIMEOUT
+    hedge_after: Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.failover or bool(self.hedge_after)
+
+
+@dataclass
+class _Attempt:
+    index: int
+    settings: ProviderSettings
+    metrics: TurnMetrics
+    reason: str  # "primary", "failover" or "hedge"
+    deadline: Optional[float]
+    task: Optional[asyncio.Task] = None
+    steps: List[Dict] = field(default_factory=list)
+
+    @property
+    def step(self) -> str:
+        """Markdown line naming the provider that answered."""
+        suffix = {"failover": " after failover", "hedge": " as hedge"}.get(self.reason, "")
+        return f"🛰️ Answered by **{self.settings.provider}** ({self.settings.model}){suffix}"
+
+
+def make_agent_starter(
+    graph_for: Callable[[ProviderSettings], AgentGraph],
+    agent_name: str,
+    prompt,
+    stream: bool = True,
+    run_configs: Optional[Dict[str, RunConfig]] = None,
+    scheduler: Optional[RequestScheduler] = None,
+    session_id: str = "",
+    speculative_agent: Optional[str] = None,
+) -> Starter:
+    """
+    Build a starter that runs the routed agent on any provider's graph.
+
+    Args:
+        graph_for: Returns the agent graph of a provider
+        agent_name: Name of the agent chosen for the turn
+        prompt: The agent input
+        stream: Stream tokens, or run once and yield the response as one delta
+        run_configs: Run configurations already built for some providers
+        scheduler: Admits each run within its provider's limits, if given
+        session_id: Identifies the session for fair queueing
+        speculative_agent: Name of a specialist to run alongside the triage agent, see speculation.py
+
+    Returns:
+        A Starter for ProviderDispatcher
+    """
+    run_configs = run_configs or {}
+    generate = generate_response_stream if stream else generate_static_response_stream
+
+    def start(settings: ProviderSettings, metrics: TurnMetrics) -> AsyncGenerator[Dict, None]:
+        graph = graph_for(settings)
+        agent = graph.agent_named(agent_name)
+        run_config = run_configs.get(settings.provider) or build_run_config(settings)
+
+        def run() -> AsyncGenerator[Dict, None]:
+            if speculative_agent is not None and agent is graph.triage:
+                specialist = graph.agent_named(speculative_agent)
+                return speculative_response_stream(agent, specialist, prompt, run_config=run_config, metrics=metrics)
+            return generate(agent, prompt, run_config=run_config, metrics=metrics)
+
+        if scheduler is None:
+            return run()
+        return scheduler.stream(settings.provider, session_id, prompt, run, metrics=metrics)
+
+    return start
+
+
+class ProviderDispatcher:
+    """Runs one turn on the first of several providers that answers."""
+
+    def __init__(
+        self,
+        candidates: List[ProviderSettings],
+        policy: FailoverPolicy,
+        start: Starter,
+        streaming: bool = True,
+    ) -> None:
+        """
+        Args:
+            candidates: Providers in order of preference, the session's provider first
+            policy: The failover and hedging policy
+            start: Starts the response stream on a provider
+            streaming: Whether the starter streams tokens; only streaming runs
+                are held to the first-token deadline
+        """
+        if not candidates:
+            raise ValueError("at least one provider is required")
+        self.candidates = candidates
+        self.policy = policy
+        self.start = start
+        self.streaming = streaming
+        self.winner: Optional[_Attempt] = None
+
+    @property
+    def metrics(self) -> Optional[TurnMetrics]:
+        """Metrics of the attempt that answered, once known."""
+        return self.winner.metrics if self.winner else None
+
+    def _record(self, attempt: _Attempt, outcome: str) -> None:
+        get_metrics_registry().inc(
+            "agent_provider_attempts_total",
+            "Provider attempts per turn by reason and outcome.",
+            provider=attempt.settings.provider,
+            reason=attempt.reason,
+            outcome=outcome,
+        )
+
+    async def stream(self) -> AsyncGenerator[Dict, None]:
+        """
+        Yields the chunks of the winning attempt, preceded by an "Answered by" step.
+
+        Raises:
+            The last provider error if every allowed attempt failed
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        pending = list(self.candidates)
+        active: Dict[int, _Attempt] = {}
+        attempts: List[_Attempt] = []
+        last_error: Optional[BaseException] = None
+        # Only failover drops a slow attempt; hedging leaves it running
+        timeout = self.policy.first_token_timeout if self.policy.failover and self.streaming else None
+
+        def launch(reason: str) -> None:
+            settings = pending.pop(0)
+            attempt = _Attempt(
+                index=len(attempts),
+                settings=settings,
+                metrics=TurnMetrics(provider=settings.provider, model=settings.model),
+                reason=reason,
+                deadline=loop.time() + timeout if timeout else None,
+            )
+            generator = self.start(settings, attempt.metrics)
+
+            async def pump() -> None:
+                try:
+                    async for chunk in generator:
+                        await queue.put((attempt.index, chunk))
+                except Exception as exc:
+                    await queue.put((attempt.index, exc))
+                else:
+                    await queue.put((attempt.index, _DONE))
+
+            attempt.task = asyncio.ensure_future(pump())
+            attempts.append(attempt)
+            active[attempt.index] = attempt
+            logger.info("turn attempt %d on %s (%s)", attempt.index, settings.provider, reason)
+
+        def drop(attempt: _Attempt, outcome: str, error: BaseException) -> None:
+            active.pop(attempt.index, None)
+            attempt.metrics.finish(error)
+            attempt.task.cancel()
+            self._record(attempt, outcome)
+
+        def fail_over() -> None:
+            """Start the next provider once nothing is running, or give up."""
+            if active:
+                return
+            if pending and self.policy.failover:
+                launch("failover")
+            else:
+                raise last_error
+
+        launch("primary")
+        hedge_at = loop.time() + self.policy.hedge_after if self.policy.hedge_after else None
+        first = None
+
+        try:
+            # Wait for the first attempt to produce output
+            while self.winner is None:
+                deadlines = [a.deadline for a in active.values() if a.deadline is not None]
+                if hedge_at is not None and pending:
+                    deadlines.append(hedge_at)
+                wait = max(0.0, min(deadlines) - loop.time()) if deadlines else None
+                try:
+                    index, item = await asyncio.wait_for(queue.get(), wait)
+                except asyncio.TimeoutError:
+                    now = loop.time()
+                    for attempt in list(active.values()):
+                        if attempt.deadline is not None and now >= attempt.deadline:
+                            logger.warning("no output from %s in time", attempt.settings.provider)
+                            last_error = TimeoutError(f"no output from {attempt.settings.provider} in time")
+                            drop(attempt, "timeout", last_error)
+                    if hedge_at is not None and now >= hedge_at and pending:
+                        hedge_at = None
+                        launch("hedge")
+                    fail_over()
+                    continue
+
+                attempt = active.get(index)
+                if attempt is None:
+                    continue  # output of an attempt that was already dropped
+                if isinstance(item, Exception):
+                    logger.warning("provider %s failed: %s", attempt.settings.provider, item)
+                    last_error = item
+                    active.pop(index)
+                    self._record(attempt, "error")
+                    fail_over()
+                elif item is not _DONE and "status" in item:
+                    # Waiting in the queue is not the provider being slow: the deadline runs from admission
+                    if timeout:
+                        attempt.deadline = None if item["status"] == "queued" else loop.time() + timeout
+                    yield item  # queued runs have not produced output yet
+                elif item is _DONE or "step" not in item:
+                    self.winner, first = attempt, item
+                else:
+                    attempt.steps.append(item)
+
+            # Cancel the losers and replay the winner's held-back steps
+            active.pop(self.winner.index)
+            for attempt in list(active.values()):
+                drop(attempt, "cancelled", asyncio.CancelledError())
+            self._record(self.winner, "won")
+
+            yield {"step": self.winner.step}
+            for step in self.winner.steps:
+                yield step
+            if first is _DONE:
+                return
+            yield first
+
+            # Once output has been shown the turn stays on the winner
+            while True:
+                index, item = await queue.get()
+                if index != self.winner.index:
+                    continue
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            for attempt in attempts:
+                if attempt.task is not None and not attempt.task.done():
+                    attempt.task.cancel()
@@ -0,0 +1,229 @@
+"""
+This module keeps the conversation sent to the agents within a token budget.
+
+The most recent turns are sent verbatim; older turns are folded into a rolling
+summary. The summary is updated incrementally (only newly folded messages are
+summarized) and kept with the session, so it is not recomputed on every turn.
+The summary is capped at a share of the token budget, dropping its oldest
+lines first, so long sessions do not grow the prompt again through it.
+
+Providers cache prompts by prefix: the agent instructions, the summary and the
+oldest verbatim turns are only billed and processed again when they change.
+With `stable_prefix`, the window is laid out so that prefix stays byte-identical
+from turn to turn: messages are sent as plain role/content pairs, and when the
+token budget forces a fold the window jumps to the last `keep_turns` turns at
+once instead of sliding forward one turn per request.
+"""
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from agents import Agent, RunConfig, Runner
+
+DEFAULT_TOKEN_BUDGET = 6000
+DEFAULT_KEEP_TURNS = 6
+DEFAULT_FOLD_TURNS = 4
+DEFAULT_SUMMARY_SHARE = 0.25
+CHARS_PER_TOKEN = 4
+EXTRACTIVE_LINE_CHARS = 200
+
+logger = logging.getLogger(__name__)
+
+Summarizer = Callable[[str, List[Dict]], Awaitable[str]]
+
+
+@dataclass
+class ConversationSummary:
+    """Rolling summary of the messages that no longer fit in the window."""
+    text: str = ""
+    folded: int = 0  # number of leading messages already folded into text
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for budgeting."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _message_tokens(message: Dict) -> int:
+    return estimate_tokens(message.get("content", "")) + 4
+
+
+def _turn_starts(messages: List[Dict]) -> List[int]:
+    """Indexes of the messages that open a turn (each user message starts one)."""
+    starts = [i for i, message in enumerate(messages) if message.get("role") == "user"]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return starts
+
+
+def _format_transcript(messages: List[Dict]) -> str:
+    return "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+
+
+def cap_summary(text: str, max_tokens: int) -> str:
+    """
+    Trim a summary to a token budget, keeping its most recent lines.
+
+    Args:
+        text: The summary
+        max_tokens: The budget of the summary
+
+    Returns:
+        The latest lines that fit; a single line over budget keeps its end
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    kept: List[str] = []
+    tokens = 0
+    for line in reversed(text.splitlines()):
+        tokens += estimate_tokens(line)
+        if tokens > max_tokens:
+            break
+        kept.append(line)
+    if not kept:
+        return "…" + text[-max(max_tokens - 1, 0) * CHARS_PER_TOKEN:]
+    return "\n".join(reversed(kept))
+
+
+async def extractive_summarizer(summary: str, messages: List[Dict]) -> str:
+    """Summarize without a model call by keeping the start of each folded message."""
+    lines = [summary] if summary else []
+    for message in messages:
+        content = " ".join(message.get("content", "").split())
+        if len(content) > EXTRACTIVE_LINE_CHARS:
+            content = content[:EXTRACTIVE_LINE_CHARS] + "…"
+        lines.append(f"{message.get('role', 'user')}: {content}")
+    return "\n".join(lines)
+
+
+@lru_cache(maxsize=None)
+def _summary_agent(model: Optional[str]) -> Agent:
+    return Agent(
+        name="Conversation Summarizer",
+        instructions=(
+            "You maintain a running summary of a chat between a user and a team of comedy agents. "
+            "Merge the new messages into the existing summary. Keep the user's preferences, feedback, "
+            "and which jokes, riddles or comics were already told. Reply with the summary only, "
+            "in at most 150 words."
+        ),
+        model=model,
+    )
+
+
+def make_agent_summarizer(model: Optional[str], run_config: Optional[RunConfig] = None) -> Summarizer:
+    """
+    Build a summarizer that asks the session's model to merge folded messages.
+
+    Args:
+        model: The model used for summarization
+        run_config: The run configuration of the session
+
+    Returns:
+        An async summarizer callable
+    """
+    async def summarize(summary: str, messages: List[Dict]) -> str:
+        prompt = (
+            f"Existing summary:\n{summary or '(none)'}\n\n"
+            f"New messages:\n{_format_transcript(messages)}"
+        )
+        result = await Runner.run(_summary_agent(model), input=prompt, run_config=run_config)
+        return str(result.final_output).strip()
+
+    return summarize
+
+
+class HistoryManager:
+    """Builds the agent input window from the full session history."""
+
+    def __init__(
+        self,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        keep_turns: int = DEFAULT_KEEP_TURNS,
+        fold_turns: int = DEFAULT_FOLD_TURNS,
+        summarizer: Optional[Summarizer] = None,
+        stable_prefix: bool = False,
+        summary_share: float = DEFAULT_SUMMARY_SHARE,
+    ) -> None:
+        """
+        Args:
+            token_budget: Approximate token budget for summary plus verbatim turns
+            keep_turns: Number of most recent turns always sent verbatim
+            fold_turns: Extra turns allowed to accumulate before folding, so the
+                summary is not regenerated on every turn
+            summarizer: Async callable merging messages into the summary
+            stable_prefix: Keep the start of the window byte-stable across turns,
+                so provider-side prompt caching keeps hitting
+            summary_share: Share of the token budget the summary may take up
+        """
+        self.token_budget = token_budget
+        self.keep_turns = max(1, keep_turns)
+        self.fold_turns = max(0, fold_turns)
+        self.summarizer = summarizer or extractive_summarizer
+        self.stable_prefix = stable_prefix
+        self.summary_tokens = max(1, int(token_budget * summary_share))
+
+    def _window_start(self, messages: List[Dict], summary: ConversationSummary, folded: int) -> int:
+        """Index of the first message sent verbatim; `folded` is the first one not in the summary."""
+        starts = [start for start in _turn_starts(messages) if start >= folded]
+        if not starts:
+            return folded
+
+        # Fold only once enough extra turns have piled up
+        start = starts[0]
+        if len(starts) > self.keep_turns + self.fold_turns:
+            start = starts[-self.keep_turns]
+
+        # Fold further while over budget, always keeping the latest turn
+        summary_tokens = estimate_tokens(summary.text) if summary.text else 0
+        tokens = summary_tokens + sum(_message_tokens(m) for m in messages[start:])
+        if self.stable_prefix and tokens > self.token_budget and len(starts) > self.keep_turns:
+            # One larger fold now instead of moving the start (and the cached prefix) every turn
+            next_start = starts[-self.keep_turns]
+            tokens -= sum(_message_tokens(m) for m in messages[start:next_start])
+            start = next_start
+        for next_start in [s for s in starts if s > start]:
+            if tokens <= self.token_budget:
+                break
+            tokens -= sum(_message_tokens(m) for m in messages[start:next_start])
+            start = next_start
+        return start
+
+    async def build(self, messages: List[Dict], summary: ConversationSummary, offset: int = 0) -> List[Dict]:
+        """
+        Return the messages to send, folding older turns into the summary as needed.
+
+        Args:
+            messages: The conversation in agent input format, from position `offset` on
+            summary: The session's rolling summary, updated in place
+            offset: Position of the first given message in the whole conversation;
+                messages before it must already be folded into the summary
+
+        Returns:
+            The summary (as a system message, if any) followed by the recent turns
+        """
+        folded = summary.folded - offset
+        if folded > len(messages) or folded < 0:
+            summary.text, folded = "", 0
+        # Summaries kept from before the cap, or with a smaller budget, are trimmed too
+        summary.text = cap_summary(summary.text, self.summary_tokens)
+
+        start = self._window_start(messages, summary, folded)
+        if start > folded:
+            newly_folded = messages[folded:start]
+            try:
+                summary.text = await self.summarizer(summary.text, newly_folded)
+            except Exception as exc:
+                logger.warning("summarizer failed, using extractive summary: %s", exc)
+                summary.text = await extractive_summarizer(summary.text, newly_folded)
+            summary.text = cap_summary(summary.text, self.summary_tokens)
+            folded = start
+        summary.folded = folded + offset
+
+        window = messages[start:]
+        if self.stable_prefix:
+            # Extra keys a client sends along would change the serialized prompt
+            window = [{"role": m.get("role", "user"), "content": m.get("content", "")} for m in window]
+        if summary.text:
+            window = [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary.text}"}] + window
+        return window
@@ -0,0 +1,269 @@
+"""
+This module keeps the chat messages of UI sessions compact in memory.
+
+A ChatMessage is a slotted record whose role and emoji are interned, so every
+message shares one copy of them. Handoff steps are kept as (source, target)
+tuples of interned agent names and only formatted into markdown for display and
+storage. A SessionHistory holds the tail of a conversation that is resident in
+memory; older messages, and the whole history of idle sessions, are left to the
+conversation store. The SessionRegistry tracks the histories of all sessions in
+the process, evicts idle ones and exports their memory use.
+"""
+import logging
+import re
+import sys
+import threading
+import time
+import weakref
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from src.agent.metrics import get_metrics_registry
+
+DEFAULT_MAX_RESIDENT_MESSAGES = 200
+DEFAULT_IDLE_EVICT_AFTER = 1800.0  # seconds
+SWEEP_INTERVAL = 30.0
+
+_HANDOFF_STEP = re.compile(r"^🔄 Handover \*\*(.+?)\*\* -> \*\*(.+?)\*\*$")
+
+logger = logging.getLogger(__name__)
+
+#------------------------------------------------------------------------------
+# MESSAGES
+#------------------------------------------------------------------------------
+
+class Handoff(NamedTuple):
+    """A handover between two agents, stored instead of its markdown."""
+    source: str
+    target: str
+
+
+Step = Union[Handoff, str]
+
+
+def format_handoff(source: str, target: str) -> str:
+    """Markdown line for a handover between two agents."""
+    return f"🔄 Handover **{source}** -> **{target}**"
+
+
+def compact_step(step: str) -> Step:
+    """Turn a handover step into a Handoff of interned names; other steps stay text."""
+    match = _HANDOFF_STEP.match(step)
+    if match is None:
+        return step
+    return Handoff(sys.intern(match.group(1)), sys.intern(match.group(2)))
+
+
+def render_step(step: Step) -> str:
+    """Markdown line of a stored step."""
+    return format_handoff(*step) if isinstance(step, Handoff) else step
+
+
+class ChatMessage:
+    """One chat message as kept in session state."""
+
+    __slots__ = ("role", "content", "emoji", "steps", "feedback")
+
+    def __init__(
+        self,
+        role: str,
+        content: str,
+        emoji: Optional[str] = None,
+        steps: Iterable[str] = (),
+        feedback: Optional[int] = None,
+    ) -> None:
+        self.role = sys.intern(role)
+        self.content = content
+        self.emoji = sys.intern(emoji) if emoji else None
+        self.steps: Tuple[Step, ...] = tuple(compact_step(step) for step in steps)
+        self.feedback = feedback
+
+    @classmethod
+    def from_dict(cls, message: Dict) -> "ChatMessage":
+        """Build a message from its dict form, e.g. as loaded from the conversation store."""
+        return cls(
+            message.get("role", "user"),
+            message.get("content", ""),
+            emoji=message.get("emoji"),
+            steps=message.get("steps") or (),
+            feedback=message.get("feedback"),
+        )
+
+    def to_dict(self) -> Dict:
+        """The message with its steps rendered, as written to the conversation store."""
+        return {
+            "role": self.role,
+            "content": self.content,
+            "emoji": self.emoji,
+            "steps": self.rendered_steps(),
+            "feedback": self.feedback,
+        }
+
+    def rendered_steps(self) -> List[str]:
+        return [render_step(step) for step in self.steps]
+
+    def nbytes(self) -> int:
+        """Approximate memory held by this message; interned names are shared and not counted."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.content) + sys.getsizeof(self.steps)
+        for step in self.steps:
+            size += sys.getsizeof(step)
+        return size
+
+#------------------------------------------------------------------------------
+# SESSION HISTORY
+#------------------------------------------------------------------------------
+
+class SessionHistory:
+    """The part of a session's conversation that is resident in memory."""
+
+    def __init__(self, messages: Iterable[ChatMessage] = (), offset: int = 0) -> None:
+        """
+        Args:
+            messages: The resident tail of the conversation
+            offset: Position of the first resident message in the whole conversation
+        """
+        self._lock = threading.Lock()
+        self.messages: List[ChatMessage] = list(messages)
+        self.offset = offset
+        self.evicted = False
+        self.last_active = time.monotonic()
+
+    def __len__(self) -> int:
+        """Number of messages in the whole conversation, resident or not."""
+        return self.offset + len(self.messages)
+
+    def touch(self) -> None:
+        self.last_active = time.monotonic()
+
+    def append(self, message: ChatMessage) -> int:
+        """Add a message and return its position in the conversation."""
+        with self._lock:
+            self.messages.append(message)
+            return self.offset + len(self.messages) - 1
+
+    def get(self, index: int) -> Optional[ChatMessage]:
+        """The message at a position of the conversation, if it is resident."""
+        with self._lock:
+            if self.offset <= index < self.offset + len(self.messages):
+                return self.messages[index - self.offset]
+        return None
+
+    def resident(self) -> List[ChatMessage]:
+        """A snapshot of the resident messages."""
+        with self._lock:
+            return list(self.messages)
+
+    def since(self, start: int, load: Callable[[int, int], List[Dict]]) -> List[ChatMessage]:
+        """
+        The messages from a position of the conversation on, resident or not.
+
+        Args:
+            start: Position of the first message
+            load: Reads `limit` stored messages from `offset` on, e.g. from the conversation store
+
+        Returns:
+            The messages, those trimmed from memory read back through `load`
+        """
+        with self._lock:
+            offset, resident = self.offset, list(self.messages)
+        messages = []
+        if start < offset:
+            messages = [ChatMessage.from_dict(message) for message in load(start, offset - start)]
+        return messages + resident[max(0, start - offset):]
+
+    def trim(self, max_messages: int, keep_from: Optional[int] = None) -> int:
+        """
+        Drop the oldest resident messages beyond `max_messages`.
+
+        Args:
+            max_messages: Resident messages to keep at most
+            keep_from: Position of the first message that must stay resident
+                regardless, e.g. the first one not yet folded into the history
+                summary when there is no store to read it back from
+
+        Returns:
+            The number of messages dropped
+        """
+        with self._lock:
+            start = len(self) - max_messages
+            if keep_from is not None:
+                start = min(keep_from, start)
+            start -= self.offset
+            if start <= 0:
+                return 0
+            del self.messages[:start]
+            self.offset += start
+            return start
+
+    def evict(self) -> None:
+        """Drop every resident message; the session reloads them from the store when it is used again."""
+        with self._lock:
+            self.offset += len(self.messages)
+            self.messages = []
+            self.evicted = True
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(message.nbytes() for message in self.messages)
+
+
+class SessionRegistry:
+    """Process-wide view of the session histories, for idle eviction and memory metrics."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # Histories disappear with their session state
+        self._sessions: "weakref.WeakValueDictionary[str, SessionHistory]" = weakref.WeakValueDictionary()
+        self._last_sweep = 0.0
+
+    def register(self, session_id: str, history: SessionHistory) -> None:
+        with self._lock:
+            self._sessions[session_id] = history
+
+    def sweep(self, idle_after: Optional[float], force: bool = False) -> int:
+        """
+        Evict the histories of idle sessions and update the memory gauges.
+
+        Runs at most every SWEEP_INTERVAL seconds unless forced.
+
+        Args:
+            idle_after: Seconds without activity before a session is evicted, None to never evict
+            force: Sweep even if the last sweep was recent
+
+        Returns:
+            The number of sessions evicted
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_sweep < SWEEP_INTERVAL:
+                return 0
+            self._last_sweep = now
+            histories = list(self._sessions.values())
+
+        evicted = 0
+        for history in histories:
+            if idle_after and not history.evicted and now - history.last_active > idle_after:
+                history.evict()
+                evicted += 1
+        if evicted:
+            logger.info("evicted the history of %d idle sessions", evicted)
+
+        registry = get_metrics_registry()
+        registry.set_gauge(
+            "agent_session_memory_bytes",
+            "Approximate memory held by resident chat messages.",
+            sum(history.nbytes() for history in histories),
+        )
+        for state, count in (
+            ("resident", sum(1 for h in histories if not h.evicted)),
+            ("evicted", sum(1 for h in histories if h.evicted)),
+        ):
+            registry.set_gauge("agent_sessions", "UI sessions by history state.", count, state=state)
+        return evicted
+
+
+_session_registry = SessionRegistry()
+
+
+def get_session_registry() -> SessionRegistry:
+    """Return the process-wide session registry."""
+    return _session_registry
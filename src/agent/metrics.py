@@ -0,0 +1,320 @@
+"""
+This module records per-turn latency metrics and exports them.
+
+A TurnMetrics object collects, for one turn, the time to first token, the time
+each agent spent generating (including the triage agent before its handoff),
+tool execution time, token counts (prompt, served from the provider's prompt
+cache, spent on agent instructions, and completion) and the provider/model. Run hooks fill it in
+during the agent run; finished turns are aggregated by a process-wide
+MetricsRegistry that renders the Prometheus text format and can be served over
+HTTP.
+"""
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from agents import Agent, RunContextWrapper, RunHooks, Tool
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+#------------------------------------------------------------------------------
+# PER-TURN METRICS
+#------------------------------------------------------------------------------
+
+@dataclass
+class AgentTiming:
+    """Generation time of one agent within a turn."""
+    name: str
+    started: float
+    ended: Optional[float] = None
+    handed_off_to: Optional[str] = None
+
+    @property
+    def seconds(self) -> float:
+        return (self.ended or time.perf_counter()) - self.started
+
+
+@dataclass
+class TurnMetrics:
+    """Latency breakdown and token counts of a single turn."""
+    provider: str
+    model: Optional[str]
+    started: float = field(default_factory=time.perf_counter)
+    ttft: Optional[float] = None
+    total: Optional[float] = None
+    agents: List[AgentTiming] = field(default_factory=list)
+    tools: List[Tuple[str, float]] = field(default_factory=list)
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0  # prompt tokens the provider served from its prompt cache
+    instruction_tokens: int = 0  # prompt tokens spent on agent instructions
+    error: Optional[str] = None
+    cancelled: bool = False  # stopped by the session or client rather than failed
+    discarded: bool = False  # closed without being recorded
+
+    def mark_first_token(self) -> None:
+        """Record the time to first token, once."""
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+
+    def add_usage(self, raw_responses: List[Any]) -> None:
+        """Add token counts from the model responses of a run."""
+        for response in raw_responses:
+            self.input_tokens += response.usage.input_tokens or 0
+            self.output_tokens += response.usage.output_tokens or 0
+
+    def add_prompt_usage(self, usage: Any, instruction_tokens: int = 0) -> None:
+        """
+        Add the prompt accounting of one streamed model response.
+
+        The SDK's Usage drops cached tokens, so they are read from the usage of the
+        raw response completed event.
+
+        Args:
+            usage: The usage of the completed response, if any
+            instruction_tokens: Tokens of the instructions of the agent that made the call
+        """
+        details = getattr(usage, "input_tokens_details", None)
+        self.cached_tokens += getattr(details, "cached_tokens", 0) or 0
+        self.instruction_tokens += instruction_tokens
+
+    def discard(self) -> None:
+        """Close the turn without recording it, e.g. when its run was never started."""
+        if self.total is None:
+            self.total = time.perf_counter() - self.started
+            self.discarded = True
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """Close open timings and record the turn with the process-wide registry."""
+        if self.total is not None:
+            return
+        now = time.perf_counter()
+        self.total = now - self.started
+        for timing in self.agents:
+            if timing.ended is None:
+                timing.ended = now
+        if isinstance(error, asyncio.CancelledError):
+            self.cancelled = True
+        elif error is not None:
+            self.error = type(error).__name__
+        get_metrics_registry().observe_turn(self)
+        logger.info(
+            "turn provider=%s model=%s ttft=%s total=%.3f tokens=%d/%d cached=%d",
+            self.provider, self.model,
+            f"{self.ttft:.3f}" if self.ttft is not None else "-",
+            self.total, self.input_tokens, self.output_tokens, self.cached_tokens,
+        )
+
+    def breakdown_steps(self) -> List[str]:
+        """Markdown lines describing the latency breakdown for the Steps list."""
+        def ms(seconds: Optional[float]) -> str:
+            return "-" if seconds is None else f"{seconds * 1000:.0f} ms"
+
+        steps = [f"⏱️ First token {ms(self.ttft)}, total {ms(self.total)} ({self.provider} / {self.model})"]
+        for timing in self.agents:
+            suffix = f" before handoff to {timing.handed_off_to}" if timing.handed_off_to else ""
+            steps.append(f"⏱️ **{timing.name}** {ms(timing.seconds)}{suffix}")
+        for name, seconds in self.tools:
+            steps.append(f"⏱️ Tool `{name}` {ms(seconds)}")
+        steps.append(
+            f"⏱️ Tokens {self.input_tokens} prompt ({self.cached_tokens} cached, "
+            f"{self.instruction_tokens} instructions) / {self.output_tokens} completion"
+        )
+        return steps
+
+
+class TurnMetricsHooks(RunHooks):
+    """Run hooks that fill in a TurnMetrics during an agent run."""
+
+    def __init__(self, metrics: TurnMetrics) -> None:
+        self.metrics = metrics
+        self._tool_starts: Dict[str, List[float]] = {}
+
+    def _current(self, agent: Agent) -> Optional[AgentTiming]:
+        for timing in reversed(self.metrics.agents):
+            if timing.name == agent.name and timing.ended is None:
+                return timing
+        return None
+
+    async def on_agent_start(self, context: RunContextWrapper, agent: Agent) -> None:
+        if self._current(agent) is None:
+            self.metrics.agents.append(AgentTiming(agent.name, time.perf_counter()))
+
+    async def on_agent_end(self, context: RunContextWrapper, agent: Agent, output: Any) -> None:
+        timing = self._current(agent)
+        if timing is not None:
+            timing.ended = time.perf_counter()
+
+    async def on_handoff(self, context: RunContextWrapper, from_agent: Agent, to_agent: Agent) -> None:
+        timing = self._current(from_agent)
+        if timing is not None:
+            timing.ended = time.perf_counter()
+            timing.handed_off_to = to_agent.name
+
+    async def on_tool_start(self, context: RunContextWrapper, agent: Agent, tool: Tool) -> None:
+        self._tool_starts.setdefault(tool.name, []).append(time.perf_counter())
+
+    async def on_tool_end(self, context: RunContextWrapper, agent: Agent, tool: Tool, result: str) -> None:
+        starts = self._tool_starts.get(tool.name)
+        if starts:
+            self.metrics.tools.append((tool.name, time.perf_counter() - starts.pop()))
+
+#------------------------------------------------------------------------------
+# PROCESS-WIDE REGISTRY AND EXPORTER
+#------------------------------------------------------------------------------
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms rendered in Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._gauges: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Dict[Tuple, List[float]]] = {}
+
+    def _declare(self, name: str, kind: str, help_text: str) -> None:
+        self._help.setdefault(name, (kind, help_text))
+
+    def inc(self, name: str, help_text: str, value: float = 1.0, **labels: str) -> None:
+        """Increment a counter."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._declare(name, "counter", help_text)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, help_text: str, value: float, **labels: str) -> None:
+        """Set a gauge."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._declare(name, "gauge", help_text)
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, help_text: str, value: float, **labels: str) -> None:
+        """Add an observation to a histogram with LATENCY_BUCKETS."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._declare(name, "histogram", help_text)
+            series = self._histograms.setdefault(name, {})
+            # Layout: one count per bucket, then +Inf count and sum
+            buckets = series.setdefault(key, [0.0] * (len(LATENCY_BUCKETS) + 2))
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+            buckets[-2] += 1
+            buckets[-1] += value
+
+    def get(self, name: str, **labels: str) -> float:
+        """Current value of a counter or gauge, 0 if never set."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            for store in (self._counters, self._gauges):
+                if name in store:
+                    return store[name].get(key, 0.0)
+        return 0.0
+
+    def observe_turn(self, turn: TurnMetrics) -> None:
+        """Aggregate a finished turn."""
+        labels = {"provider": turn.provider, "model": turn.model or ""}
+        status = "cancelled" if turn.cancelled else "error" if turn.error else "ok"
+        self.inc("agent_turns_total", "Agent turns by outcome.", status=status, **labels)
+        if turn.ttft is not None:
+            self.observe("agent_turn_ttft_seconds", "Time to first token per turn.", turn.ttft, **labels)
+        if turn.total is not None:
+            self.observe("agent_turn_seconds", "Total latency per turn.", turn.total, **labels)
+        for timing in turn.agents:
+            self.observe("agent_generation_seconds", "Generation time per agent, up to its handoff.",
+                         timing.seconds, agent=timing.name, **labels)
+        for name, seconds in turn.tools:
+            self.observe("agent_tool_seconds", "Tool execution time.", seconds, tool=name, **labels)
+        self.inc("agent_input_tokens_total", "Prompt tokens sent.", turn.input_tokens, **labels)
+        self.inc("agent_output_tokens_total", "Completion tokens received.", turn.output_tokens, **labels)
+        self.inc("agent_cached_input_tokens_total", "Prompt tokens served from the provider's prompt cache.",
+                 turn.cached_tokens, **labels)
+        self.inc("agent_instruction_tokens_total", "Prompt tokens spent on agent instructions.",
+                 turn.instruction_tokens, **labels)
+        prompt = self.get("agent_input_tokens_total", **labels)
+        if prompt:
+            self.set_gauge("agent_prompt_cache_hit_ratio", "Share of prompt tokens served from the prompt cache.",
+                           self.get("agent_cached_input_tokens_total", **labels) / prompt, **labels)
+
+    def render_prometheus(self) -> str:
+        """Render every metric in Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._help.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "histogram":
+                    for key, buckets in self._histograms[name].items():
+                        for bound, count in zip(LATENCY_BUCKETS, buckets):
+                            lines.append(f"{name}_bucket{_format_labels(key + (('le', str(bound)),))} {count:g}")
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {buckets[-2]:g}")
+                        lines.append(f"{name}_count{_format_labels(key)} {buckets[-2]:g}")
+                        lines.append(f"{name}_sum{_format_labels(key)} {buckets[-1]:g}")
+                else:
+                    store = self._counters if kind == "counter" else self._gauges
+                    for key, value in store[name].items():
+                        lines.append(f"{name}{_format_labels(key)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+_server: Optional[ThreadingHTTPServer] = None
+_server_started = False
+_server_lock = threading.Lock()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Return the process-wide metrics registry."""
+    return _registry
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = _registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("metrics endpoint: " + format, *args)
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> None:
+    """Serve /metrics on a background thread; later calls are no-ops."""
+    global _server, _server_started
+    with _server_lock:
+        if _server_started:
+            return
+        _server_started = True
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as exc:
+            # Another worker process on this host already serves the port
+            logger.warning("metrics endpoint not started on port %s: %s", port, exc)
+            return
+        threading.Thread(target=_server.serve_forever, name="metrics-exporter", daemon=True).start()
+        logger.info("serving metrics on http://%s:%s/metrics", host, port)
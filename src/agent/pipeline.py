@@ -0,0 +1,217 @@
+"""
+This module runs agent turns and turns their results into response events.
+
+Streaming turns yield `{"delta": str}` chunks for text and `{"step": str}` chunks
+for handovers and other process steps; non-streaming turns return
+`{"response": str, "steps": [...]}`. The functions here are shared by the
+Streamlit UI and any other entry point.
+"""
+import asyncio
+import logging
+from typing import AsyncGenerator, Dict, List, Optional
+
+from openai.types.responses import ResponseCompletedEvent, ResponseTextDeltaEvent
+from agents import Agent, HandoffOutputItem, RunConfig, Runner, RunResult, RunResultStreaming
+
+from src.agent.cache import ResponseCache, split_for_replay
+from src.agent.messages import Handoff, compact_step, format_handoff
+from src.agent.metrics import TurnMetrics, TurnMetricsHooks
+from src.agent.tokens import instruction_tokens
+
+logger = logging.getLogger(__name__)
+
+CACHE_HIT_STEP = "💾 Cache hit"
+CACHE_MISS_STEP = "💾 Cache miss"
+
+#------------------------------------------------------------------------------
+# RESPONSE STREAMING AND PROCESSING
+#------------------------------------------------------------------------------
+
+def cancel_run(result: RunResultStreaming) -> None:
+    """Stop a streamed run that is abandoned before it completes, closing its model stream."""
+    # The SDK only stops the run when stream_events ends by itself, not when the stream is closed early
+    result._cleanup_tasks()
+
+def add_prompt_usage(metrics: TurnMetrics, event: ResponseCompletedEvent, agent: Agent) -> None:
+    """Record the cached and instruction tokens of a model call made by the given agent."""
+    metrics.add_prompt_usage(event.response.usage, instruction_tokens(agent, metrics.model) or 0)
+
+def add_run_prompt_usage(metrics: TurnMetrics, result: RunResult) -> None:
+    """
+    Record the cached and instruction tokens of every model call of a finished run.
+
+    The agent of each call is the one its output items were attributed to. Cached
+    tokens are only known if the SDK's Usage keeps the input token details.
+    """
+    agents_by_item = {id(item.raw_item): item.agent for item in result.new_items}
+    for response in result.raw_responses:
+        agent = next(
+            (agents_by_item[id(output)] for output in response.output if id(output) in agents_by_item),
+            result.last_agent,
+        )
+        metrics.add_prompt_usage(response.usage, instruction_tokens(agent, metrics.model) or 0)
+
+async def generate_response_stream(
+    agent: Agent,
+    prompt: str,
+    run_config: Optional[RunConfig] = None,
+    metrics: Optional[TurnMetrics] = None,
+) -> AsyncGenerator[Dict, None]:
+    """Yields token deltas and agent handover updates, recording metrics if given."""
+    hooks = TurnMetricsHooks(metrics) if metrics is not None else None
+    result = Runner.run_streamed(agent, input=prompt, run_config=run_config, hooks=hooks)
+    current_agent = agent
+    error = None
+
+    try:
+        async for event in result.stream_events():
+
+            if event.type == "agent_updated_stream_event":
+                new_agent = event.new_agent
+                if new_agent.name != current_agent.name:
+                    logger.debug("agent handover: %s -> %s", current_agent.name, new_agent.name)
+                    yield {"step": format_handoff(current_agent.name, new_agent.name)}
+                    current_agent = new_agent
+            elif event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                if metrics is not None:
+                    metrics.mark_first_token()
+                yield {"delta": event.data.delta}
+            elif event.type == "raw_response_event" and isinstance(event.data, ResponseCompletedEvent):
+                if metrics is not None:
+                    add_prompt_usage(metrics, event.data, current_agent)
+        # stream_events swallows a cancellation and just stops, which would pass a cut-off run as complete
+        if not result.is_complete:
+            raise asyncio.CancelledError()
+    except (Exception, asyncio.CancelledError) as exc:
+        error = exc
+        raise
+    finally:
+        if not result.is_complete:
+            cancel_run(result)
+        if metrics is not None:
+            metrics.add_usage(result.raw_responses)
+            metrics.finish(error)
+
+async def generate_static_response_stream(
+    agent: Agent,
+    prompt: str,
+    run_config: Optional[RunConfig] = None,
+    metrics: Optional[TurnMetrics] = None,
+) -> AsyncGenerator[Dict, None]:
+    """Runs a turn without streaming and yields its steps followed by the whole response as one delta."""
+    response = await get_agent_response(agent, prompt, stream=False, run_config=run_config, metrics=metrics)
+    for step in response["steps"]:
+        yield {"step": step}
+    yield {"delta": str(response["response"])}
+
+async def collect_response(generator: AsyncGenerator[Dict, None]) -> Dict:
+    """Consumes a response stream into `{"response": str, "steps": [...]}`."""
+    parts = []
+    steps = []
+    async for chunk in generator:
+        if "delta" in chunk:
+            parts.append(chunk["delta"])
+        elif "step" in chunk:
+            steps.append(chunk["step"])
+    return {"response": "".join(parts), "steps": steps}
+
+async def prepend_steps(steps: List[str], generator: AsyncGenerator[Dict, None]) -> AsyncGenerator[Dict, None]:
+    """Yields the given steps before the chunks of a response stream."""
+    for step in steps:
+        yield {"step": step}
+    async for chunk in generator:
+        yield chunk
+
+def process_handoffs(result) -> List[str]:
+    """Processes handoff events from HandoffOutputItem and returns steps list."""
+    steps = []
+    for item in result.new_items:
+        if isinstance(item, HandoffOutputItem):
+            steps.append(format_handoff(item.source_agent.name, item.target_agent.name))
+    return steps
+
+#------------------------------------------------------------------------------
+# RESPONSE CACHE
+#------------------------------------------------------------------------------
+
+async def replay_cached_response(cached: Dict) -> AsyncGenerator[Dict, None]:
+    """Replays a cached response as stream chunks."""
+    yield {"step": CACHE_HIT_STEP}
+    for step in cached["steps"]:
+        yield {"step": step}
+    for delta in split_for_replay(cached["response"]):
+        yield {"delta": delta}
+        await asyncio.sleep(0)
+
+async def cached_response_stream(
+    cache: ResponseCache, key: str, generator: AsyncGenerator[Dict, None]
+) -> AsyncGenerator[Dict, None]:
+    """
+    Serves a stream from the cache, or passes the live stream through and caches it.
+
+    Args:
+        cache: The response cache backend
+        key: Cache key of the turn, see make_cache_key
+        generator: The live response stream, only started on a cache miss
+    """
+    cached = cache.get(key)
+    if cached is not None:
+        await generator.aclose()
+        async for chunk in replay_cached_response(cached):
+            yield chunk
+        return
+
+    yield {"step": CACHE_MISS_STEP}
+    parts = []
+    steps = []
+    async for chunk in generator:
+        if "delta" in chunk:
+            parts.append(chunk["delta"])
+        elif "step" in chunk and isinstance(compact_step(chunk["step"]), Handoff):
+            # Queueing, failover, coalescing and speculation steps describe this run only
+            steps.append(chunk["step"])
+        yield chunk
+    cache.set(key, {"response": "".join(parts), "steps": steps})
+
+#------------------------------------------------------------------------------
+# UNIFIED RESPONSE
+#------------------------------------------------------------------------------
+
+async def get_agent_response(
+    agent: Agent,
+    prompt: str,
+    stream: bool = False,
+    run_config: Optional[RunConfig] = None,
+    cache: Optional[ResponseCache] = None,
+    cache_key: Optional[str] = None,
+    metrics: Optional[TurnMetrics] = None,
+) -> Dict:
+    """Unified function to get agent response with optional streaming, caching and metrics."""
+    use_cache = cache is not None and cache_key is not None
+    if stream:
+        generator = generate_response_stream(agent, prompt, run_config=run_config, metrics=metrics)
+        if use_cache:
+            generator = cached_response_stream(cache, cache_key, generator)
+        return await collect_response(generator)
+    else:
+        if use_cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return {"response": cached["response"], "steps": [CACHE_HIT_STEP] + cached["steps"]}
+        hooks = TurnMetricsHooks(metrics) if metrics is not None else None
+        try:
+            result = await Runner.run(agent, input=prompt, run_config=run_config, hooks=hooks)
+        except (Exception, asyncio.CancelledError) as exc:
+            if metrics is not None:
+                metrics.finish(exc)
+            raise
+        if metrics is not None:
+            metrics.add_usage(result.raw_responses)
+            add_run_prompt_usage(metrics, result)
+            metrics.finish()
+        steps = process_handoffs(result)
+        response = {"response": result.final_output, "steps": steps}
+        if use_cache:
+            cache.set(cache_key, {"response": str(result.final_output), "steps": steps})
+            response["steps"] = [CACHE_MISS_STEP] + steps
+        return response
@@ -0,0 +1,76 @@
+"""
+This module carries LLM provider configuration per run instead of through SDK globals.
+
+`set_default_openai_client` and friends are process-wide, so sessions that pick
+different providers would race each other. A ProviderSettings value is kept per
+session and turned into a RunConfig for every `Runner.run`/`Runner.run_streamed`.
+
+Trace export is process-wide as well, so it uses one operator key set with
+`set_tracing_key` rather than the key of whichever session ran last; without
+one, runs are not traced.
+"""
+from dataclasses import dataclass, field
+from typing import Optional
+
+from agents import ModelSettings, OpenAIProvider, RunConfig, set_tracing_export_api_key
+
+from src.agent.clients import get_client_manager
+from src.agent.streaming import ChatCompletionsProvider
+
+_tracing_key: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class ProviderSettings:
+    """Connection settings for one LLM provider."""
+    provider: str
+    model: Optional[str]
+    base_url: Optional[str]
+    api_key: str = field(repr=False)
+
+    @property
+    def use_responses(self) -> bool:
+        """Non-OpenAI providers only support the chat completions API."""
+        return self.provider == "openai"
+
+
+def set_tracing_key(api_key: Optional[str]) -> None:
+    """
+    Export the traces of OpenAI runs with the given key, or turn tracing off.
+
+    Args:
+        api_key: The OpenAI key traces are exported with, None to not trace
+    """
+    global _tracing_key
+    if api_key and api_key != _tracing_key:
+        set_tracing_export_api_key(api_key)
+    _tracing_key = api_key or None
+
+
+def build_run_config(settings: ProviderSettings) -> RunConfig:
+    """
+    Build a run configuration that routes every model call to the given provider.
+
+    Args:
+        settings: The provider settings for the session
+
+    Returns:
+        A RunConfig with a model provider bound to the pooled client
+    """
+    client = get_client_manager().get_client(
+        provider=settings.provider,
+        base_url=settings.base_url,
+        api_key=settings.api_key,
+    )
+    if settings.use_responses:
+        model_provider = OpenAIProvider(openai_client=client, use_responses=True)
+    else:
+        # Normalizes streamed chunks of OpenAI-compatible providers, see src/agent/streaming.py
+        model_provider = ChatCompletionsProvider(client)
+    return RunConfig(
+        model_provider=model_provider,
+        # Ask chat completions providers for a usage chunk so streamed turns report tokens
+        model_settings=None if settings.use_responses else ModelSettings(include_usage=True),
+        # Only OpenAI runs are traced, and only with an export key
+        tracing_disabled=not (settings.use_responses and _tracing_key),
+    )
@@ -0,0 +1,100 @@
+"""
+This module keeps a process-wide registry of agent graphs.
+
+Building the agent graph runs `prompt_with_handoff_instructions` over every
+instruction block and creates six Agent objects, so the graph is built once per
+(provider, model, tool set) and shared by every session in the process. The
+token counts of the instructions are computed along with it and exported as
+`agent_instruction_tokens{agent,model}`.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from agents import Tool
+
+from src.agent.agent import AgentGraph, DEFAULT_XKCD_TOOLS, create_agent_graph
+from src.agent.metrics import get_metrics_registry
+from src.agent.tokens import precompute_instruction_tokens
+
+GraphKey = Tuple[Optional[str], Optional[str], Tuple[str, ...]]
+
+
+class AgentRegistry:
+    """Thread-safe cache of agent graphs keyed by provider, model and tool set."""
+
+    def __init__(self) -> None:
+        self._graphs: Dict[GraphKey, AgentGraph] = {}
+        self._fingerprints: Dict[Optional[str], str] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        provider: Optional[str],
+        model: Optional[str],
+        tools: Optional[List[Tool]] = None,
+        fingerprint: Optional[str] = None,
+    ) -> AgentGraph:
+        """
+        Return the shared agent graph, building it on first use.
+
+        Args:
+            provider: The LLM provider identifier
+            model: The model used by every agent in the graph
+            tools: Tools for the XKCD agent, defaults to DEFAULT_XKCD_TOOLS
+            fingerprint: Hash of the provider configuration; a new value drops
+                every graph previously built for the provider
+
+        Returns:
+            The cached AgentGraph
+        """
+        if tools is None:
+            tools = list(DEFAULT_XKCD_TOOLS)
+        key = (provider, model, tuple(tool.name for tool in tools))
+
+        with self._lock:
+            if fingerprint is not None and self._fingerprints.get(provider) != fingerprint:
+                self._drop_provider(provider)
+                self._fingerprints[provider] = fingerprint
+
+            graph = self._graphs.get(key)
+            if graph is None:
+                graph = create_agent_graph(model=model, tools=tools)
+                self._graphs[key] = graph
+                for name, tokens in precompute_instruction_tokens(graph, model).items():
+                    get_metrics_registry().set_gauge(
+                        "agent_instruction_tokens", "Tokens of each agent's instructions.",
+                        tokens, agent=name, model=model or "",
+                    )
+            return graph
+
+    def invalidate(self, provider: Optional[str] = None) -> None:
+        """Drop cached graphs for one provider, or for all providers when none is given."""
+        with self._lock:
+            if provider is None:
+                self._graphs.clear()
+                self._fingerprints.clear()
+            else:
+                self._drop_provider(provider)
+                self._fingerprints.pop(provider, None)
+
+    def _drop_provider(self, provider: Optional[str]) -> None:
+        for key in [key for key in self._graphs if key[0] == provider]:
+            del self._graphs[key]
+
+
+_registry = AgentRegistry()
+
+
+def get_agent_graph(
+    provider: Optional[str],
+    model: Optional[str],
+    tools: Optional[List[Tool]] = None,
+    fingerprint: Optional[str] = None,
+) -> AgentGraph:
+    """Return the process-wide agent graph for the given provider, model and tools."""
+    return _registry.get(provider, model, tools=tools, fingerprint=fingerprint)
+
+
+def invalidate_agent_graphs(provider: Optional[str] = None) -> None:
+    """Invalidate process-wide agent graphs, e.g. after secrets change."""
+    _registry.invalidate(provider)
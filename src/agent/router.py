@@ -0,0 +1,153 @@
+"""
+This module implements a local pre-router that can skip the triage LLM hop.
+
+Obvious requests ("tell me a riddle", "show me an xkcd") are matched by keyword
+rules and, optionally, a lightweight local classifier, and dispatched straight
+to the specialist agent. Anything ambiguous falls back to the triage agent.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Pattern, Protocol, Sequence, Tuple
+
+from agents import Agent
+
+from src.agent.agent import AgentGraph
+
+DEFAULT_THRESHOLD = 0.75
+DEFAULT_MIN_HITS = 2    # vocabulary hits needed before the classifier names a specialist
+DEFAULT_MIN_MARGIN = 1  # hits the best specialist needs over the runner-up
+
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+@dataclass(frozen=True)
+class Route:
+    """The agent chosen for a turn and how it was chosen."""
+    agent: Agent
+    path: str  # "fast" or "triage"
+    reason: str = ""
+
+    @property
+    def step(self) -> str:
+        """Markdown line describing the routing decision for the Steps list."""
+        if self.path == "fast":
+            return f"⚡ Fast path -> **{self.agent.name}** ({self.reason})"
+        return f"🧭 Routed by **{self.agent.name}**"
+
+
+@dataclass(frozen=True)
+class RoutingRule:
+    """Sends requests matching `pattern` to the specialist named `target`."""
+    target: str
+    pattern: Pattern
+
+
+DEFAULT_RULES: Tuple[RoutingRule, ...] = (
+    RoutingRule("xkcd_agent", re.compile(r"\bxkcd\b|\b(web)?comics?\b", re.IGNORECASE)),
+    RoutingRule("riddles_agent", re.compile(r"\briddles?\b|\bbrain[- ]?teasers?\b|\bpuzzles?\b", re.IGNORECASE)),
+    RoutingRule("dad_jokes_agent", re.compile(r"\bdad jokes?\b|\bpuns?\b", re.IGNORECASE)),
+    RoutingRule("dark_humor_agent", re.compile(r"\bdark (humou?r|jokes?|comedy)\b|\bmorbid\b", re.IGNORECASE)),
+    RoutingRule("sarcastic_agent", re.compile(r"\bsarcas(m|tic)\b|\broast me\b", re.IGNORECASE)),
+)
+
+
+class Classifier(Protocol):
+    """Interface for local intent classifiers."""
+
+    def classify(self, text: str) -> Tuple[Optional[str], float]:
+        """Return the most likely specialist name and a confidence in [0, 1]."""
+        ...
+
+
+DEFAULT_VOCABULARY: Dict[str, Tuple[str, ...]] = {
+    "dad_jokes_agent": ("dad", "pun", "puns", "cheesy", "corny", "wordplay", "groan", "clean", "kids"),
+    "riddles_agent": ("riddle", "riddles", "puzzle", "teaser", "enigma", "solve", "guess", "brain"),
+    "sarcastic_agent": ("sarcasm", "sarcastic", "roast", "mock", "irony", "ironic", "snarky", "deadpan"),
+    "dark_humor_agent": ("dark", "morbid", "edgy", "grim", "twisted", "gallows", "funeral", "death"),
+    "xkcd_agent": ("xkcd", "comic", "comics", "webcomic", "strip", "stick", "geeky", "nerdy"),
+}
+
+
+class KeywordClassifier:
+    """Bag-of-words classifier scoring each specialist by its vocabulary hits."""
+
+    def __init__(
+        self,
+        vocabulary: Optional[Dict[str, Sequence[str]]] = None,
+        min_hits: int = DEFAULT_MIN_HITS,
+        min_margin: int = DEFAULT_MIN_MARGIN,
+    ) -> None:
+        """
+        Args:
+            vocabulary: Words that point at each specialist, defaults to DEFAULT_VOCABULARY
+            min_hits: Hits the best specialist needs; a single incidental word
+                ("solve this tax form") should not count as intent
+            min_margin: Hits the best specialist needs over the runner-up
+        """
+        self.min_hits = max(1, min_hits)
+        self.min_margin = max(0, min_margin)
+        self._index: Dict[str, List[str]] = {}
+        for target, words in (vocabulary or DEFAULT_VOCABULARY).items():
+            for word in words:
+                self._index.setdefault(word, []).append(target)
+
+    def classify(self, text: str) -> Tuple[Optional[str], float]:
+        scores: Dict[str, int] = {}
+        for word in _WORD_RE.findall(text.lower()):
+            for target in self._index.get(word, ()):
+                scores[target] = scores.get(target, 0) + 1
+        ranked = sorted(scores.values(), reverse=True)
+        if not ranked or ranked[0] < self.min_hits:
+            return None, 0.0
+        if len(ranked) > 1 and ranked[0] - ranked[1] < self.min_margin:
+            return None, 0.0
+        best = max(scores, key=scores.get)
+        return best, scores[best] / sum(scores.values())
+
+
+class PreRouter:
+    """Chooses between a specialist fast path and the triage agent."""
+
+    def __init__(
+        self,
+        rules: Sequence[RoutingRule] = DEFAULT_RULES,
+        classifier: Optional[Classifier] = None,
+        threshold: float = DEFAULT_THRESHOLD,
+    ) -> None:
+        self.rules = tuple(rules)
+        self.classifier = classifier
+        self.threshold = threshold
+
+    def route(self, graph: AgentGraph, messages: List[Dict]) -> Route:
+        """
+        Pick the agent for the latest user message.
+
+        Args:
+            graph: The agent graph to route within
+            messages: The conversation in agent input format
+
+        Returns:
+            A fast-path Route to a specialist, or the triage agent when unsure
+        """
+        text = next(
+            (message.get("content", "") for message in reversed(messages) if message.get("role") == "user"),
+            "",
+        )
+
+        # Rules are only trusted when they all point at the same specialist
+        matches = {}
+        for rule in self.rules:
+            match = rule.pattern.search(text)
+            if match:
+                matches.setdefault(rule.target, match.group(0))
+        if len(matches) == 1:
+            target, matched = matches.popitem()
+            if target in graph.specialists:
+                return Route(graph.specialists[target], "fast", f"matched '{matched}'")
+
+        if self.classifier is not None and not matches:
+            target, confidence = self.classifier.classify(text)
+            if target in graph.specialists and confidence >= self.threshold:
+                return Route(graph.specialists[target], "fast", f"classifier {confidence:.2f}")
+
+        return Route(graph.triage, "triage")
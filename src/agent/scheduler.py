@@ -0,0 +1,351 @@
+"""
+This module admits agent runs per provider within rate limits.
+
+Every provider gets a queue with an optional concurrency limit and an optional
+tokens-per-minute budget (a token bucket charged with an estimate up front and
+corrected with the actual usage afterwards). Waiting runs are served round-robin
+across sessions, so one busy session cannot starve the others. A 429 response
+seen on any pooled client pauses the whole provider for its Retry-After period.
+
+The scheduler lives on the shared client loop; waiting runs yield
+`{"status": "queued", ...}` chunks so the UI can show that they are queued.
+"""
+import asyncio
+import contextlib
+import email.utils
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, AsyncIterator, Callable, Deque, Dict, Optional
+
+import httpx
+
+from src.agent.history import estimate_tokens
+from src.agent.metrics import TurnMetrics, get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMPLETION_TOKENS = 512
+DEFAULT_RATE_LIMIT_PAUSE = 1.0
+MAX_RATE_LIMIT_PAUSE = 60.0
+STATUS_INTERVAL = 0.5
+
+
+@dataclass(frozen=True)
+class ProviderLimits:
+    """Admission limits of one provider; None means unlimited."""
+    max_concurrency: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+
+
+@dataclass
+class _Ticket:
+    session_id: str
+    tokens: int
+    future: asyncio.Future
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+def estimate_request_tokens(prompt) -> int:
+    """Rough token cost of a run: the prompt plus a completion allowance."""
+    text = prompt if isinstance(prompt, str) else json.dumps(prompt)
+    return estimate_tokens(text) + DEFAULT_COMPLETION_TOKENS
+
+
+def parse_retry_after(headers: httpx.Headers) -> Optional[float]:
+    """Seconds to wait according to retry-after-ms or Retry-After (seconds or HTTP date)."""
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return retry_at.timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+def format_status(chunk: Dict) -> str:
+    """Markdown line for a status chunk."""
+    if chunk.get("status") == "queued":
+        return f"⏳ Queued for **{chunk['provider']}** (position {chunk['position']})…"
+    return ""
+
+
+class ProviderQueue:
+    """Fair admission queue and token bucket of a single provider."""
+
+    def __init__(self, provider: str, limits: ProviderLimits) -> None:
+        self.provider = provider
+        self.limits = limits
+        self.running = 0
+        self.paused_until = 0.0
+        self._sessions: "OrderedDict[str, Deque[_Ticket]]" = OrderedDict()
+        self._tokens = float(limits.tokens_per_minute or 0)
+        self._refilled = time.monotonic()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None  # the loop the tickets wait on
+        self._pending: Optional[ProviderLimits] = None
+        self._pending_lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(tickets) for tickets in self._sessions.values())
+
+    def configure(self, limits: ProviderLimits) -> None:
+        """
+        Apply new limits, e.g. after the secrets changed.
+
+        Safe to call from any thread, e.g. the Streamlit script thread: the limits
+        are applied on the loop the tickets wait on, and by the next enqueue or
+        release at the latest.
+        """
+        with self._pending_lock:
+            if limits == (self._pending or self.limits):
+                return
+            self._pending = limits
+        loop = self._loop
+        if loop is None:
+            # Never used on a loop, so nothing is waiting
+            self._apply_pending()
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(self._dispatch)
+
+    def _apply_pending(self) -> None:
+        with self._pending_lock:
+            limits, self._pending = self._pending, None
+        if limits is None or limits == self.limits:
+            return
+        if limits.tokens_per_minute and not self.limits.tokens_per_minute:
+            self._tokens = float(limits.tokens_per_minute)
+        self.limits = limits
+
+    def position(self, ticket: _Ticket) -> int:
+        """1-based position of a waiting ticket in round-robin order."""
+        queues = [list(tickets) for tickets in self._sessions.values()]
+        position = 0
+        for depth in range(max((len(q) for q in queues), default=0)):
+            for tickets in queues:
+                if depth < len(tickets):
+                    position += 1
+                    if tickets[depth] is ticket:
+                        return position
+        return position
+
+    def pause(self, seconds: float) -> None:
+        """Hold back new admissions, e.g. after a 429 response."""
+        seconds = min(max(seconds, 0.0), MAX_RATE_LIMIT_PAUSE)
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        logger.warning("provider %s rate limited, pausing admissions for %.1fs", self.provider, seconds)
+
+    def enqueue(self, session_id: str, tokens: int) -> _Ticket:
+        self._loop = asyncio.get_running_loop()
+        ticket = _Ticket(session_id, tokens, self._loop.create_future())
+        self._sessions.setdefault(session_id, deque()).append(ticket)
+        self._dispatch()
+        return ticket
+
+    def cancel(self, ticket: _Ticket) -> None:
+        """Withdraw a waiting ticket, or release it if it was admitted meanwhile."""
+        if ticket.future.done():
+            self.release(ticket)
+            return
+        ticket.future.cancel()
+        tickets = self._sessions.get(ticket.session_id)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._sessions[ticket.session_id]
+        self._dispatch()
+
+    def release(self, ticket: _Ticket, used_tokens: Optional[int] = None) -> None:
+        """Free the slot of an admitted ticket and settle its token estimate."""
+        self.running -= 1
+        if self.limits.tokens_per_minute and used_tokens is not None:
+            self._refill()
+            self._tokens = min(float(self.limits.tokens_per_minute), self._tokens + ticket.tokens - used_tokens)
+        self._dispatch()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        rate = (self.limits.tokens_per_minute or 0) / 60.0
+        self._tokens = min(float(self.limits.tokens_per_minute or 0), self._tokens + (now - self._refilled) * rate)
+        self._refilled = now
+
+    def _wake_in(self, seconds: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self._loop.call_later(max(seconds, 0.01), self._dispatch)
+
+    def _dispatch(self) -> None:
+        """Admit waiting tickets round-robin while the limits allow; runs on the tickets' loop."""
+        self._apply_pending()
+        now = time.monotonic()
+        if self.paused_until > now:
+            if self._sessions:
+                self._wake_in(self.paused_until - now)
+            return
+
+        while self._sessions:
+            if self.limits.max_concurrency and self.running >= self.limits.max_concurrency:
+                return
+            session_id, tickets = next(iter(self._sessions.items()))
+            ticket = tickets[0]
+
+            budget = self.limits.tokens_per_minute
+            if budget:
+                self._refill()
+                # A single run larger than the whole budget only waits for a full bucket
+                needed = min(ticket.tokens, budget)
+                if self._tokens < needed:
+                    self._wake_in((needed - self._tokens) / (budget / 60.0))
+                    return
+                self._tokens -= ticket.tokens
+
+            tickets.popleft()
+            if tickets:
+                self._sessions.move_to_end(session_id)
+            else:
+                del self._sessions[session_id]
+            self.running += 1
+            ticket.future.set_result(None)
+
+
+class RequestScheduler:
+    """Process-wide admission control for agent runs, one queue per provider."""
+
+    def __init__(self) -> None:
+        self._queues: Dict[str, ProviderQueue] = {}
+
+    def configure(self, provider: str, limits: ProviderLimits) -> None:
+        """Set the limits of a provider."""
+        queue = self._queues.get(provider)
+        if queue is None:
+            self._queues[provider] = ProviderQueue(provider, limits)
+        else:
+            queue.configure(limits)
+
+    def queue_for(self, provider: str) -> ProviderQueue:
+        if provider not in self._queues:
+            self._queues[provider] = ProviderQueue(provider, ProviderLimits())
+        return self._queues[provider]
+
+    def observe_response(self, provider: str, response: httpx.Response) -> None:
+        """Pause a provider when one of its responses is a 429."""
+        if response.status_code != 429:
+            return
+        retry_after = parse_retry_after(response.headers)
+        self.queue_for(provider).pause(DEFAULT_RATE_LIMIT_PAUSE if retry_after is None else retry_after)
+        get_metrics_registry().inc("agent_rate_limited_total", "429 responses by provider.", provider=provider)
+
+    def _update_gauges(self, queue: ProviderQueue) -> None:
+        registry = get_metrics_registry()
+        registry.set_gauge("agent_scheduler_running", "Admitted runs by provider.", queue.running, provider=queue.provider)
+        registry.set_gauge("agent_scheduler_queued", "Waiting runs by provider.", queue.waiting, provider=queue.provider)
+
+    def _settle(self, queue: ProviderQueue, ticket: _Ticket, admitted: bool, metrics: Optional[TurnMetrics]) -> None:
+        if admitted:
+            # Keep the estimate when the provider reported no usage
+            used = metrics.input_tokens + metrics.output_tokens if metrics is not None else 0
+            queue.release(ticket, used or None)
+        else:
+            queue.cancel(ticket)
+        self._update_gauges(queue)
+
+    def _observe_wait(self, queue: ProviderQueue, ticket: _Ticket) -> float:
+        waited = time.monotonic() - ticket.enqueued
+        get_metrics_registry().observe(
+            "agent_scheduler_wait_seconds", "Time runs waited for admission.", waited, provider=queue.provider
+        )
+        self._update_gauges(queue)
+        return waited
+
+    @contextlib.asynccontextmanager
+    async def admitted(
+        self,
+        provider: str,
+        session_id: str,
+        prompt,
+        metrics: Optional[TurnMetrics] = None,
+    ) -> AsyncIterator[None]:
+        """
+        Hold an admission for the duration of the block, waiting silently for it.
+
+        Args:
+            provider: The provider the run goes to
+            session_id: Identifies the session for fair queueing
+            prompt: The agent input, used to estimate the token cost
+            metrics: Metrics of the run; their token counts settle the estimate
+        """
+        queue = self.queue_for(provider)
+        ticket = queue.enqueue(session_id, estimate_request_tokens(prompt))
+        admitted = False
+        try:
+            self._update_gauges(queue)
+            await asyncio.wait([ticket.future])
+            admitted = True
+            self._observe_wait(queue, ticket)
+            yield
+        finally:
+            self._settle(queue, ticket, admitted, metrics)
+
+    async def stream(
+        self,
+        provider: str,
+        session_id: str,
+        prompt,
+        start: Callable[[], AsyncGenerator[Dict, None]],
+        metrics: Optional[TurnMetrics] = None,
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        Wait for admission, then pass the response stream through.
+
+        Args:
+            provider: The provider the run goes to
+            session_id: Identifies the session for fair queueing
+            prompt: The agent input, used to estimate the token cost
+            start: Creates the response stream once admitted
+            metrics: Metrics of the run; their token counts settle the estimate
+
+        Yields:
+            Status chunks while queued, then the chunks of the response stream
+        """
+        queue = self.queue_for(provider)
+        ticket = queue.enqueue(session_id, estimate_request_tokens(prompt))
+        admitted = False
+        try:
+            # Report the queue position until admitted
+            last_position = None
+            while not ticket.future.done():
+                self._update_gauges(queue)
+                position = queue.position(ticket)
+                if position != last_position:
+                    last_position = position
+                    yield {"status": "queued", "provider": provider, "position": position}
+                await asyncio.wait([ticket.future], timeout=STATUS_INTERVAL)
+            admitted = True
+
+            waited = self._observe_wait(queue, ticket)
+            if last_position is not None:
+                yield {"status": "running", "provider": provider}
+                yield {"step": f"⏳ Queued {waited:.1f}s for **{provider}**"}
+
+            async for chunk in start():
+                yield chunk
+        finally:
+            self._settle(queue, ticket, admitted, metrics)
+
+
+_scheduler = RequestScheduler()
+
+
+def get_request_scheduler() -> RequestScheduler:
+    """Return the process-wide request scheduler."""
+    return _scheduler
@@ -0,0 +1,292 @@
+"""
+This module speculatively runs the likely specialist while the triage agent decides.
+
+A triage turn normally costs two model round trips: the triage agent generates
+its handoff, then the specialist starts. With speculation, the specialist the
+session most likely gets next is started on the same input at the same time.
+If triage hands off to it, the speculative run is kept (its output has usually
+been generated already) and the triage run is cancelled; otherwise the
+speculative run is cancelled and the turn continues on the triage run. The
+prediction uses the local keyword classifier and, per session, which
+specialists followed which (the triage prompt asks to switch styles each
+time). Hits and misses, and the tokens spent on misses, are exported as
+metrics.
+"""
+import asyncio
+import logging
+import threading
+from collections import Counter, OrderedDict, deque
+from typing import AsyncGenerator, Deque, Dict, List, Optional, Tuple
+
+from openai.types.responses import ResponseCompletedEvent, ResponseTextDeltaEvent
+from agents import Agent, RunConfig, Runner
+
+from src.agent.agent import AgentGraph
+from src.agent.messages import Handoff, compact_step, format_handoff
+from src.agent.metrics import TurnMetrics, TurnMetricsHooks, get_metrics_registry
+from src.agent.pipeline import add_prompt_usage, cancel_run
+from src.agent.router import Classifier, KeywordClassifier
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = 10000
+SESSION_HISTORY = 8
+
+_DONE = object()
+
+#------------------------------------------------------------------------------
+# PREDICTION
+#------------------------------------------------------------------------------
+
+class Speculator:
+    """Predicts the specialist of a triage turn from the session's routing history."""
+
+    def __init__(self, classifier: Optional[Classifier] = None, max_sessions: int = DEFAULT_MAX_SESSIONS) -> None:
+        """
+        Args:
+            classifier: Local intent classifier used as the first hint
+            max_sessions: Sessions whose routing history is kept, least recently used dropped first
+        """
+        # A miss only costs tokens, so a single keyword is hint enough here
+        self.classifier = classifier or KeywordClassifier(min_hits=1)
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Deque[str]]" = OrderedDict()
+        self._transitions: Dict[str, Counter] = {}
+        self._targets: Counter = Counter()
+
+    def predict(self, session_id: str, graph: AgentGraph, messages: List[Dict]) -> Optional[Agent]:
+        """
+        Pick the specialist to start alongside the triage agent.
+
+        Args:
+            session_id: Identifies the session whose routing history is used
+            graph: The agent graph of the turn
+            messages: The conversation in agent input format
+
+        Returns:
+            The predicted specialist, or None without any hint
+        """
+        text = next(
+            (message.get("content", "") for message in reversed(messages) if message.get("role") == "user"),
+            "",
+        )
+        target, confidence = self.classifier.classify(text)
+        if target in graph.specialists and confidence > 0:
+            return graph.specialists[target]
+
+        by_name = {agent.name: agent for agent in graph.specialists.values()}
+        with self._lock:
+            history = self._sessions.get(session_id)
+            previous = history[-1] if history else None
+            # Triage switches styles, so what usually follows the last specialist beats the overall favourite
+            for counts in (self._transitions.get(previous), self._targets):
+                for name, _ in (counts or Counter()).most_common():
+                    if name in by_name and name != previous:
+                        return by_name[name]
+        return None
+
+    def record(self, session_id: str, steps: List[str]) -> Optional[str]:
+        """
+        Learn from the handoff of a finished triage turn.
+
+        Args:
+            session_id: The session of the turn
+            steps: The turn's steps; the first handover is the triage decision
+
+        Returns:
+            The specialist the turn was handed to, if any
+        """
+        target = next((step.target for step in map(compact_step, steps) if isinstance(step, Handoff)), None)
+        if target is None:
+            return None
+        with self._lock:
+            history = self._sessions.pop(session_id, None) or deque(maxlen=SESSION_HISTORY)
+            if history:
+                self._transitions.setdefault(history[-1], Counter())[target] += 1
+            history.append(target)
+            self._sessions[session_id] = history
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._targets[target] += 1
+        return target
+
+#------------------------------------------------------------------------------
+# SPECULATIVE RUN
+#------------------------------------------------------------------------------
+
+def _record_outcome(outcome: str) -> None:
+    registry = get_metrics_registry()
+    registry.inc("agent_speculations_total", "Speculative specialist runs by outcome.", outcome=outcome)
+    hits = registry.get("agent_speculations_total", outcome="hit")
+    decided = hits + registry.get("agent_speculations_total", outcome="miss")
+    if decided:
+        registry.set_gauge("agent_speculation_hit_ratio", "Share of decided speculative runs that were kept.", hits / decided)
+
+
+def _usage_tokens(raw_responses) -> Tuple[int, int]:
+    usage = TurnMetrics(provider="", model=None)
+    usage.add_usage(raw_responses)
+    return usage.input_tokens, usage.output_tokens
+
+
+async def speculative_response_stream(
+    triage: Agent,
+    specialist: Agent,
+    prompt,
+    run_config: Optional[RunConfig] = None,
+    metrics: Optional[TurnMetrics] = None,
+) -> AsyncGenerator[Dict, None]:
+    """
+    Runs the triage agent and a predicted specialist at once and yields the chunks of the run that is kept.
+
+    Args:
+        triage: The triage agent
+        specialist: The specialist predicted to receive the handoff
+        prompt: The agent input
+        run_config: Run configuration used for both runs
+        metrics: Metrics of the turn; a kept speculative run is merged into them
+
+    Yields:
+        Step and delta chunks as `generate_response_stream` does
+    """
+    speculative_metrics = TurnMetrics(provider=metrics.provider, model=metrics.model) if metrics else None
+    runs = {
+        "triage": Runner.run_streamed(
+            triage, input=prompt, run_config=run_config, hooks=TurnMetricsHooks(metrics) if metrics else None
+        ),
+        "speculative": Runner.run_streamed(
+            specialist, input=prompt, run_config=run_config,
+            hooks=TurnMetricsHooks(speculative_metrics) if speculative_metrics else None,
+        ),
+    }
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump(name: str) -> None:
+        try:
+            async for event in runs[name].stream_events():
+                await queue.put((name, event))
+        except Exception as exc:
+            await queue.put((name, exc))
+        else:
+            await queue.put((name, _DONE))
+
+    tasks = {name: asyncio.ensure_future(pump(name)) for name in runs}
+    kept: Optional[str] = None  # decided once triage hands off or starts answering
+    buffered: List[Dict] = []
+    speculation_failed = False
+    current_agent = triage.name
+    run_agents = {"triage": triage, "speculative": specialist}  # the agent each run is on
+    finished = set()
+    error = None
+
+    def drop(name: str) -> None:
+        tasks[name].cancel()
+        finished.add(name)
+
+    def decide(name: str) -> None:
+        nonlocal kept
+        kept = name
+        if name == "triage":
+            drop("speculative")
+            _record_outcome("failed" if speculation_failed else "miss")
+        else:
+            drop("triage")
+            _record_outcome("hit")
+
+    def chunk_of(event) -> Optional[Dict]:
+        if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+            if metrics is not None:
+                metrics.mark_first_token()
+            return {"delta": event.data.delta}
+        return None
+
+    try:
+        while kept not in finished and not (kept is None and "triage" in finished):
+            name, item = await queue.get()
+            if name in finished:
+                continue  # output of a run that was already cancelled
+            if isinstance(item, Exception):
+                if name == "speculative" and kept is None:
+                    logger.warning("speculative run of %s failed: %s", specialist.name, item)
+                    speculation_failed = True
+                    finished.add(name)
+                    continue
+                raise item
+            if item is _DONE:
+                finished.add(name)
+                continue
+            if item.type == "agent_updated_stream_event":
+                run_agents[name] = item.new_agent
+            elif item.type == "raw_response_event" and isinstance(item.data, ResponseCompletedEvent):
+                run_metrics = metrics if name == "triage" else speculative_metrics
+                if run_metrics is not None:
+                    add_prompt_usage(run_metrics, item.data, run_agents[name])
+
+            if name == "speculative":
+                if kept is None:
+                    # Held back until triage confirms the prediction
+                    if item.type == "raw_response_event" and isinstance(item.data, ResponseTextDeltaEvent):
+                        buffered.append({"delta": item.data.delta})
+                else:
+                    chunk = chunk_of(item)
+                    if chunk is not None:
+                        yield chunk
+                continue
+
+            # Events of the triage run decide which run is kept
+            if item.type == "agent_updated_stream_event" and item.new_agent.name != current_agent:
+                yield {"step": format_handoff(current_agent, item.new_agent.name)}
+                current_agent = item.new_agent.name
+                if kept is None:
+                    if current_agent == specialist.name and not speculation_failed:
+                        decide("speculative")
+                        yield {"step": f"🔮 Speculative run of **{specialist.name}** kept"}
+                        for chunk in buffered:
+                            if metrics is not None:
+                                metrics.mark_first_token()
+                            yield chunk
+                        buffered = []
+                    else:
+                        decide("triage")
+                        yield {"step": f"🔮 Speculated **{specialist.name}**, triage chose **{current_agent}**"}
+                continue
+
+            chunk = chunk_of(item)
+            if chunk is not None:
+                if kept is None:
+                    decide("triage")  # triage answered by itself
+                yield chunk
+
+        if kept is None:
+            # Triage finished without a handoff or any text
+            decide("triage")
+    except (Exception, asyncio.CancelledError) as exc:
+        error = exc
+        raise
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        for run in runs.values():
+            if not run.is_complete:
+                cancel_run(run)
+        if kept == "speculative":
+            if metrics is not None:
+                metrics.add_usage(runs["triage"].raw_responses)
+                metrics.add_usage(runs["speculative"].raw_responses)
+                metrics.cached_tokens += speculative_metrics.cached_tokens
+                metrics.instruction_tokens += speculative_metrics.instruction_tokens
+                # The specialist as started by the cancelled triage run never answered
+                metrics.agents[:] = [t for t in metrics.agents if t.name != specialist.name]
+                metrics.agents.extend(speculative_metrics.agents)
+                metrics.tools.extend(speculative_metrics.tools)
+        else:
+            wasted = sum(_usage_tokens(runs["speculative"].raw_responses))
+            if wasted:
+                get_metrics_registry().inc(
+                    "agent_speculation_wasted_tokens_total", "Tokens spent on discarded speculative runs.", wasted
+                )
+            if metrics is not None:
+                metrics.add_usage(runs["triage"].raw_responses)
+        if metrics is not None:
+            metrics.finish(error)
@@ -0,0 +1,211 @@
+"""
+This module persists conversations so they survive reruns and restarts.
+
+Messages are written incrementally as they are added (with their steps), and
+feedback and the rolling history summary are updated in place. A stored message
+is never overwritten: when two tabs continue the same conversation, the write
+of the tab that is behind is rejected instead of silently replacing the other
+tab's messages. The SQLite
+backend can be shared by several worker processes; the memory backend keeps
+conversations for the lifetime of the process only.
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Protocol
+
+from src.agent.history import ConversationSummary
+
+DEFAULT_PAGE_SIZE = 20
+
+
+class ConversationStore(Protocol):
+    """Backend interface of the conversation store."""
+
+    def load_messages(self, conversation_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """Messages in order, starting at `offset`."""
+        ...
+
+    def count_messages(self, conversation_id: str) -> int:
+        ...
+
+    def append_message(self, conversation_id: str, index: int, message: Dict) -> bool:
+        """
+        Store the message at position `index`.
+
+        Returns:
+            False if that position already holds a message
+
+        Raises:
+            ValueError: If `index` is past the end, which would leave a gap
+        """
+        ...
+
+    def set_feedback(self, conversation_id: str, index: int, feedback: Optional[int]) -> None:
+        ...
+
+    def load_summary(self, conversation_id: str) -> Optional[ConversationSummary]:
+        ...
+
+    def save_summary(self, conversation_id: str, summary: ConversationSummary) -> None:
+        ...
+
+
+def _check_no_gap(index: int, count: int) -> None:
+    """Positions are offsets into the conversation, so a message may only go right after the last one."""
+    if index > count:
+        raise ValueError(f"cannot store message {index} after only {count} messages")
+
+
+def _stored_fields(message: Dict) -> Dict:
+    return {
+        "role": message.get("role", "user"),
+        "content": message.get("content", ""),
+        "emoji": message.get("emoji"),
+        "steps": list(message.get("steps") or []),
+        "feedback": message.get("feedback"),
+    }
+
+
+class MemoryConversationStore:
+    """Process-local store, lost on restart."""
+
+    def __init__(self) -> None:
+        self._messages: Dict[str, List[Dict]] = {}
+        self._summaries: Dict[str, ConversationSummary] = {}
+        self._lock = threading.Lock()
+
+    def load_messages(self, conversation_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            messages = self._messages.get(conversation_id, [])
+            end = None if limit is None else offset + limit
+            return [dict(message) for message in messages[offset:end]]
+
+    def count_messages(self, conversation_id: str) -> int:
+        with self._lock:
+            return len(self._messages.get(conversation_id, []))
+
+    def append_message(self, conversation_id: str, index: int, message: Dict) -> bool:
+        with self._lock:
+            messages = self._messages.setdefault(conversation_id, [])
+            if index < len(messages):
+                return False
+            _check_no_gap(index, len(messages))
+            messages.append(_stored_fields(message))
+            return True
+
+    def set_feedback(self, conversation_id: str, index: int, feedback: Optional[int]) -> None:
+        with self._lock:
+            messages = self._messages.get(conversation_id, [])
+            if index < len(messages):
+                messages[index]["feedback"] = feedback
+
+    def load_summary(self, conversation_id: str) -> Optional[ConversationSummary]:
+        with self._lock:
+            summary = self._summaries.get(conversation_id)
+            return ConversationSummary(summary.text, summary.folded) if summary else None
+
+    def save_summary(self, conversation_id: str, summary: ConversationSummary) -> None:
+        with self._lock:
+            self._summaries[conversation_id] = ConversationSummary(summary.text, summary.folded)
+
+
+class SQLiteConversationStore:
+    """Conversation store in a SQLite file, shareable between worker processes."""
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "conversation_id TEXT NOT NULL, idx INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+            "emoji TEXT, steps TEXT NOT NULL, feedback INTEGER, created REAL NOT NULL, "
+            "PRIMARY KEY (conversation_id, idx))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "conversation_id TEXT PRIMARY KEY, summary TEXT NOT NULL, folded INTEGER NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def load_messages(self, conversation_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content, emoji, steps, feedback FROM messages "
+                "WHERE conversation_id = ? AND idx >= ? ORDER BY idx LIMIT ?",
+                (conversation_id, offset, -1 if limit is None else limit),
+            ).fetchall()
+        return [
+            {"role": role, "content": content, "emoji": emoji, "steps": json.loads(steps), "feedback": feedback}
+            for role, content, emoji, steps, feedback in rows
+        ]
+
+    def count_messages(self, conversation_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+        return row[0]
+
+    def append_message(self, conversation_id: str, index: int, message: Dict) -> bool:
+        fields = _stored_fields(message)
+        with self._lock:
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()[0]
+            _check_no_gap(index, count)
+            # Another tab (or worker) may have written this position already; keep its message
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO messages (conversation_id, idx, role, content, emoji, steps, feedback, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    conversation_id, index, fields["role"], fields["content"], fields["emoji"],
+                    json.dumps(fields["steps"], ensure_ascii=False), fields["feedback"], time.time(),
+                ),
+            )
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    def set_feedback(self, conversation_id: str, index: int, feedback: Optional[int]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE messages SET feedback = ? WHERE conversation_id = ? AND idx = ?",
+                (feedback, conversation_id, index),
+            )
+            self._conn.commit()
+
+    def load_summary(self, conversation_id: str) -> Optional[ConversationSummary]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, folded FROM conversations WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+        return ConversationSummary(row[0], row[1]) if row else None
+
+    def save_summary(self, conversation_id: str, summary: ConversationSummary) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversations (conversation_id, summary, folded, updated) "
+                "VALUES (?, ?, ?, ?)",
+                (conversation_id, summary.text, summary.folded, time.time()),
+            )
+            self._conn.commit()
+
+
+def create_conversation_store(backend: str = "sqlite", path: str = "conversations.sqlite3") -> ConversationStore:
+    """
+    Create a conversation store backend.
+
+    Args:
+        backend: "sqlite" or "memory"
+        path: SQLite database file, used by the sqlite backend
+
+    Returns:
+        The store backend
+    """
+    if backend == "sqlite":
+        return SQLiteConversationStore(path)
+    if backend == "memory":
+        return MemoryConversationStore()
+    raise ValueError(f"Unknown conversation store backend: {backend}")
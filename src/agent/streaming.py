@@ -0,0 +1,100 @@
+"""
+This module streams agent runs from providers that only speak chat completions.
+
+The SDK turns chat completions chunks into the Responses stream events that
+`Runner.run_streamed` consumes, but it assumes OpenAI's chunk layout. Some
+OpenAI-compatible endpoints (Anthropic's among them) repeat the tool call id
+and name in every chunk, leave out the tool call index, or send usage before
+a final chunk without it; the SDK then concatenates names like
+"transfer_to_xtransfer_to_x" and loses the token counts, so handoffs and tool
+calls fail while streaming. The model here repairs each chunk before the SDK
+sees it, which lets every provider use the same streamed response path.
+"""
+from typing import AsyncIterator, Dict, Optional
+
+from agents import Model, ModelProvider, OpenAIChatCompletionsModel
+from agents.models.openai_provider import DEFAULT_MODEL
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletionChunk
+from openai.types.completion_usage import CompletionUsage
+
+
+class _ToolCallState:
+    """What has been received so far for one streamed tool call."""
+
+    def __init__(self) -> None:
+        self.id = ""
+        self.name = ""
+
+
+async def normalize_chunks(stream: AsyncIterator[ChatCompletionChunk]) -> AsyncIterator[ChatCompletionChunk]:
+    """
+    Repair chat completions chunks into the layout the SDK's stream handler expects.
+
+    Tool call ids and names are only passed on once, missing tool call indices
+    are derived from the call id, and the last usage seen is kept on every
+    following chunk.
+
+    Args:
+        stream: Chunks as received from the provider
+
+    Yields:
+        The same chunks, repaired in place
+    """
+    usage: Optional[CompletionUsage] = None
+    calls: Dict[int, _ToolCallState] = {}
+    index_by_id: Dict[str, int] = {}
+    last_index = 0
+
+    async for chunk in stream:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        else:
+            chunk.usage = usage
+
+        for choice in chunk.choices or []:
+            for tool_call in (choice.delta.tool_calls if choice.delta else None) or []:
+                if tool_call.index is None:
+                    if tool_call.id and tool_call.id not in index_by_id:
+                        tool_call.index = len(calls)
+                    else:
+                        tool_call.index = index_by_id.get(tool_call.id, last_index)
+                last_index = tool_call.index
+                state = calls.setdefault(tool_call.index, _ToolCallState())
+
+                if tool_call.id:
+                    index_by_id[tool_call.id] = tool_call.index
+                    if state.id:
+                        tool_call.id = None  # repeated in a later chunk
+                    else:
+                        state.id = tool_call.id
+                if tool_call.function is not None and tool_call.function.name:
+                    if state.name and tool_call.function.name == state.name:
+                        tool_call.function.name = None
+                    else:
+                        state.name += tool_call.function.name
+        yield chunk
+
+
+class StreamingChatCompletionsModel(OpenAIChatCompletionsModel):
+    """Chat completions model whose streamed chunks are normalized before use."""
+
+    # _fetch_response is private to the SDK: its signature and its (response, stream)
+    # result are those of openai-agents==0.0.12, which requirements.txt pins for that
+    # reason; tests/test_streaming.py fails if a streamed run no longer goes through it
+    async def _fetch_response(self, *args, stream: bool = False, **kwargs):
+        result = await super()._fetch_response(*args, stream=stream, **kwargs)
+        if not stream:
+            return result
+        response, chunks = result
+        return response, normalize_chunks(chunks)
+
+
+class ChatCompletionsProvider(ModelProvider):
+    """Model provider for chat completions providers, bound to a pooled client."""
+
+    def __init__(self, openai_client: AsyncOpenAI) -> None:
+        self._client = openai_client
+
+    def get_model(self, model_name: Optional[str]) -> Model:
+        return StreamingChatCompletionsModel(model=model_name or DEFAULT_MODEL, openai_client=self._client)
@@ -0,0 +1,105 @@
+"""
+This module counts the tokens of agent prompts.
+
+Every model call sends the instructions of the agent it runs, and with the
+handoff prompt prepended those blocks are most of a short prompt. Their token
+counts are computed once per (model, instructions) when a graph is built and
+cached, so each turn can report how much of its prompt was instructions without
+tokenizing anything on the hot path. Counts use tiktoken when it is installed
+and fall back to the estimate history.py budgets with.
+"""
+import logging
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from agents import Agent
+
+from src.agent.agent import AgentGraph
+from src.agent.history import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:  # optional; counts are estimated without it
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Encoding of the current OpenAI models, used for models tiktoken does not know
+FALLBACK_ENCODING = "o200k_base"
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: Optional[str]) -> Any:
+    """The tiktoken encoding of a model, or None to estimate."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model or "")
+    except KeyError:
+        pass
+    try:
+        return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as exc:
+        # Encodings are downloaded on first use, which fails offline
+        logger.warning("no tiktoken encoding for %s, estimating token counts: %s", model, exc)
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Count the tokens of a text for a model.
+
+    Args:
+        text: The text to count
+        model: The model whose tokenizer is used
+
+    Returns:
+        The exact count with tiktoken, else the estimate of history.estimate_tokens
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+@lru_cache(maxsize=1024)
+def _instruction_tokens(model: Optional[str], instructions: str) -> int:
+    return count_tokens(instructions, model)
+
+
+def instruction_tokens(agent: Agent, model: Optional[str] = None) -> Optional[int]:
+    """
+    Tokens of an agent's instructions, counted once per model and instruction text.
+
+    Args:
+        agent: The agent
+        model: The model the instructions are sent to, defaults to the agent's model
+
+    Returns:
+        The count, or None for instructions computed per run
+    """
+    if not isinstance(agent.instructions, str):
+        return None
+    if model is None and isinstance(agent.model, str):
+        model = agent.model
+    return _instruction_tokens(model, agent.instructions)
+
+
+def precompute_instruction_tokens(graph: AgentGraph, model: Optional[str] = None) -> Dict[str, int]:
+    """
+    Count the instructions of every agent in a graph, so turns only hit the cache.
+
+    Args:
+        graph: The agent graph
+        model: The model of the graph
+
+    Returns:
+        The instruction tokens by agent name
+    """
+    counts = {}
+    for agent in (graph.triage, *graph.specialists.values()):
+        tokens = instruction_tokens(agent, model)
+        if tokens is not None:
+            counts[agent.name] = tokens
+    logger.debug("instruction tokens for %s: %s", model, counts)
+    return counts
@@ -0,0 +1,226 @@
+"""
+This module runs the function tools of the agent graph.
+
+`@function_tool` calls a synchronous tool function directly on the event loop,
+so a slow tool would stall every stream sharing the client loop. Every function
+tool in the graph is wrapped here. Synchronous tools run in a bounded thread
+pool, every call has a timeout, and idempotent tools can have their results
+cached for a TTL. Call outcomes, execution time and cache hits are exported
+per tool as metrics. Policies are looked up by tool name on every call, so they
+can be changed without rebuilding the agent graph.
+"""
+import asyncio
+import contextvars
+import dataclasses
+import inspect
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from agents import FunctionTool, RunContextWrapper, Tool
+
+from src.agent.metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TOOL_TIMEOUT = 30.0
+DEFAULT_CACHE_ENTRIES = 1000
+
+_MISS = object()
+
+# Start of the message the SDK's default failure handler reports a tool error with
+_TOOL_ERROR_PREFIX = "An error occurred while running the tool"
+
+
+@dataclass(frozen=True)
+class ToolPolicy:
+    """How calls of one tool are run."""
+    timeout: Optional[float] = DEFAULT_TOOL_TIMEOUT  # seconds, None for no limit
+    cache_ttl: float = 0.0  # seconds a result is reused for the same arguments, 0 to never cache
+
+
+def tool_function(tool: FunctionTool) -> Optional[Callable]:
+    """
+    The Python function behind a tool made with `@function_tool`, if it can be found.
+
+    The SDK keeps it in the closure of the tool's invoke function. The closure
+    names are internals of openai-agents==0.0.12, which requirements.txt pins for
+    that reason; tests/test_tools.py fails if they change.
+    """
+    try:
+        invoke = inspect.getclosurevars(tool.on_invoke_tool).nonlocals.get("_on_invoke_tool_impl")
+        return inspect.getclosurevars(invoke).nonlocals.get("the_func") if invoke else None
+    except TypeError:
+        return None
+
+
+class ToolExecutor:
+    """Runs function tool calls with thread offloading, timeouts and result caching."""
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, max_cache_entries: int = DEFAULT_CACHE_ENTRIES) -> None:
+        self.max_workers = max_workers
+        self.max_cache_entries = max_cache_entries
+        self.default_policy = ToolPolicy()
+        self._policies: Dict[str, ToolPolicy] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+
+    def configure(
+        self,
+        max_workers: int,
+        default_policy: ToolPolicy,
+        policies: Optional[Mapping[str, ToolPolicy]] = None,
+    ) -> None:
+        """Apply new settings, e.g. after the secrets changed; a new pool size replaces the thread pool."""
+        with self._lock:
+            if max_workers != self.max_workers and self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            self.max_workers = max_workers
+            self.default_policy = default_policy
+            self._policies = dict(policies or {})
+
+    def policy_for(self, name: str) -> ToolPolicy:
+        return self._policies.get(name, self.default_policy)
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        """The thread pool for synchronous tools, started on first use."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="agent-tool")
+            return self._pool
+
+    def wrap(self, tool: Tool) -> Tool:
+        """
+        Route the calls of a function tool through the executor.
+
+        Args:
+            tool: Any tool; only function tools are wrapped, and only once
+
+        Returns:
+            A copy of the tool whose calls go through the executor
+        """
+        if not isinstance(tool, FunctionTool) or getattr(tool.on_invoke_tool, "__tool_executor__", None) is self:
+            return tool
+        func = tool_function(tool)
+        if func is None:
+            # The SDK keeps the function in private closures that may change between versions
+            logger.warning(
+                "cannot find the function behind tool %s; its calls stay on the event loop, "
+                "where a synchronous function would block it", tool.name,
+            )
+        # Unknown functions are assumed to be async and stay on the loop
+        blocking = func is not None and not inspect.iscoroutinefunction(func)
+        invoke = tool.on_invoke_tool
+
+        async def on_invoke_tool(context: RunContextWrapper[Any], arguments: str) -> Any:
+            return await self.invoke(tool.name, invoke, blocking, context, arguments)
+
+        on_invoke_tool.__tool_executor__ = self
+        return dataclasses.replace(tool, on_invoke_tool=on_invoke_tool)
+
+    async def invoke(
+        self,
+        name: str,
+        invoke: Callable,
+        blocking: bool,
+        context: RunContextWrapper[Any],
+        arguments: str,
+    ) -> Any:
+        """
+        Run one tool call under the tool's policy.
+
+        Args:
+            name: The tool name
+            invoke: The SDK's invoke function of the tool
+            blocking: Whether the tool function is synchronous and runs in the thread pool
+            context: The run context of the call
+            arguments: The arguments from the model, as a JSON string
+
+        Returns:
+            The tool output; a timeout is reported to the model as a message
+        """
+        policy = self.policy_for(name)
+        registry = get_metrics_registry()
+        key = (name, _normalize_arguments(arguments))
+        if policy.cache_ttl > 0:
+            cached = self._cache_get(key)
+            hit = cached is not _MISS
+            registry.inc("agent_tool_cache_total", "Tool result cache lookups.", tool=name, result="hit" if hit else "miss")
+            if hit:
+                return cached
+
+        started = time.perf_counter()
+        if blocking:
+            # The SDK's invoke (argument parsing and error handling included) runs on its own loop in a worker thread
+            def run() -> Any:
+                return asyncio.run(invoke(context, arguments))
+
+            awaitable = asyncio.get_running_loop().run_in_executor(self.pool, contextvars.copy_context().run, run)
+        else:
+            awaitable = invoke(context, arguments)
+        try:
+            result = await asyncio.wait_for(awaitable, policy.timeout)
+        except asyncio.TimeoutError:
+            # A timed-out thread cannot be stopped; it finishes in the background and its result is dropped
+            logger.warning("tool %s timed out after %.1fs", name, policy.timeout)
+            registry.inc("agent_tool_calls_total", "Tool calls by outcome.", tool=name, outcome="timeout")
+            return f"The tool {name} did not answer within {policy.timeout:g} seconds."
+        except Exception:
+            registry.inc("agent_tool_calls_total", "Tool calls by outcome.", tool=name, outcome="error")
+            raise
+        finally:
+            registry.observe(
+                "agent_tool_execution_seconds", "Tool execution time, cache hits excluded.",
+                time.perf_counter() - started, tool=name,
+            )
+
+        failed = isinstance(result, str) and result.startswith(_TOOL_ERROR_PREFIX)
+        registry.inc("agent_tool_calls_total", "Tool calls by outcome.", tool=name, outcome="error" if failed else "ok")
+        if policy.cache_ttl > 0 and not failed:
+            self._cache_set(key, result, policy.cache_ttl)
+        return result
+
+    def _cache_get(self, key: Tuple[str, str]) -> Any:
+        """The cached result of a call, or _MISS."""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return _MISS
+            expires, result = entry
+            if expires < time.monotonic():
+                del self._cache[key]
+                return _MISS
+            self._cache.move_to_end(key)
+            return result
+
+    def _cache_set(self, key: Tuple[str, str], result: Any, ttl: float) -> None:
+        with self._lock:
+            self._cache[key] = (time.monotonic() + ttl, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+
+
+def _normalize_arguments(arguments: str) -> str:
+    """Arguments as canonical JSON, so key order and spacing do not defeat the cache."""
+    try:
+        return json.dumps(json.loads(arguments or "{}"), sort_keys=True, separators=(",", ":"))
+    except json.JSONDecodeError:
+        return arguments
+
+
+_tool_executor = ToolExecutor()
+
+
+def get_tool_executor() -> ToolExecutor:
+    """Return the process-wide tool executor."""
+    return _tool_executor
@@ -0,0 +1,134 @@
+"""
+This module tracks the in-flight turn of each session so it can be cancelled.
+
+Every turn gets a TurnHandle. The futures running the turn are attached to it,
+and the chunks it produced so far are recorded on it. Cancelling the handle
+(because the session sent a new message, was closed, or asked to stop)
+cancels those futures. The cancellation reaches `Runner.run_streamed`, which
+stops the run and closes its HTTP stream, and the scheduler ticket of the run
+is released for sessions that are still waiting. The partial output stays on
+the handle, so it can be saved with a cancelled marker.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Dict, List, Optional, Union
+
+from src.agent.metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+CANCELLED_STEP = "⛔ Cancelled"
+
+# Why a turn was cancelled, used as the metric label
+SUPERSEDED = "superseded"      # the session sent a new message
+STOPPED = "stopped"            # the session was stopped or closed
+DISCONNECTED = "disconnected"  # the API client went away
+REQUESTED = "requested"        # the API client asked to cancel
+
+Future = Union[concurrent.futures.Future, asyncio.Future]
+
+
+def cancelled_step(reason: str) -> str:
+    """Markdown line marking a response as cut short."""
+    return f"{CANCELLED_STEP} ({reason})"
+
+
+class TurnHandle:
+    """One in-flight turn of a session."""
+
+    def __init__(self, session_id: str) -> None:
+        self.session_id = session_id
+        self.reason: Optional[str] = None
+        self._lock = threading.Lock()
+        self._futures: List[Future] = []
+        self._parts: List[str] = []
+        self._steps: List[str] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def attach(self, future: Future) -> None:
+        """Cancel the given future with the turn; it is cancelled at once if the turn already was."""
+        with self._lock:
+            if self.reason is None:
+                self._futures.append(future)
+                return
+        future.cancel()
+
+    def record(self, chunk: Dict) -> None:
+        """Keep a delta or step chunk of the response as part of the partial output."""
+        with self._lock:
+            if "delta" in chunk:
+                self._parts.append(chunk["delta"])
+            elif "step" in chunk:
+                self._steps.append(chunk["step"])
+
+    def partial(self) -> Dict:
+        """The output recorded so far, with a cancelled marker if the turn was cancelled."""
+        with self._lock:
+            steps = list(self._steps)
+            if self.reason is not None:
+                steps.append(cancelled_step(self.reason))
+            return {"response": "".join(self._parts), "steps": steps}
+
+    def cancel(self, reason: str) -> bool:
+        """
+        Cancel the turn and everything attached to it.
+
+        Args:
+            reason: Why the turn is cancelled, e.g. SUPERSEDED or DISCONNECTED
+
+        Returns:
+            True if this call cancelled the turn, False if it already was
+        """
+        with self._lock:
+            if self.reason is not None:
+                return False
+            self.reason = reason
+            futures, self._futures = self._futures, []
+        for future in futures:
+            future.cancel()
+        logger.info("cancelled turn of session %s (%s)", self.session_id, reason)
+        get_metrics_registry().inc("agent_turns_cancelled_total", "Turns cancelled before they finished.", reason=reason)
+        return True
+
+
+class TurnRegistry:
+    """The in-flight turn of every session in the process."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._turns: Dict[str, TurnHandle] = {}
+
+    def begin(self, session_id: str) -> TurnHandle:
+        """Start a turn for a session, cancelling the one it still has in flight."""
+        handle = TurnHandle(session_id)
+        with self._lock:
+            previous = self._turns.get(session_id)
+            self._turns[session_id] = handle
+        if previous is not None:
+            previous.cancel(SUPERSEDED)
+        return handle
+
+    def finish(self, handle: TurnHandle) -> None:
+        """Forget a turn once it ended, unless a newer turn of its session replaced it."""
+        with self._lock:
+            if self._turns.get(handle.session_id) is handle:
+                del self._turns[handle.session_id]
+
+    def cancel(self, session_id: str, reason: str) -> bool:
+        """Cancel the in-flight turn of a session, if any."""
+        with self._lock:
+            handle = self._turns.get(session_id)
+        return handle is not None and handle.cancel(reason)
+
+
+_turn_registry = TurnRegistry()
+
+
+def get_turn_registry() -> TurnRegistry:
+    """Return the process-wide turn registry."""
+    return _turn_registry
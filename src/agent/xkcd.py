@@ -0,0 +1,247 @@
+"""
+This module keeps a local index of XKCD comic metadata for the XKCD tool.
+
+Comics are fetched from the public JSON API (`/info.0.json`) with a shared,
+pooled async HTTP client with timeouts and retries, stored in an on-disk index,
+and prefetched in the background, so picking a random comic is normally a
+local lookup. The index can be seeded from a file to work offline.
+"""
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import random
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+
+import httpx
+
+XKCD_BASE_URL = os.environ.get("XKCD_BASE_URL", "https://xkcd.com")
+DEFAULT_INDEX_PATH = Path(
+    os.environ.get("XKCD_INDEX_PATH", Path.home() / ".cache" / "streamlit-agent" / "xkcd_index.json")
+)
+REQUEST_TIMEOUT = httpx.Timeout(5.0, connect=3.0)
+MAX_ATTEMPTS = 3
+PREFETCH_COUNT = 200
+PREFETCH_CONCURRENCY = 8
+PREFETCH_INTERVAL = 3600.0  # seconds between background refreshes
+
+logger = logging.getLogger(__name__)
+
+Future = Union[asyncio.Future, concurrent.futures.Future]
+
+
+def _log_failure(what: str) -> Callable[[Future], None]:
+    """Done-callback logging the error of a background task nobody awaits."""
+    def callback(task: Future) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("%s failed: %s", what, task.exception(), exc_info=task.exception())
+    return callback
+
+
+class XkcdIndex:
+    """On-disk index of comic metadata keyed by comic number."""
+
+    def __init__(self, path: Path = DEFAULT_INDEX_PATH, base_url: str = XKCD_BASE_URL) -> None:
+        self.path = Path(path)
+        self.base_url = base_url.rstrip("/")
+        self.latest: Optional[int] = None
+        self.comics: Dict[int, Dict] = {}
+        self._loaded = False
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._prefetch_task: Optional[asyncio.Task] = None
+        self._last_prefetch = 0.0
+
+    #--------------------------------------------------------------------------
+    # LOCAL INDEX
+    #--------------------------------------------------------------------------
+
+    def load(self) -> None:
+        """Load the index from disk, plus the seed file named by XKCD_INDEX_SEED."""
+        self._loaded = True
+        if self.path.exists():
+            self._merge_file(self.path)
+        seed_path = os.environ.get("XKCD_INDEX_SEED")
+        if seed_path:
+            self.seed(Path(seed_path))
+
+    def seed(self, path: Path) -> int:
+        """
+        Merge comics from a JSON file into the index.
+
+        Args:
+            path: A file in index format or a list of `info.0.json` records
+
+        Returns:
+            The number of comics in the index afterwards
+        """
+        self._merge_file(path)
+        return len(self.comics)
+
+    def save(self) -> None:
+        """Write the index to disk atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        data = {"latest": self.latest, "comics": {str(num): comic for num, comic in self.comics.items()}}
+        tmp_path.write_text(json.dumps(data))
+        os.replace(tmp_path, self.path)
+
+    def _merge_file(self, path: Path) -> None:
+        try:
+            data = json.loads(Path(path).read_text())
+        except (OSError, ValueError) as exc:
+            logger.warning("could not read XKCD index %s: %s", path, exc)
+            return
+        if isinstance(data, list):
+            records = [_comic_from_api(record) for record in data]
+        else:
+            records = list(data.get("comics", {}).values())
+            if data.get("latest"):
+                self.latest = max(self.latest or 0, data["latest"])
+        for comic in records:
+            self.comics[comic["num"]] = comic
+        if self.comics:
+            self.latest = max(self.latest or 0, max(self.comics))
+
+    #--------------------------------------------------------------------------
+    # NETWORK
+    #--------------------------------------------------------------------------
+
+    def _http_client(self) -> httpx.AsyncClient:
+        """Shared pooled client, recreated if used from a different event loop."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            if self._client is not None:
+                self._close_client(self._client, self._client_loop)
+            self._client = httpx.AsyncClient(
+                timeout=REQUEST_TIMEOUT,
+                transport=httpx.AsyncHTTPTransport(retries=2),
+                follow_redirects=True,
+            )
+            self._client_loop = loop
+        return self._client
+
+    @staticmethod
+    def _close_client(client: httpx.AsyncClient, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """Close a replaced client, on its own loop if that still runs."""
+        if loop is not None and loop.is_running():
+            closing = asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        else:
+            # Its loop is gone; release what can still be released from this one
+            closing = asyncio.ensure_future(client.aclose())
+        closing.add_done_callback(_log_failure("closing the XKCD client"))
+
+    async def _get_json(self, path: str) -> Optional[Dict]:
+        """GET a JSON document, retrying timeouts and server errors with backoff."""
+        url = f"{self.base_url}{path}"
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                response = await self._http_client().get(url)
+                if response.status_code == 404:
+                    return None
+                response.raise_for_status()
+                return response.json()
+            except (httpx.TimeoutException, httpx.TransportError, httpx.HTTPStatusError) as exc:
+                if attempt == MAX_ATTEMPTS - 1:
+                    logger.warning("giving up on %s: %s", url, exc)
+                    return None
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        return None
+
+    async def fetch_latest_number(self) -> Optional[int]:
+        """Refresh the number of the newest comic."""
+        data = await self._get_json("/info.0.json")
+        if data:
+            self.latest = data["num"]
+            self.comics.setdefault(data["num"], _comic_from_api(data))
+        return self.latest
+
+    async def fetch_comic(self, num: int) -> Optional[Dict]:
+        """Fetch one comic and add it to the index."""
+        data = await self._get_json(f"/{num}/info.0.json")
+        if not data:
+            return None
+        comic = _comic_from_api(data)
+        self.comics[num] = comic
+        return comic
+
+    async def prefetch(self, count: int = PREFETCH_COUNT) -> None:
+        """Fill the index with up to `count` random comics not yet indexed."""
+        if await self.fetch_latest_number() is None:
+            return
+        missing = [num for num in range(1, self.latest + 1) if num not in self.comics]
+        wanted = random.sample(missing, min(count, len(missing)))
+        semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+
+        async def fetch(num: int) -> None:
+            async with semaphore:
+                await self.fetch_comic(num)
+
+        await asyncio.gather(*(fetch(num) for num in wanted))
+        self.save()
+        logger.info("XKCD index holds %d comics", len(self.comics))
+
+    def start_prefetch(self) -> None:
+        """Start a background prefetch on the running loop unless one ran recently."""
+        if self._prefetch_task is not None and not self._prefetch_task.done():
+            return
+        if self._last_prefetch and time.monotonic() - self._last_prefetch < PREFETCH_INTERVAL:
+            return
+        self._last_prefetch = time.monotonic()
+        self._prefetch_task = asyncio.ensure_future(self.prefetch())
+        self._prefetch_task.add_done_callback(_log_failure("XKCD prefetch"))
+
+    #--------------------------------------------------------------------------
+    # LOOKUP
+    #--------------------------------------------------------------------------
+
+    async def random_comic(self) -> Optional[Dict]:
+        """
+        Return a random comic, from the local index when possible.
+
+        Returns:
+            A dict with the comic's title, image URL, alt text and URL, or None
+        """
+        if not self._loaded:
+            self.load()
+        self.start_prefetch()
+
+        if self.comics:
+            comic = self.comics[random.choice(list(self.comics))]
+            return _tool_result(comic)
+
+        # Empty index: fall back to a single live lookup
+        latest = self.latest or await self.fetch_latest_number()
+        if latest is None:
+            return None
+        comic = await self.fetch_comic(random.randint(1, latest)) or self.comics.get(latest)
+        return _tool_result(comic) if comic else None
+
+
+def _comic_from_api(data: Dict) -> Dict:
+    return {
+        "num": data["num"],
+        "title": data.get("safe_title") or data.get("title", "No title"),
+        "image_url": data.get("img", ""),
+        "alt_text": data.get("alt", "No alt text"),
+    }
+
+
+def _tool_result(comic: Dict) -> Dict:
+    return {
+        "title": comic["title"],
+        "image_url": comic["image_url"],
+        "alt_text": comic["alt_text"],
+        "comic_url": f"https://xkcd.com/{comic['num']}/",
+    }
+
+
+_index = XkcdIndex()
+
+
+def get_xkcd_index() -> XkcdIndex:
+    """Return the process-wide XKCD index."""
+    return _index
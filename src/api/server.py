@@ -0,0 +1,507 @@
+"""
+This module serves chat turns over HTTP without the Streamlit UI.
+
+Requests are stateless: each one carries the conversation (and the rolling
+summary returned by the previous turn), so any replica behind a load balancer
+can answer it. Turns go through the same agent graph, history window,
+pre-router, response cache and metrics as the UI.
+
+Endpoints:
+    POST /v1/chat     JSON response, or Server-Sent Events with "stream": true
+    GET  /v1/chat/ws  WebSocket; every text message is a chat request, streamed by default
+    GET  /healthz     Liveness check
+    GET  /metrics     Prometheus metrics
+
+The X-Session-Id header identifies the caller for fair queueing, and
+X-Provider-Api-Key overrides the configured provider key.
+
+Summaries carry an HMAC signature keyed by [api] summary_secret, since they are
+sent to the model as a system message. A summary whose signature does not check
+out is dropped and the conversation is summarized again from its messages.
+
+A client that disconnects cancels its turn, which stops the agent run and its
+provider stream. On the WebSocket, a new chat request or {"type": "cancel"}
+cancels the turn in flight; it ends with a "cancelled" message holding the
+partial response.
+
+Run with:
+    python -m src.api.server --host 0.0.0.0 --port 8080
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import sys
+import threading
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import AsyncGenerator, Dict, List, Optional
+
+from aiohttp import WSMsgType, web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from src.agent import config as agent_config
+from src.agent.cache import make_cache_key
+from src.agent.coalesce import make_flight_key
+from src.agent.clients import get_client_manager
+from src.agent.history import ConversationSummary
+from src.agent.metrics import TurnMetrics, get_metrics_registry
+from src.agent.failover import ProviderDispatcher, make_agent_starter
+from src.agent.pipeline import cached_response_stream
+from src.agent.providers import build_run_config
+from src.agent.turns import DISCONNECTED, REQUESTED, SUPERSEDED, TurnHandle
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+API_KEY_HEADER = "X-Provider-Api-Key"
+SESSION_HEADER = "X-Session-Id"
+ROLES = ("user", "assistant")
+
+#------------------------------------------------------------------------------
+# SUMMARIES
+#------------------------------------------------------------------------------
+
+class SummarySigner:
+    """Signs the summaries handed to clients, so only the server's own come back into a prompt."""
+
+    def __init__(self, secret: Optional[str] = None) -> None:
+        """
+        Args:
+            secret: Key shared by all replicas; a random per-process key if None,
+                which invalidates the summaries of other replicas and earlier runs
+        """
+        self._key = secret.encode("utf-8") if secret else secrets.token_bytes(32)
+
+    def sign(self, summary: ConversationSummary) -> str:
+        message = f"{summary.folded}\n{summary.text}".encode("utf-8")
+        return hmac.new(self._key, message, hashlib.sha256).hexdigest()
+
+    def verify(self, summary: ConversationSummary, signature: str) -> bool:
+        return hmac.compare_digest(self.sign(summary), signature)
+
+    def payload(self, summary: ConversationSummary) -> Dict:
+        """The summary as sent to clients, with its signature."""
+        return {**asdict(summary), "signature": self.sign(summary)}
+
+#------------------------------------------------------------------------------
+# REQUESTS
+#------------------------------------------------------------------------------
+
+class BadRequest(ValueError):
+    """The chat request is malformed or cannot be served."""
+
+
+@dataclass
+class ChatRequest:
+    """A stateless chat turn: the whole conversation plus its rolling summary."""
+    messages: List[Dict]
+    provider: str
+    stream: bool = False
+    summary: ConversationSummary = field(default_factory=ConversationSummary)
+    show_latency: bool = False
+    session_id: str = ""  # fair queueing key, see src.agent.scheduler
+    coalesce: bool = True  # share the run of an identical request in flight, see src.agent.coalesce
+
+    @classmethod
+    def from_payload(
+        cls,
+        payload: Dict,
+        default_provider: str,
+        default_stream: bool = False,
+        session_id: str = "",
+        signer: Optional[SummarySigner] = None,
+    ) -> "ChatRequest":
+        """
+        Validate a JSON payload.
+
+        Args:
+            payload: The decoded request body
+            default_provider: Provider used when the payload names none
+            default_stream: Whether to stream when the payload does not say
+            session_id: Identifies the caller for fair queueing
+            signer: Checks the summary's signature; a summary failing it is dropped
+
+        Returns:
+            The parsed request
+
+        Raises:
+            BadRequest: If the payload is malformed
+        """
+        if not isinstance(payload, dict):
+            raise BadRequest("request body must be a JSON object")
+
+        messages = payload.get("messages")
+        if not isinstance(messages, list) or not messages:
+            raise BadRequest("'messages' must be a non-empty list")
+        for message in messages:
+            if (
+                not isinstance(message, dict)
+                or message.get("role") not in ROLES
+                or not isinstance(message.get("content"), str)
+            ):
+                raise BadRequest("each message needs a 'role' of user/assistant and a string 'content'")
+        if messages[-1]["role"] != "user":
+            raise BadRequest("the last message must come from the user")
+
+        summary = payload.get("summary") or {}
+        try:
+            signature = str(summary.get("signature", ""))
+            summary = ConversationSummary(text=str(summary.get("text", "")), folded=int(summary.get("folded", 0)))
+        except (AttributeError, TypeError, ValueError):
+            raise BadRequest("'summary' must be an object with 'text', 'folded' and 'signature'")
+        if signer is not None and (summary.text or summary.folded) and not signer.verify(summary, signature):
+            # The summary becomes a system message, so never take one the server did not write
+            logger.warning("dropping a summary with a missing or invalid signature")
+            summary = ConversationSummary()
+
+        return cls(
+            messages=[{"role": m["role"], "content": m["content"]} for m in messages],
+            provider=str(payload.get("provider") or default_provider),
+            stream=bool(payload.get("stream", default_stream)),
+            summary=summary,
+            show_latency=bool(payload.get("show_latency", False)),
+            session_id=session_id,
+            coalesce=bool(payload.get("coalesce", True)),
+        )
+
+#------------------------------------------------------------------------------
+# CHAT SERVICE
+#------------------------------------------------------------------------------
+
+class ChatService:
+    """Runs chat turns against the configured providers."""
+
+    def __init__(self, config: Dict) -> None:
+        self.config = config
+        self.signer = SummarySigner(config.get("api", {}).get("summary_secret"))
+        self.active_providers = list(config.get("providers", {}).get("active", []))
+        if not self.active_providers:
+            raise ValueError("no active providers in the [providers] section")
+
+    async def stream_turn(self, request: ChatRequest, api_key: Optional[str] = None) -> AsyncGenerator[Dict, None]:
+        """
+        Run one turn, yielding step, status and delta chunks when streaming and finally a "done" chunk.
+
+        The "done" chunk holds the full response, the steps and the updated
+        summary, which the client sends back with its next request.
+        """
+        if request.provider not in self.active_providers:
+            raise BadRequest(f"unknown provider '{request.provider}'")
+        settings = agent_config.get_provider_settings(self.config, request.provider, api_key=api_key)
+        if settings is None:
+            raise BadRequest(f"no API key for provider '{request.provider}'")
+
+        graph = agent_config.get_provider_graph(self.config, settings)
+        run_config = build_run_config(settings)
+
+        # Keep the conversation within the model's token budget
+        history_manager = agent_config.get_history_manager(self.config, settings, run_config)
+        conversation = await history_manager.build(request.messages, request.summary)
+
+        # Skip the triage hop for obvious requests
+        route = agent_config.get_pre_router(self.config).route(graph, conversation)
+        agent = route.agent
+
+        cache = agent_config.get_response_cache(self.config)
+        cache_key = None
+        if cache is not None:
+            cache_key = make_cache_key(
+                settings.provider,
+                settings.model,
+                agent.name,
+                conversation,
+                tail_messages=agent_config.get_cache_tail_messages(self.config),
+                match=agent_config.get_cache_match(self.config),
+            )
+
+        # Optionally start the likely specialist while the triage agent decides
+        speculator = agent_config.get_speculator(self.config) if route.path == "triage" else None
+        speculative_agent = None
+        if speculator is not None:
+            predicted = speculator.predict(request.session_id, graph, conversation)
+            speculative_agent = predicted.name if predicted is not None else None
+
+        # Admit runs within the provider's rate limits, optionally failing over or
+        # hedging across the other configured providers
+        start = make_agent_starter(
+            lambda candidate: agent_config.get_provider_graph(self.config, candidate),
+            agent.name,
+            conversation,
+            stream=request.stream,
+            run_configs={settings.provider: run_config},
+            scheduler=agent_config.get_scheduler(self.config),
+            session_id=request.session_id,
+            speculative_agent=speculative_agent,
+        )
+        policy = agent_config.get_failover_policy(self.config)
+        dispatcher = None
+        metrics = None
+        if policy.enabled:
+            dispatcher = ProviderDispatcher(
+                agent_config.get_failover_candidates(self.config, settings), policy, start, streaming=request.stream
+            )
+            generator = dispatcher.stream()
+        else:
+            metrics = TurnMetrics(provider=settings.provider, model=settings.model)
+            generator = start(settings, metrics)
+        # Identical requests in flight at the same time share one run, unless the client opts out
+        flights = agent_config.get_single_flight(self.config) if request.coalesce else None
+        if flights is not None:
+            generator = flights.stream(
+                make_flight_key(settings.provider, settings.model, agent.name, conversation), generator,
+                metrics=metrics,
+            )
+        if cache is not None:
+            generator = cached_response_stream(cache, cache_key, generator)
+
+        parts = []
+        steps = [route.step]
+        if request.stream:
+            yield {"step": route.step}
+        async with contextlib.aclosing(generator) as chunks:
+            async for chunk in chunks:
+                if "delta" in chunk:
+                    parts.append(chunk["delta"])
+                elif "step" in chunk:
+                    steps.append(chunk["step"])
+                # Without streaming only the final "done" chunk is sent
+                if request.stream:
+                    yield chunk
+        if dispatcher is not None:
+            metrics = dispatcher.metrics
+        if speculator is not None:
+            speculator.record(request.session_id, steps)
+
+        # Cache hits never start a run, so close the turn here; a coalesced follower's was discarded
+        if metrics is not None and not metrics.discarded:
+            metrics.finish()
+            if request.show_latency:
+                steps.extend(metrics.breakdown_steps())
+        yield {"done": {"response": "".join(parts), "steps": steps, "summary": self.signer.payload(request.summary)}}
+
+    async def run_turn(self, request: ChatRequest, api_key: Optional[str] = None) -> Dict:
+        """Run one turn and return the "done" payload."""
+        result = {}
+        async for chunk in self.stream_turn(request, api_key=api_key):
+            if "done" in chunk:
+                result = chunk["done"]
+        return result
+
+#------------------------------------------------------------------------------
+# HTTP HANDLERS
+#------------------------------------------------------------------------------
+
+def _sse(event: str, data: Dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+def _event_name(chunk: Dict) -> str:
+    return next(iter(chunk))
+
+
+class ChatServer:
+    """aiohttp application exposing a ChatService."""
+
+    def __init__(self, service: ChatService) -> None:
+        self.service = service
+        self.app = web.Application()
+        self.app.router.add_post("/v1/chat", self.chat)
+        self.app.router.add_get("/v1/chat/ws", self.chat_ws)
+        self.app.router.add_get("/healthz", self.healthz)
+        self.app.router.add_get("/metrics", self.metrics)
+
+    def _parse(self, request: web.Request, payload: Dict, default_stream: bool = False) -> ChatRequest:
+        return ChatRequest.from_payload(
+            payload,
+            default_provider=self.service.active_providers[0],
+            default_stream=default_stream,
+            session_id=request.headers.get(SESSION_HEADER) or request.remote or "",
+            signer=self.service.signer,
+        )
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        try:
+            chat_request = self._parse(request, await request.json())
+        except json.JSONDecodeError:
+            return web.json_response({"error": "request body must be JSON"}, status=400)
+        except BadRequest as exc:
+            return web.json_response({"error": str(exc)}, status=400)
+        api_key = request.headers.get(API_KEY_HEADER)
+        # The turn runs as a task on the handle, which is cancelled when the client
+        # goes away: aiohttp cancels the handler, see serve(), or a write fails
+        handle = TurnHandle(chat_request.session_id)
+
+        if not chat_request.stream:
+            turn = asyncio.ensure_future(self.service.run_turn(chat_request, api_key=api_key))
+            handle.attach(turn)
+            try:
+                return web.json_response(await turn)
+            except asyncio.CancelledError:
+                handle.cancel(DISCONNECTED)
+                raise
+            except BadRequest as exc:
+                return web.json_response({"error": str(exc)}, status=400)
+            except Exception as exc:
+                logger.exception("chat turn failed")
+                return web.json_response({"error": f"{type(exc).__name__}: {exc}"}, status=502)
+
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # stop reverse proxies from buffering the stream
+        })
+        await response.prepare(request)
+        turn = asyncio.ensure_future(self._stream_sse_turn(response, chat_request, api_key))
+        handle.attach(turn)
+        try:
+            await turn
+        except (ConnectionResetError, asyncio.CancelledError) as exc:
+            logger.info("client disconnected mid-stream")
+            handle.cancel(DISCONNECTED)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+        return response
+
+    async def _stream_sse_turn(
+        self, response: web.StreamResponse, chat_request: ChatRequest, api_key: Optional[str]
+    ) -> None:
+        """Stream one turn as Server-Sent Events; a failed write means the client went away."""
+        try:
+            async with contextlib.aclosing(self.service.stream_turn(chat_request, api_key=api_key)) as chunks:
+                async for chunk in chunks:
+                    event = _event_name(chunk)
+                    await response.write(_sse(event, chunk[event] if event == "done" else chunk))
+        except (ConnectionResetError, asyncio.CancelledError):
+            raise
+        except Exception as exc:
+            if not isinstance(exc, BadRequest):
+                logger.exception("chat stream failed")
+            await response.write(_sse("error", {"error": str(exc)}))
+        await response.write_eof()
+
+    async def chat_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        api_key = request.headers.get(API_KEY_HEADER)
+        turn: Optional[asyncio.Task] = None
+        handle: Optional[TurnHandle] = None
+
+        def cancel_turn(reason: str) -> None:
+            if turn is not None and not turn.done():
+                handle.cancel(reason)
+
+        # Messages are read while a turn streams, so the client can cancel or replace it
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    payload = json.loads(message.data)
+                    if isinstance(payload, dict) and payload.get("type") == "cancel":
+                        cancel_turn(REQUESTED)
+                        continue
+                    chat_request = self._parse(request, payload, default_stream=True)
+                except (json.JSONDecodeError, BadRequest) as exc:
+                    await ws.send_json({"type": "error", "error": str(exc)})
+                    continue
+
+                cancel_turn(SUPERSEDED)
+                if turn is not None:
+                    await asyncio.wait([turn])  # its "cancelled" message goes out first
+                handle = TurnHandle(chat_request.session_id)
+                turn = asyncio.ensure_future(self._stream_ws_turn(ws, chat_request, api_key, handle))
+                handle.attach(turn)
+        finally:
+            cancel_turn(DISCONNECTED)
+        return ws
+
+    async def _stream_ws_turn(
+        self, ws: web.WebSocketResponse, chat_request: ChatRequest, api_key: Optional[str], handle: TurnHandle
+    ) -> None:
+        """Stream one turn to a WebSocket; a cancelled turn ends with its partial response."""
+        try:
+            async with contextlib.aclosing(self.service.stream_turn(chat_request, api_key=api_key)) as chunks:
+                async for chunk in chunks:
+                    handle.record(chunk)
+                    event = _event_name(chunk)
+                    await ws.send_json({"type": event, **(chunk[event] if event == "done" else chunk)})
+        except asyncio.CancelledError:
+            if not handle.cancelled:
+                raise
+            if not ws.closed:
+                await ws.send_json({
+                    "type": "cancelled",
+                    "reason": handle.reason,
+                    **handle.partial(),
+                    "summary": self.service.signer.payload(chat_request.summary),
+                })
+        except BadRequest as exc:
+            await ws.send_json({"type": "error", "error": str(exc)})
+        except ConnectionResetError:
+            pass
+        except Exception as exc:
+            logger.exception("chat turn failed")
+            await ws.send_json({"type": "error", "error": f"{type(exc).__name__}: {exc}"})
+
+    async def healthz(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=get_metrics_registry().render_prometheus(),
+            content_type="text/plain",
+            charset="utf-8",
+        )
+
+#------------------------------------------------------------------------------
+# ENTRY POINT
+#------------------------------------------------------------------------------
+
+def serve(config: Dict, host: str, port: int) -> None:
+    """
+    Serve the API until interrupted.
+
+    The application runs on the shared client loop, so the pooled provider
+    connections are used from the loop they belong to.
+    """
+    manager = get_client_manager()
+    # Cancel a handler when its client disconnects, so abandoned turns stop
+    runner = web.AppRunner(ChatServer(ChatService(config)).app, handler_cancellation=True)
+    manager.run(runner.setup())
+    manager.run(web.TCPSite(runner, host, port).start())
+    logger.info("serving chat API on http://%s:%s", host, port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.run(runner.cleanup())
+        manager.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless chat API for the agent pipeline")
+    parser.add_argument("--config", default=None, help="secrets TOML file, defaults to .streamlit/secrets.toml")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    config = agent_config.load_config(args.config)
+    api_config = config.get("api", {})
+    serve(
+        config,
+        host=args.host or api_config.get("host", DEFAULT_HOST),
+        port=args.port or int(api_config.get("port", DEFAULT_PORT)),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Batch evaluation: run a JSONL file of conversations through the agent graph.
+
+Each input line is an object with an optional "id" and either "messages" (a
+list of {"role", "content"}) or a single "prompt". Every conversation is run on
+every requested provider with `get_agent_response`, at a bounded concurrency
+over the pooled clients. Result lines (final output, handoff steps, latency,
+tokens) are appended to the output JSONL as they complete; rerunning with the
+same output file skips everything that already succeeded. Input lines that
+cannot be parsed get error results like failed runs instead of stopping the batch.
+
+Example:
+    python -m src.cli.batch prompts.jsonl results.jsonl --provider openai --provider xai --concurrency 16
+
+Offline, against the fake server from the benchmarks:
+    python -m benchmarks.fake_openai --port 8765
+    XKCD_BASE_URL=http://127.0.0.1:8765/xkcd python -m src.cli.batch prompts.jsonl results.jsonl \\
+        --provider xai --base-url http://127.0.0.1:8765/v1 --api-key offline
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Set, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from src.agent import config as agent_config
+from src.agent.clients import get_client_manager
+from src.agent.metrics import TurnMetrics
+from src.agent.pipeline import get_agent_response
+from src.agent.providers import build_run_config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+BATCH_SESSION = "batch"
+
+ResultKey = Tuple[str, str]
+
+
+def read_conversations(path: str) -> Iterator[Dict]:
+    """
+    Read the input JSONL.
+
+    Yields:
+        {"id": str, "messages": [...]} per line, or {"id": str, "error": str} for a
+        line that is not a valid conversation; the id defaults to the line number
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield {"id": str(line_number), "error": f"invalid JSON: {exc}"}
+                continue
+            if not isinstance(record, dict):
+                yield {"id": str(line_number), "error": "each line must be a JSON object"}
+                continue
+            conversation_id = str(record.get("id", line_number))
+            messages = record.get("messages")
+            if messages is None and "prompt" in record:
+                messages = [{"role": "user", "content": str(record["prompt"])}]
+            if not isinstance(messages, list) or not messages:
+                yield {"id": conversation_id, "error": "each line needs a 'prompt' or a non-empty 'messages' list"}
+                continue
+            yield {"id": conversation_id, "messages": messages}
+
+
+def completed_keys(path: str) -> Set[ResultKey]:
+    """(id, provider) pairs that already have a successful result in the output file."""
+    done: Set[ResultKey] = set()
+    if not Path(path).exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut off by an interruption
+            if record.get("status") == "ok":
+                done.add((record["id"], record["provider"]))
+    return done
+
+
+def apply_overrides(config: Dict, providers: List[str], args: argparse.Namespace) -> Dict:
+    """Copy the configuration with the command line model/base URL/API key applied to the providers."""
+    config = {key: dict(value) if isinstance(value, dict) else value for key, value in config.items()}
+    for provider in providers:
+        section = dict(config.get(provider, {}))
+        for option in ("model", "base_url", "api_key"):
+            value = getattr(args, option)
+            if value is not None:
+                section[option] = value
+        config[provider] = section
+    return config
+
+
+async def run_one(config: Dict, provider: str, conversation: Dict, fast_path: bool) -> Dict:
+    """Run one conversation on one provider and build its result record."""
+    settings = agent_config.get_provider_settings(config, provider)
+    record = {"id": conversation["id"], "provider": provider, "model": settings.model if settings else None}
+    if "error" in conversation:
+        return dict(record, status="error", error=conversation["error"])
+    if settings is None:
+        return dict(record, status="error", error=f"no API key for provider '{provider}'")
+
+    graph = agent_config.get_provider_graph(config, settings)
+    agent = graph.triage
+    if fast_path:
+        agent = agent_config.get_pre_router(config).route(graph, conversation["messages"]).agent
+
+    metrics = TurnMetrics(provider=provider, model=settings.model)
+    started = time.perf_counter()
+    try:
+        async with agent_config.get_scheduler(config).admitted(
+            provider, BATCH_SESSION, conversation["messages"], metrics=metrics
+        ):
+            response = await get_agent_response(
+                agent,
+                conversation["messages"],
+                stream=False,
+                run_config=build_run_config(settings),
+                metrics=metrics,
+            )
+    except Exception as exc:
+        return dict(
+            record,
+            status="error",
+            error=f"{type(exc).__name__}: {exc}",
+            latency=time.perf_counter() - started,
+        )
+    return dict(
+        record,
+        status="ok",
+        agent=agent.name,
+        response=str(response["response"]),
+        steps=response["steps"],
+        latency=time.perf_counter() - started,
+        input_tokens=metrics.input_tokens,
+        output_tokens=metrics.output_tokens,
+        cached_tokens=metrics.cached_tokens,
+        instruction_tokens=metrics.instruction_tokens,
+    )
+
+
+async def run_batch(
+    config: Dict,
+    providers: List[str],
+    input_path: str,
+    output_path: str,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    fast_path: bool = False,
+) -> Dict:
+    """
+    Run every pending (conversation, provider) pair and append the results.
+
+    Returns:
+        Counts of skipped, succeeded and failed runs
+    """
+    done = completed_keys(output_path)
+    pairs = [(provider, conversation) for conversation in read_conversations(input_path) for provider in providers]
+    jobs = [(provider, conversation) for provider, conversation in pairs if (conversation["id"], provider) not in done]
+    # Results of conversations no longer in the input do not count
+    summary = {"skipped": len(pairs) - len(jobs), "ok": 0, "error": 0}
+    logger.info("%d runs pending, %d already done", len(jobs), summary["skipped"])
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(provider: str, conversation: Dict) -> Dict:
+        async with semaphore:
+            return await run_one(config, provider, conversation, fast_path)
+
+    with open(output_path, "a+", encoding="utf-8") as out:
+        # Terminate a line cut off by an interruption so the next record starts cleanly
+        if out.tell():
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+        tasks = [asyncio.ensure_future(limited(provider, conversation)) for provider, conversation in jobs]
+        try:
+            for finished, task in enumerate(asyncio.as_completed(tasks), start=1):
+                record = await task
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                summary[record["status"]] += 1
+                if finished % 50 == 0 or finished == len(tasks):
+                    logger.info("%d/%d done (%d failed)", finished, len(tasks), summary["error"])
+        finally:
+            for task in tasks:
+                task.cancel()
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a JSONL of conversations through the agent graph")
+    parser.add_argument("input", help="JSONL with 'messages' or 'prompt' per line")
+    parser.add_argument("output", help="JSONL the results are appended to; reused to resume")
+    parser.add_argument("--provider", action="append", default=None,
+                        help="provider to run on, repeat to compare; defaults to the first active provider")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--fast-path", action="store_true", help="route with the local pre-router first")
+    parser.add_argument("--config", default=None, help="secrets TOML file, defaults to .streamlit/secrets.toml")
+    parser.add_argument("--model", default=None, help="override the model of the providers")
+    parser.add_argument("--base-url", default=None, help="override the base URL, e.g. a local stand-in server")
+    parser.add_argument("--api-key", default=None, help="override the API key of the providers")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    config_path = Path(args.config) if args.config else agent_config.DEFAULT_CONFIG_PATH
+    config = agent_config.load_config(str(config_path)) if config_path.exists() else {}
+    providers = args.provider or config.get("providers", {}).get("active", [])[:1]
+    if not providers:
+        parser.error("no --provider given and no active providers configured")
+    config = apply_overrides(config, providers, args)
+
+    manager = get_client_manager()
+    try:
+        summary = manager.run(run_batch(
+            config,
+            providers,
+            args.input,
+            args.output,
+            concurrency=args.concurrency,
+            fast_path=args.fast_path,
+        ))
+    finally:
+        manager.close()
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
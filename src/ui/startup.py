@@ -0,0 +1,122 @@
+"""
+This module keeps the first paint of the app cheap and times every script run.
+
+It only depends on Streamlit, so the app can import it, paint the page chrome
+and only then import the agent modules (`agents`, `openai`), which take most of
+a cold start. The CSS and header markup are built once per process. Each script
+run is timed in phases; the first run of a process is reported as its cold
+start, so new replicas can be tracked while autoscaling.
+"""
+import logging
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+HEADER_HTML = (
+    '<div class="main-header">'
+    '<div class="main-header-content">'
+    '<img src="https://emoji.aranja.com/static/emoji-data/img-apple-160/1f916.png" '
+    'class="main-header-image">'
+    '<div>'
+    '<h1>✨ Talk to the Bots</h1>'
+    '<p>An agentic, multi-provider chatbot trying to make you laugh</p>'
+    '</div>'
+    '</div>'
+    '</div>'
+)
+
+_lock = threading.Lock()
+_cold_start: Optional[Dict[str, float]] = None
+
+#------------------------------------------------------------------------------
+# STATIC ASSETS
+#------------------------------------------------------------------------------
+
+@lru_cache(maxsize=1)
+def get_css_markup() -> str:
+    """The custom CSS as a style tag, read from disk once per process."""
+    css_file = Path(__file__).parent / "static" / "styles.css"
+    with open(css_file) as f:
+        return f"<style>{f.read()}</style>"
+
+def load_css() -> None:
+    """Load external CSS file."""
+    st.markdown(get_css_markup(), unsafe_allow_html=True)
+
+def render_header() -> None:
+    """Render the application header with logo and title."""
+    st.markdown(HEADER_HTML, unsafe_allow_html=True)
+
+#------------------------------------------------------------------------------
+# RUN TIMING
+#------------------------------------------------------------------------------
+
+class RunTimer:
+    """Phase timings of one script run."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str) -> None:
+        """Record the time since the run started at the end of a phase."""
+        self.phases.append((phase, time.perf_counter() - self.started))
+
+    def finish(self) -> Dict[str, float]:
+        """
+        Record the total time and report the run.
+
+        The first run of the process becomes the cold start, later runs are
+        observed as reruns.
+
+        Returns:
+            Seconds since the start of the run, by phase
+        """
+        global _cold_start
+        self.mark("total")
+        timings = dict(self.phases)
+        with _lock:
+            cold = _cold_start is None
+            if cold:
+                _cold_start = timings
+
+        # Imported here: the registry pulls in the agents SDK, which is loaded by now
+        from src.agent.metrics import get_metrics_registry
+
+        registry = get_metrics_registry()
+        if cold:
+            logger.info(
+                "cold start: %s", ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases)
+            )
+            for phase, seconds in timings.items():
+                registry.set_gauge(
+                    "app_cold_start_seconds", "Time to each phase of the first script run.", seconds, phase=phase
+                )
+        else:
+            registry.observe("app_rerun_seconds", "Duration of script reruns.", timings["total"])
+        return timings
+
+def get_cold_start() -> Optional[Dict[str, float]]:
+    """Phase timings of the first script run of the process, once it finished."""
+    return _cold_start
+
+def render_timing_report(timings: Dict[str, float]) -> None:
+    """Show the cold start and the current run's timings in the sidebar."""
+    def ms(seconds: float) -> str:
+        return f"{seconds * 1000:.0f} ms"
+
+    lines = []
+    cold_start = get_cold_start()
+    if cold_start is not None:
+        lines.append(
+            f"🚀 Cold start {ms(cold_start['total'])} (painted after {ms(cold_start.get('painted', 0.0))}, "
+            f"agents loaded after {ms(cold_start.get('imports', 0.0))})"
+        )
+    lines.append(f"🔁 This run {ms(timings['total'])}")
+    st.sidebar.caption("  \n".join(lines))
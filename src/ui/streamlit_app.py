@@ -10,19 +10,13 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..",
 
 import streamlit as st
 
-from src.agent.agent import create_agent
-from src.ui.utils import (
-    initialize_session_state,
-    load_css,
-    render_header,
-    setup_sidebar,
-    display_chat_history,
-    handle_chat_interaction
-)
+from src.ui.startup import RunTimer, load_css, render_header, render_timing_report
 
 
 def main() -> None:
     """Main function to run the Streamlit app."""
+    timer = RunTimer()
+    
     # Set page config
     st.set_page_config(
         page_title="AI Bot Chat",
@@ -35,6 +29,21 @@ def main() -> None:
     
     # Load header 
     render_header()
+    timer.mark("painted")
+    
+    # The agent modules are imported after the first paint; only the first run of a process pays for them
+    from src.agent.registry import get_agent_graph
+    from src.ui.utils import (
+        initialize_session_state,
+        setup_sidebar,
+        start_metrics_exporter,
+        display_chat_history,
+        handle_chat_interaction
+    )
+    timer.mark("imports")
+    
+    # Expose process metrics for scraping
+    start_metrics_exporter()
     
     # Set up sidebar with LLM provider configuration
     setup_sidebar()
@@ -43,10 +52,21 @@ def main() -> None:
     initialize_session_state()
     display_chat_history()
     
-    # Create the agent and manage chat with model passed as an argument
-    model = st.session_state.get("model")
-    agent = create_agent(model=model)
-    handle_chat_interaction(agent)
+    # Reuse the process-wide agent graph and manage chat with model passed as an argument
+    graph = get_agent_graph(
+        provider=st.session_state.get("llm_provider"),
+        model=st.session_state.get("model"),
+        fingerprint=st.session_state.get("provider_fingerprint"),
+    )
+    try:
+        handle_chat_interaction(graph)
+    finally:
+        # A chat turn ends with st.rerun(), which raises; its run is the one most worth timing
+        timings = timer.finish()
+    
+    # Startup and rerun timings, shown with the latency breakdown
+    if st.session_state.get("show_latency", False):
+        render_timing_report(timings)
 
 
 if __name__ == "__main__":
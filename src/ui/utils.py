@@ -5,73 +5,105 @@ It implements various helper functions for session state management, LLM client
 response streaming, and message formatting.
 """
 
-import asyncio
-from pathlib import Path
-from typing import Dict, List, AsyncGenerator, Optional, Tuple
+import concurrent.futures
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
 
 import streamlit as st
-from openai import AsyncOpenAI
-from openai.types.responses import ResponseTextDeltaEvent
-from agents import (
-    Agent,
-    Runner,
-    set_default_openai_client,
-    set_tracing_disabled,
-    set_default_openai_api,
-    HandoffOutputItem
-)
+from agents import RunConfig
+from streamlit.runtime.scriptrunner import RerunException, StopException
+
+from src.agent import config
+from src.agent.agent import AgentGraph
+from src.agent.cache import ResponseCache, make_cache_key
+from src.agent.clients import get_client_manager
+from src.agent.coalesce import make_flight_key
+from src.agent.failover import ProviderDispatcher, make_agent_starter
+from src.agent.history import ConversationSummary, HistoryManager
+from src.agent.messages import ChatMessage, SessionHistory, get_session_registry
+from src.agent.metrics import TurnMetrics
+from src.agent.pipeline import cached_response_stream, prepend_steps
+from src.agent.providers import ProviderSettings, build_run_config
+from src.agent.router import PreRouter
+from src.agent.scheduler import format_status
+from src.agent.store import ConversationStore
+from src.agent.turns import STOPPED, SUPERSEDED, TurnHandle, get_turn_registry
+
+logger = logging.getLogger(__name__)
+
+# Sent in place of an empty message, e.g. a reply cancelled before its first token
+EMPTY_MESSAGE = "(no reply)"
 
 #------------------------------------------------------------------------------
 # UI RENDERING FUNCTIONS
 #------------------------------------------------------------------------------
 
-def load_css() -> None:
-    """Load external CSS file."""
-    css_file = Path(__file__).parent / "static" / "styles.css"
-    with open(css_file) as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
-
-def render_header() -> None:
-    """Render the application header with logo and title."""
-    st.markdown(
-        '<div class="main-header">'
-        '<div class="main-header-content">'
-        '<img src="https://emoji.aranja.com/static/emoji-data/img-apple-160/1f916.png" '
-        'class="main-header-image">'
-        '<div>'
-        '<h1>✨ Talk to the Bots</h1>'
-        '<p>An agentic, multi-provider chatbot trying to make you laugh</p>'
-        '</div>'
-        '</div>'
-        '</div>',
-        unsafe_allow_html=True
-    )
-
-def message_with_feedback(message: Dict, index: int) -> None:
+def message_with_feedback(message: ChatMessage, index: int) -> None:
     """Display a single message with feedback if it's from the assistant."""
-    with st.chat_message(message["role"], avatar=message.get("emoji", "🤖")):
+    with st.chat_message(message.role, avatar=message.emoji or "🤖"):
         # If the message has steps, display them in an expander
-        if "steps" in message and message["steps"] and st.session_state.get("show_thinking", False):
+        if message.steps and st.session_state.get("show_thinking", False):
             with st.expander("Steps", expanded=False):
-                st.write("\n".join(message["steps"]))
+                st.write("\n".join(message.rendered_steps()))
         
         # Display the message content
-        st.markdown(message["content"])
+        st.markdown(message.content)
 
         # Show feedback for assistant messages
-        if message["role"] == "assistant":
-            feedback = st.feedback(
+        if message.role == "assistant":
+            key = f"feedback_{index}"
+            # Restore stored feedback; widget state is dropped while a message is paged out
+            if key not in st.session_state and message.feedback is not None:
+                st.session_state[key] = message.feedback
+            st.feedback(
                 options="thumbs",
-                key=f"feedback_{index}"
+                key=key,
+                on_change=_save_feedback,
+                args=(index,),
             )
-            if feedback is not None:
-                st.session_state["messages"][index]["feedback"] = feedback
+
+def _save_feedback(index: int) -> None:
+    """Keep feedback with the message and persist it."""
+    feedback = st.session_state.get(f"feedback_{index}")
+    message = st.session_state["history"].get(index)
+    if message is not None:
+        message.feedback = feedback
+    store = get_conversation_store()
+    if store is not None:
+        store.set_feedback(st.session_state["conversation_id"], index, feedback)
 
 def display_chat_history() -> None:
-    """Displays the chat in Streamlit."""
-    for i, message in enumerate(st.session_state["messages"]):
+    """Displays the most recent pages of the chat, with a button to load older messages."""
+    history = st.session_state["history"]
+    store = get_conversation_store()
+    visible = config.get_page_size(st.secrets) * st.session_state["history_pages"]
+    # Without a store, messages trimmed from memory are gone
+    first = 0 if store is not None else history.offset
+    start = max(first, len(history) - visible)
+    
+    # Messages older than the resident tail are read from the store for display only
+    messages = []
+    if start < history.offset:
+        messages = [
+            ChatMessage.from_dict(message)
+            for message in store.load_messages(st.session_state["conversation_id"], start, history.offset - start)
+        ]
+    messages += history.resident()[max(0, start - history.offset):]
+    
+    if start > first:
+        st.button(
+            f"Load older messages ({start - first} more)",
+            key="load_older_messages",
+            on_click=_load_older_messages,
+        )
+    for i, message in enumerate(messages, start=start):
         message_with_feedback(message, i)
 
+def _load_older_messages() -> None:
+    st.session_state["history_pages"] += 1
+
 #------------------------------------------------------------------------------
 # CONFIGURATION AND SESSION STATE MANAGEMENT
 #------------------------------------------------------------------------------
@@ -92,6 +124,11 @@ def setup_sidebar() -> None:
         
         st.markdown('<hr class="sidebar-hr">', unsafe_allow_html=True)
         
+        # Conversation section
+        _configure_conversation()
+        
+        st.markdown('<hr class="sidebar-hr">', unsafe_allow_html=True)
+        
         # About section
         _display_about_section()
         
@@ -133,6 +170,13 @@ def _configure_feature_toggles() -> None:
         key="show_thinking"
     )
     
+    # Toggle for the per-turn latency breakdown in the steps
+    st.toggle(
+        "Show Latency Breakdown",
+        value=st.session_state.get("show_latency", False),
+        key="show_latency"
+    )
+    
     # Configure streaming toggle based on provider support
     selected_provider = st.session_state.get("provider_select")
     provider_supports_streaming = get_streaming_status(selected_provider)
@@ -150,6 +194,13 @@ def _configure_feature_toggles() -> None:
         provider_label = st.secrets["provider_labels"][selected_provider]
         st.caption(f"Note: disabled streaming for {provider_label}")
 
+def _configure_conversation() -> None:
+    """Configure the conversation controls in the sidebar."""
+    st.markdown('<h3 class="sidebar-heading">Conversation</h3>', unsafe_allow_html=True)
+    st.button("New Conversation", key="new_conversation", on_click=start_new_conversation)
+    if get_conversation_store() is not None:
+        st.caption("Bookmark this page to come back to the conversation.")
+
 def _display_about_section() -> None:
     """Display the about section in the sidebar."""
     st.markdown('<h3 class="sidebar-heading">About</h3>', unsafe_allow_html=True)
@@ -164,29 +215,95 @@ def get_streaming_status(provider: str) -> bool:
     """
     Determine if streaming is supported for a given provider.
     
+    Every provider streams (chat completions chunks are normalized, see
+    src/agent/streaming.py); `streaming = false` in a provider's section opts out.
+    
     Args:
         provider: The LLM provider name
         
     Returns:
         Boolean indicating if streaming is supported
     """
-    non_streaming_providers = {
-        "anthropic": False, # As of 2025-03, Anthropic didn't readily support agent.stream_events()
-    }
-    return non_streaming_providers.get(provider, True)
+    return bool(st.secrets.get(provider, {}).get("streaming", True))
 
 def initialize_session_state() -> None:
     """Initialize all session state variables used in the app."""
     defaults = {
-        "messages": [],
         "llm_provider": None,
         "model": None,
+        "provider_fingerprint": None,
+        "provider_settings": None,
+        "history_summary": ConversationSummary(),
+        "history_pages": 1,
+        "session_id": uuid.uuid4().hex,
         "api_key_missing": True,
     }
     
     # Set default values for any uninitialized state
     for key, default_value in defaults.items():
         st.session_state.setdefault(key, default_value)
+    
+    if "conversation_id" not in st.session_state:
+        restore_conversation(st.query_params.get("c") or uuid.uuid4().hex)
+    elif st.session_state["history"].evicted:
+        # The session was idle and its messages were dropped from memory
+        restore_conversation(st.session_state["conversation_id"])
+    st.session_state["history"].touch()
+    get_session_registry().sweep(config.get_idle_evict_after(st.secrets))
+
+def restore_conversation(conversation_id: str) -> None:
+    """
+    Make the given conversation the session's, loading it from the store if persisted.
+    
+    The id is kept in the `c` query parameter, so reloading the page resumes it.
+    Only the most recent messages are loaded into memory; older ones not yet
+    folded into the history summary are read back from the store for each turn.
+    """
+    st.session_state["conversation_id"] = conversation_id
+    st.query_params["c"] = conversation_id
+    
+    history = SessionHistory()
+    store = get_conversation_store()
+    if store is not None:
+        summary = store.load_summary(conversation_id) or ConversationSummary()
+        count = store.count_messages(conversation_id)
+        offset = max(0, count - config.get_max_resident_messages(st.secrets))
+        history = SessionHistory(
+            [ChatMessage.from_dict(message) for message in store.load_messages(conversation_id, offset)],
+            offset=offset,
+        )
+        st.session_state["history_summary"] = summary
+    st.session_state["history"] = history
+    get_session_registry().register(st.session_state["session_id"], history)
+
+def start_new_conversation() -> None:
+    """Start an empty conversation with a new id."""
+    for key in [key for key in st.session_state if str(key).startswith("feedback_")]:
+        del st.session_state[key]
+    st.session_state["history_summary"] = ConversationSummary()
+    st.session_state["history_pages"] = 1
+    restore_conversation(uuid.uuid4().hex)
+
+def persist_message(index: int) -> None:
+    """Write a message of the session to the conversation store, if enabled."""
+    store = get_conversation_store()
+    if store is not None:
+        message = st.session_state["history"].get(index)
+        try:
+            stored = store.append_message(st.session_state["conversation_id"], index, message.to_dict())
+        except ValueError as exc:
+            # The store missed earlier messages, e.g. it was enabled mid-conversation
+            logger.warning("message %d was not stored: %s", index, exc)
+            return
+        if not stored:
+            logger.warning(
+                "message %d of conversation %s was already stored by another session",
+                index, st.session_state["conversation_id"],
+            )
+            st.warning(
+                "This conversation was continued in another tab, so this message was not saved. "
+                "Reload the page to see the latest conversation."
+            )
 
 def get_provider_api_key(provider: str, provider_label: str) -> Optional[str]:
     """
@@ -213,6 +330,10 @@ def get_provider_api_key(provider: str, provider_label: str) -> Optional[str]:
     
     return api_key
 
+def get_provider_fingerprint(provider_config) -> str:
+    """Hash a provider's secrets section, see config.get_provider_fingerprint."""
+    return config.get_provider_fingerprint(provider_config)
+
 def configure_llm_client(provider: str, provider_label: str) -> None:
     """
     Configure the LLM client based on the selected provider.
@@ -231,19 +352,10 @@ def configure_llm_client(provider: str, provider_label: str) -> None:
     st.session_state["api_key_missing"] = False
     st.session_state["llm_provider"] = provider
     st.session_state["model"] = provider_config.get("model")
+    st.session_state["provider_fingerprint"] = get_provider_fingerprint(provider_config)
     
-    # Initialize LLM client
-    client = AsyncOpenAI(
-        api_key=api_key, 
-        base_url=provider_config.get("base_url")
-    )
-    set_default_openai_client(client)
-    
-    # Configure provider-specific settings
-    if provider != "openai":
-        # Non-OpenAI providers only support chat completions API
-        set_default_openai_api("chat_completions")
-        set_tracing_disabled(True)
+    # Keep the provider settings per session; each run gets its own RunConfig
+    st.session_state["provider_settings"] = config.get_provider_settings(st.secrets, provider, api_key=api_key)
     
     st.sidebar.success(f"Configured {provider_label} client!")
 
@@ -263,91 +375,164 @@ def get_emojis(provider: str) -> Tuple[str, str]:
     return emojis.get(provider, ("🐱", "🤖"))
 
 
-def get_conversation_history_for_agent(messages: List[Dict]) -> List[Dict]:
+def get_conversation_history_for_agent(messages: List[ChatMessage]) -> List[Dict]:
     """
     Prepares a clean conversation history for LLM input by stripping out
-    non-relevant metadata (like emojis).
+    non-relevant metadata (like emojis). Empty messages, which some providers
+    reject, get a placeholder rather than being dropped, so positions still
+    line up with the history summary.
     """
-    return [
-        {"role": msg.get("role", "user"), "content": msg.get("content", "")}
-        for msg in messages
-        if "content" in msg
-    ]
+    return [{"role": message.role, "content": message.content or EMPTY_MESSAGE} for message in messages]
 
-#------------------------------------------------------------------------------
-# RESPONSE STREAMING AND PROCESSING
-#------------------------------------------------------------------------------
+def get_history_manager(settings: ProviderSettings, run_config: RunConfig) -> HistoryManager:
+    """
+    Build the history manager for a provider from its secrets configuration.
+    
+    Args:
+        settings: The session's provider settings
+        run_config: The run configuration used for LLM summarization
+        
+    Returns:
+        A HistoryManager with the provider's token budget and window size
+    """
+    return config.get_history_manager(st.secrets, settings, run_config)
 
-async def generate_response_stream(agent: Agent, prompt: str) -> AsyncGenerator[Dict, None]:
-    """Yields token deltas and agent handover updates."""
-    result = Runner.run_streamed(agent, input=prompt)
-    current_agent = agent.name
+def get_pre_router() -> PreRouter:
+    """Build the fast-path pre-router from the [routing] secrets section."""
+    return config.get_pre_router(st.secrets)
 
-    async for event in result.stream_events():
-        
-        if event.type == "agent_updated_stream_event":
-            new_agent = event.new_agent.name
-            if new_agent != current_agent:
-                print(f"[agent handover]: {current_agent} -> {new_agent}")
-                yield {"step": f"🔄 Handover **{current_agent}** -> **{new_agent}**"}
-                current_agent = new_agent
-        elif event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
-            yield {"delta": event.data.delta}
-
-def process_handoffs(result) -> List[str]:
-    """Processes handoff events from HandoffOutputItem and returns steps list."""
-    steps = []
-    for item in result.new_items:
-        if isinstance(item, HandoffOutputItem):
-            steps.append(f"🔄 Handover **{item.source_agent.name}** -> **{item.target_agent.name}**")
-    return steps
-
-async def get_agent_response(agent: Agent, prompt: str, stream: bool = False) -> Dict:
-    """Unified function to get agent response with optional streaming."""
-    if stream:
-        generator = generate_response_stream(agent, prompt)
-        full_response = ""
-        steps = []
-        
-        async for chunk in generator:
-            if "delta" in chunk:
-                full_response += chunk["delta"]
-            elif "step" in chunk:
-                steps.append(chunk["step"])
-        
-        return {"response": full_response, "steps": steps}
-    else:
-        result = await Runner.run(agent, input=prompt)
-        steps = process_handoffs(result)
-        return {"response": result.final_output, "steps": steps}
+def start_metrics_exporter() -> None:
+    """Serve the /metrics endpoint if enabled in the [metrics] secrets section."""
+    config.start_metrics_exporter(st.secrets)
+
+def get_conversation_store() -> Optional[ConversationStore]:
+    """
+    Get the conversation store configured in the [store] secrets section.
+    
+    Returns:
+        The shared store backend, or None if persistence is disabled
+    """
+    return config.get_conversation_store(st.secrets)
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Get the response cache configured in the [cache] secrets section.
+    
+    Returns:
+        The shared cache backend, or None if caching is disabled
+    """
+    return config.get_response_cache(st.secrets)
 
 #------------------------------------------------------------------------------
 # UI RESPONSE RENDERING
 #------------------------------------------------------------------------------
 
-def render_streaming_response(generator, agent_emoji: str) -> Dict:
-    """Renders streaming content to Streamlit."""
+DEFAULT_RENDER_FPS = 12.0
+DEFAULT_FLUSH_CHARS = 400
+# Seconds without output before the script checks for new input or a closed tab
+CANCEL_CHECK_INTERVAL = 0.25
+
+class StreamRenderer:
+    """
+    Coalesces streamed text deltas into periodic markdown updates.
+    
+    Re-rendering the whole message on every token is quadratic in response length,
+    so deltas are buffered and flushed at most `fps` times per second, or sooner
+    once `flush_chars` characters are pending.
+    """
+    
+    def __init__(self, container, fps: float = DEFAULT_RENDER_FPS, flush_chars: int = DEFAULT_FLUSH_CHARS) -> None:
+        self._container = container
+        self._interval = 1.0 / fps if fps > 0 else 0.0
+        self._flush_chars = flush_chars
+        self._parts: List[str] = []
+        self._pending = 0
+        self._last_flush = time.monotonic()
+    
+    @property
+    def text(self) -> str:
+        """The full text received so far."""
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+    
+    def append(self, delta: str) -> None:
+        """Buffer a delta and flush if the frame interval or size threshold is reached."""
+        self._parts.append(delta)
+        self._pending += len(delta)
+        if self._pending >= self._flush_chars:
+            self.flush()
+        else:
+            self.tick()
+    
+    def tick(self) -> None:
+        """Flush if the frame interval has passed, so a stalled stream still shows its last deltas."""
+        if self._pending and time.monotonic() - self._last_flush >= self._interval:
+            self.flush()
+    
+    def flush(self) -> None:
+        """Render everything buffered so far."""
+        if self._pending:
+            self._container.markdown(self.text)
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+def render_streaming_response(generator, agent_emoji: str, handle: Optional[TurnHandle] = None) -> Dict:
+    """Renders streaming content to Streamlit, recording it on the turn handle if given."""
     with st.chat_message("assistant", avatar=agent_emoji):
         steps_expander = st.expander("Steps")
         message_container = st.empty()
+        heartbeat = st.empty()
         
-        full_response = ""
+        streaming_config = st.secrets.get("streaming", {})
+        renderer = StreamRenderer(
+            message_container,
+            fps=streaming_config.get("render_fps", DEFAULT_RENDER_FPS),
+            flush_chars=streaming_config.get("flush_chars", DEFAULT_FLUSH_CHARS),
+        )
         steps = []
         
-        async def stream_response():
-            nonlocal full_response, steps
-            async for chunk in generator:
-                if "delta" in chunk:
-                    full_response += chunk["delta"]
-                    message_container.markdown(full_response)
-                elif "step" in chunk:
-                    steps.append(chunk["step"])
-                    steps_expander.markdown("\n".join(steps))
-            return {"response": full_response, "steps": steps}
-        
-        # Streamlit requires running the async function in a thread
-        final_result = asyncio.run(stream_response())
-        return final_result
+        # The generator runs on the shared client loop; chunks are rendered on the script thread
+        for chunk in get_client_manager().iterate(generator, handle=handle, heartbeat=CANCEL_CHECK_INTERVAL):
+            if chunk is None:
+                # Sending an element lets Streamlit interrupt the run for new input or a disconnect
+                heartbeat.empty()
+                renderer.tick()
+                continue
+            if handle is not None:
+                handle.record(chunk)
+            if "delta" in chunk:
+                renderer.append(chunk["delta"])
+            elif "step" in chunk:
+                steps.append(chunk["step"])
+                steps_expander.markdown("\n".join(steps))
+            elif "status" in chunk and not renderer.text:
+                # Show the queue position until the first token arrives
+                message_container.caption(format_status(chunk) or "Thinking...")
+        renderer.flush()
+        return {"response": renderer.text, "steps": steps}
+
+def collect_with_status(generator, handle: Optional[TurnHandle] = None) -> Dict:
+    """Collects a response behind a spinner that shows the queue position while waiting."""
+    status = st.empty()
+    heartbeat = st.empty()
+    parts = []
+    steps = []
+    with st.spinner("Thinking..."):
+        for chunk in get_client_manager().iterate(generator, handle=handle, heartbeat=CANCEL_CHECK_INTERVAL):
+            if chunk is None:
+                heartbeat.empty()
+                continue
+            if handle is not None:
+                handle.record(chunk)
+            if "delta" in chunk:
+                parts.append(chunk["delta"])
+            elif "step" in chunk:
+                steps.append(chunk["step"])
+            elif "status" in chunk:
+                status.caption(format_status(chunk))
+    status.empty()
+    return {"response": "".join(parts), "steps": steps}
 
 def render_static_response(response: Dict, agent_emoji: str) -> Dict:
     """Renders static response to Streamlit."""
@@ -362,7 +547,7 @@ def render_static_response(response: Dict, agent_emoji: str) -> Dict:
 # CHAT INTERACTION HANDLER
 #------------------------------------------------------------------------------
 
-def handle_chat_interaction(agent: Agent) -> None:
+def handle_chat_interaction(graph: AgentGraph) -> None:
     """Handles chat interaction with streaming/non-streaming options."""
     if prompt := st.chat_input("Ask me anything...", key="chat_input"):
         # Setup chat environment and display user message
@@ -372,53 +557,165 @@ def handle_chat_interaction(agent: Agent) -> None:
         # Display and save user message
         display_user_message(prompt, user_emoji)
         
-        # Get agent response
-        response = get_response(agent, agent_emoji)
+        # Get agent response; new input or leaving the page cancels the turn
+        turns = get_turn_registry()
+        handle = turns.begin(st.session_state["session_id"])
+        try:
+            response = get_response(graph, agent_emoji, handle)
+        except (RerunException, StopException) as exc:
+            # Keep what was generated so far, marked as cancelled, before Streamlit moves on
+            handle.cancel(SUPERSEDED if isinstance(exc, RerunException) else STOPPED)
+            finish_turn(handle.partial(), agent_emoji)
+            raise
+        except concurrent.futures.CancelledError:
+            response = handle.partial()
+        finally:
+            turns.finish(handle)
         
-        # Save assistant message and update UI
-        save_assistant_message(response, agent_emoji)
+        finish_turn(response, agent_emoji)
         st.rerun()
 
+def finish_turn(response: Dict, agent_emoji: str) -> None:
+    """Save the assistant message and the history summary, then trim the resident history."""
+    # A turn cancelled before its first token has nothing worth keeping
+    if response["response"]:
+        save_assistant_message(response, agent_emoji)
+    store = get_conversation_store()
+    if store is not None:
+        store.save_summary(st.session_state["conversation_id"], st.session_state["history_summary"])
+    
+    # Keep the session's memory bounded; stored messages are read back when needed,
+    # without a store only those folded into the summary can go
+    st.session_state["history"].trim(
+        config.get_max_resident_messages(st.secrets),
+        keep_from=None if store is not None else st.session_state["history_summary"].folded,
+    )
+
 def display_user_message(prompt: str, user_emoji: str) -> None:
     """Display and save the user message."""
     # Save user message to session state
-    st.session_state["messages"].append({
-        "role": "user",
-        "content": prompt,
-        "emoji": user_emoji
-    })
+    index = st.session_state["history"].append(ChatMessage("user", prompt, emoji=user_emoji))
+    persist_message(index)
     
     # Display in chat UI
     with st.chat_message("user", avatar=user_emoji):
         st.markdown(prompt)
 
-def get_response(agent: Agent, agent_emoji: str) -> Dict:
+def get_response(graph: AgentGraph, agent_emoji: str, handle: Optional[TurnHandle] = None) -> Dict:
     """Get appropriate response based on API key status and streaming preference."""
-    conversation_history = get_conversation_history_for_agent(st.session_state["messages"])
     use_streaming = st.session_state.get("use_streaming", True)
     
-    # Debug information
-    print(f"[debug - conversation_history]: {conversation_history}")
-    print(f"[debug - model]: {st.session_state.get('model')}")
-    
     # Handle missing API key
     if st.session_state.get("api_key_missing", True):
         return {"response": "No API key provided, so here's a default joke: Why did the coffee file a police report? It got mugged.", "steps": []}
     
+    # Route this session's runs to its own provider
+    run_config = build_run_config(st.session_state["provider_settings"])
+    
+    # Keep the conversation within the model's token budget
+    history_manager = get_history_manager(st.session_state["provider_settings"], run_config)
+    history = st.session_state["history"]
+    summary = st.session_state["history_summary"]
+    # Messages trimmed from memory before they were folded into the summary are read back
+    start = min(summary.folded, history.offset)
+    store = get_conversation_store()
+    if store is None:
+        start = history.offset
+    conversation_history = get_client_manager().run(history_manager.build(
+        get_conversation_history_for_agent(history.since(
+            start, lambda offset, limit: store.load_messages(st.session_state["conversation_id"], offset, limit)
+        )),
+        summary,
+        offset=start,
+    ))
+    
+    logger.debug(
+        "turn with %d history messages, model %s",
+        len(conversation_history), st.session_state.get("model"),
+    )
+    
+    # Skip the triage hop for obvious requests
+    route = get_pre_router().route(graph, conversation_history)
+    agent = route.agent
+    
+    # Serve repeated prompts from the response cache
+    settings = st.session_state["provider_settings"]
+    cache = get_response_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = make_cache_key(
+            settings.provider,
+            settings.model,
+            agent.name,
+            conversation_history,
+            tail_messages=config.get_cache_tail_messages(st.secrets),
+            match=config.get_cache_match(st.secrets),
+        )
+    
+    # Optionally start the likely specialist while the triage agent decides
+    speculator = config.get_speculator(st.secrets) if route.path == "triage" else None
+    speculative_agent = None
+    if speculator is not None:
+        predicted = speculator.predict(st.session_state["session_id"], graph, conversation_history)
+        speculative_agent = predicted.name if predicted is not None else None
+    
+    # Admit runs within the provider's rate limits, optionally failing over or
+    # hedging across the other configured providers
+    start = make_agent_starter(
+        lambda candidate: config.get_provider_graph(st.secrets, candidate),
+        agent.name,
+        conversation_history,
+        stream=use_streaming,
+        run_configs={settings.provider: run_config},
+        scheduler=config.get_scheduler(st.secrets),
+        session_id=st.session_state["session_id"],
+        speculative_agent=speculative_agent,
+    )
+    policy = config.get_failover_policy(st.secrets)
+    dispatcher = None
+    metrics = None
+    if policy.enabled:
+        dispatcher = ProviderDispatcher(
+            config.get_failover_candidates(st.secrets, settings), policy, start, streaming=use_streaming
+        )
+        generator = dispatcher.stream()
+    else:
+        # Record TTFT, handoff, tool and token metrics for this turn
+        metrics = TurnMetrics(provider=settings.provider, model=settings.model)
+        generator = start(settings, metrics)
+    
+    # Sessions sending the same conversation at the same time share one run
+    flights = config.get_single_flight(st.secrets)
+    if flights is not None:
+        generator = flights.stream(
+            make_flight_key(settings.provider, settings.model, agent.name, conversation_history), generator,
+            metrics=metrics,
+        )
+    if cache is not None:
+        generator = cached_response_stream(cache, cache_key, generator)
+    generator = prepend_steps([route.step], generator)
+    
     # Get response using appropriate method
     if use_streaming:
-        generator = generate_response_stream(agent, conversation_history)
-        return render_streaming_response(generator, agent_emoji)
+        response = render_streaming_response(generator, agent_emoji, handle)
     else:
-        with st.spinner("Thinking..."):
-            response = asyncio.run(get_agent_response(agent, conversation_history, stream=False))
-        return render_static_response(response, agent_emoji)
+        response = render_static_response(collect_with_status(generator, handle), agent_emoji)
+    
+    if dispatcher is not None:
+        metrics = dispatcher.metrics
+    if speculator is not None:
+        speculator.record(st.session_state["session_id"], response["steps"])
+    
+    # Cache hits never start a run, so close the turn here; a coalesced follower's was discarded
+    if metrics is not None and not metrics.discarded:
+        metrics.finish()
+        if st.session_state.get("show_latency", False):
+            response["steps"].extend(metrics.breakdown_steps())
+    return response
 
 def save_assistant_message(response: Dict, agent_emoji: str) -> None:
     """Save assistant message to session state."""
-    st.session_state["messages"].append({
-        "role": "assistant",
-        "content": response["response"],
-        "emoji": agent_emoji,
-        "steps": response["steps"]
-    })
\ No newline at end of file
+    index = st.session_state["history"].append(
+        ChatMessage("assistant", response["response"], emoji=agent_emoji, steps=response["steps"])
+    )
+    persist_message(index)
\ No newline at end of file
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from benchmarks.fake_openai import FakeOpenAIServer, FakeServerConfig
+from src.agent.clients import get_client_manager
+from src.cli.batch import read_conversations, run_batch
+
+LINES = [
+    '{"id": "joke", "prompt": "tell me a joke"}',
+    '{"id": "riddle", "messages": [{"role": "user", "content": "a riddle please"}]}',
+    '{"id": "broken", "prompt": ',
+    '{"id": "empty"}',
+    '',
+]
+
+
+@pytest.fixture
+def batch(tmp_path):
+    """Run batches against the fake server; returns a runner and the output path."""
+    manager = get_client_manager()
+    fake = FakeOpenAIServer(FakeServerConfig(ttft=0.0, token_rate=0, tokens=5, handoff="none"))
+    base_url = manager.run(fake.start())
+    config = {"providers": {"active": ["xai"]}, "xai": {"api_key": "key", "model": "model", "base_url": base_url}}
+    input_path = tmp_path / "prompts.jsonl"
+    input_path.write_text("\n".join(LINES) + "\n", encoding="utf-8")
+    output_path = tmp_path / "results.jsonl"
+
+    def run():
+        return manager.run(run_batch(config, ["xai"], str(input_path), str(output_path), concurrency=2))
+
+    yield run, output_path
+    manager.run(fake.stop())
+
+
+def results(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_invalid_lines_are_reported_per_record(tmp_path):
+    path = tmp_path / "prompts.jsonl"
+    path.write_text("\n".join(LINES + ["[1, 2]"]), encoding="utf-8")
+    conversations = list(read_conversations(str(path)))
+    assert [c["id"] for c in conversations] == ["joke", "riddle", "3", "empty", "6"]
+    assert conversations[0]["messages"] == [{"role": "user", "content": "tell me a joke"}]
+    assert "invalid JSON" in conversations[2]["error"]
+    assert "prompt" in conversations[3]["error"]
+    assert "JSON object" in conversations[4]["error"]
+
+
+def test_batch_records_bad_lines_and_resumes(batch):
+    run, output_path = batch
+    assert run() == {"skipped": 0, "ok": 2, "error": 2}
+    by_id = {record["id"]: record for record in results(output_path)}
+    assert by_id["joke"]["status"] == by_id["riddle"]["status"] == "ok"
+    assert by_id["joke"]["response"]
+    assert by_id["3"]["status"] == by_id["empty"]["status"] == "error"
+
+    # A result of a conversation no longer in the input is not counted as skipped
+    with open(output_path, "a", encoding="utf-8") as out:
+        out.write(json.dumps({"id": "gone", "provider": "xai", "status": "ok"}) + "\n")
+    assert run() == {"skipped": 2, "ok": 0, "error": 2}
+    assert len(results(output_path)) == 7
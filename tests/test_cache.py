@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from src.agent import cache as cache_module
+from src.agent.cache import (
+    MATCH_EXACT,
+    MemoryResponseCache,
+    SQLiteResponseCache,
+    make_cache_key,
+)
+from src.agent.messages import format_handoff
+from src.agent.pipeline import CACHE_HIT_STEP, cached_response_stream
+
+MESSAGES = [{"role": "user", "content": "Tell me a joke!"}]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Wall clock of the cache module, advanced by hand."""
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def make(ttl=60.0, max_entries=10):
+        if request.param == "sqlite":
+            return SQLiteResponseCache(str(tmp_path / "cache.sqlite3"), ttl=ttl, max_entries=max_entries)
+        return MemoryResponseCache(ttl=ttl, max_entries=max_entries)
+    return make
+
+
+def test_normalized_keys_ignore_case_punctuation_and_whitespace():
+    similar = [{"role": "user", "content": "  tell me a JOKE "}]
+    assert make_cache_key("openai", "m", "Agent", MESSAGES) == make_cache_key("openai", "m", "Agent", similar)
+    assert make_cache_key("openai", "m", "Agent", MESSAGES) != make_cache_key("xai", "m", "Agent", similar)
+
+
+def test_exact_keys_compare_the_messages_as_sent():
+    similar = [{"role": "user", "content": "tell me a joke"}]
+    exact = make_cache_key("openai", "m", "Agent", MESSAGES, match=MATCH_EXACT)
+    assert exact == make_cache_key("openai", "m", "Agent", list(MESSAGES), match=MATCH_EXACT)
+    assert exact != make_cache_key("openai", "m", "Agent", similar, match=MATCH_EXACT)
+    with pytest.raises(ValueError):
+        make_cache_key("openai", "m", "Agent", MESSAGES, match="fuzzy")
+
+
+def test_entries_expire_after_the_ttl(make_cache, clock):
+    cache = make_cache(ttl=60.0)
+    cache.set("key", {"response": "hi", "steps": []})
+    clock[0] += 59
+    assert cache.get("key") == {"response": "hi", "steps": []}
+    clock[0] += 2
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_entries_are_evicted(make_cache, clock):
+    cache = make_cache(max_entries=2)
+    cache.set("a", {"response": "a", "steps": []})
+    clock[0] += 1
+    cache.set("b", {"response": "b", "steps": []})
+    clock[0] += 1
+    assert cache.get("a") is not None
+    clock[0] += 1
+    cache.set("c", {"response": "c", "steps": []})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_sqlite_cache_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteResponseCache(path).set("key", {"response": "hi", "steps": []})
+    assert SQLiteResponseCache(path).get("key") == {"response": "hi", "steps": []}
+
+
+def test_only_handoff_steps_are_cached():
+    cache = MemoryResponseCache()
+    handoff = format_handoff("Triage", "Riddle Master")
+
+    async def run():
+        yield {"step": "⏳ Queued 1.2s for **openai**"}
+        yield {"step": handoff}
+        yield {"step": "🛰️ Answered by **xai** after failover"}
+        yield {"delta": "Why "}
+        yield {"delta": "not?"}
+
+    async def collect(generator):
+        return [chunk async for chunk in generator]
+
+    live = asyncio.run(collect(cached_response_stream(cache, "key", run())))
+    assert len([chunk for chunk in live if "step" in chunk]) == 4
+    assert cache.get("key") == {"response": "Why not?", "steps": [handoff]}
+
+    replayed = asyncio.run(collect(cached_response_stream(cache, "key", run())))
+    assert [chunk["step"] for chunk in replayed if "step" in chunk] == [CACHE_HIT_STEP, handoff]
+    assert "".join(chunk.get("delta", "") for chunk in replayed) == "Why not?"
@@ -0,0 +1,23 @@
+from src.agent.clients import ClientManager
+
+
+async def _noop():
+    pass
+
+
+def test_least_recently_used_client_is_evicted_and_closed():
+    manager = ClientManager(max_clients=2)
+    try:
+        first = manager.get_client("openai", None, "key-1")
+        second = manager.get_client("openai", None, "key-2")
+        assert manager.get_client("openai", None, "key-1") is first
+
+        manager.get_client("openai", None, "key-3")
+        # Closing runs on the client loop; the next run on it comes after
+        manager.run(_noop())
+        assert second.is_closed()
+        assert not first.is_closed()
+        assert manager.get_client("openai", None, "key-1") is first
+        assert manager.get_client("openai", None, "key-2") is not second
+    finally:
+        manager.close()
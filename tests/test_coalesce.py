@@ -0,0 +1,137 @@
+import asyncio
+
+from src.agent.coalesce import COALESCED_STEP, SingleFlight, make_flight_key
+from src.agent.metrics import TurnMetrics, get_metrics_registry
+
+
+def fake_run(chunks, delay=0.05, started=None, error=None):
+    async def generator():
+        if started is not None:
+            started.append(True)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield chunk
+        if error is not None:
+            raise error
+    return generator()
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_identical_requests_share_one_run():
+    chunks = [{"step": "s"}, {"delta": "a"}, {"delta": "b"}]
+
+    async def main():
+        flights = SingleFlight()
+        started = []
+        leader = asyncio.ensure_future(collect(flights.stream("k", fake_run(chunks, started=started))))
+        await asyncio.sleep(0.08)  # joins after the first chunk and gets it replayed
+        follower = await collect(flights.stream("k", fake_run(chunks, started=started)))
+        return await leader, follower, started, len(flights)
+
+    leader, follower, started, in_flight = asyncio.run(main())
+    assert started == [True]
+    assert leader == chunks
+    assert follower == [{"step": COALESCED_STEP}] + chunks
+    assert in_flight == 0
+
+
+def test_requests_after_the_flight_start_a_new_run():
+    async def main():
+        flights = SingleFlight()
+        started = []
+        await collect(flights.stream("k", fake_run([{"delta": "a"}], started=started)))
+        await collect(flights.stream("k", fake_run([{"delta": "a"}], started=started)))
+        return started
+
+    assert asyncio.run(main()) == [True, True]
+
+
+def test_status_chunks_are_not_replayed():
+    chunks = [{"status": "queued", "provider": "p", "position": 1}, {"delta": "a"}]
+
+    async def main():
+        flights = SingleFlight()
+        leader = asyncio.ensure_future(collect(flights.stream("k", fake_run(chunks))))
+        await asyncio.sleep(0.07)
+        follower = await collect(flights.stream("k", fake_run(chunks)))
+        return await leader, follower
+
+    leader, follower = asyncio.run(main())
+    assert leader == chunks
+    assert follower == [{"step": COALESCED_STEP}, {"delta": "a"}]
+
+
+def test_run_error_reaches_every_subscriber():
+    async def main():
+        flights = SingleFlight()
+        run = fake_run([{"delta": "a"}], error=RuntimeError("boom"))
+        streams = [flights.stream("k", run), flights.stream("k", fake_run([]))]
+        return await asyncio.gather(*(collect(s) for s in streams), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_run_continues_until_last_subscriber_leaves():
+    async def main():
+        flights = SingleFlight()
+        produced = []
+
+        async def run():
+            for i in range(20):
+                await asyncio.sleep(0.02)
+                produced.append(i)
+                yield {"delta": str(i)}
+
+        first = asyncio.ensure_future(collect(flights.stream("k", run())))
+        second = asyncio.ensure_future(collect(flights.stream("k", fake_run([]))))
+        await asyncio.sleep(0.1)
+        first.cancel()
+        await asyncio.sleep(0.1)
+        still_running = len(produced)
+        second.cancel()
+        await asyncio.sleep(0.1)
+        stopped_at = len(produced)
+        await asyncio.sleep(0.1)
+        return still_running, stopped_at, len(produced), len(flights)
+
+    still_running, stopped_at, finally_produced, in_flight = asyncio.run(main())
+    assert still_running > 5
+    assert finally_produced == stopped_at < 20
+    assert in_flight == 0
+
+
+def test_followers_do_not_record_turn_metrics():
+    registry = get_metrics_registry()
+    labels = {"provider": "coalesce-test", "model": "m"}
+
+    async def main():
+        flights = SingleFlight()
+        leader_metrics = TurnMetrics(provider="coalesce-test", model="m")
+        follower_metrics = TurnMetrics(provider="coalesce-test", model="m")
+        leader = asyncio.ensure_future(collect(flights.stream("k", fake_run([{"delta": "a"}]), metrics=leader_metrics)))
+        await asyncio.sleep(0)
+        await collect(flights.stream("k", fake_run([{"delta": "a"}]), metrics=follower_metrics))
+        await leader
+        return leader_metrics, follower_metrics
+
+    before = registry.get("agent_turns_total", status="ok", **labels)
+    followers_before = registry.get("agent_coalesced_requests_total", role="follower")
+    leader_metrics, follower_metrics = asyncio.run(main())
+    # As the UI and API do once the stream is consumed
+    for metrics in (leader_metrics, follower_metrics):
+        if not metrics.discarded:
+            metrics.finish()
+    assert follower_metrics.discarded and not leader_metrics.discarded
+    assert registry.get("agent_turns_total", status="ok", **labels) == before + 1
+    assert registry.get("agent_coalesced_requests_total", role="follower") == followers_before + 1
+
+
+def test_flight_key_covers_whole_conversation():
+    first = [{"role": "user", "content": "tell me a riddle"}]
+    longer = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hey"}] + first
+    assert make_flight_key("p", "m", "agent", first) != make_flight_key("p", "m", "agent", longer)
+    assert make_flight_key("p", "m", "agent", first) == make_flight_key("p", "m", "agent", [dict(m) for m in first])
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from src.agent.failover import FailoverPolicy, ProviderDispatcher
+from src.agent.providers import ProviderSettings
+
+PRIMARY = ProviderSettings("openai", "model-a", None, "key")
+BACKUP = ProviderSettings("xai", "model-b", None, "key")
+
+
+def make_start(scripts):
+    """A starter replaying a script per provider: chunks, ("sleep", seconds) or an exception."""
+    started = []
+
+    def start(settings, metrics):
+        started.append(settings.provider)
+
+        async def generator():
+            for item in scripts[settings.provider]:
+                if isinstance(item, tuple):
+                    await asyncio.sleep(item[1])
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+
+        return generator()
+
+    return start, started
+
+
+def collect(dispatcher):
+    async def main():
+        return [chunk async for chunk in dispatcher.stream()]
+    return asyncio.run(main())
+
+
+def test_error_fails_over_to_next_provider():
+    start, started = make_start({"openai": [RuntimeError("down")], "xai": [{"delta": "hi"}]})
+    dispatcher = ProviderDispatcher([PRIMARY, BACKUP], FailoverPolicy(failover=True), start)
+    chunks = collect(dispatcher)
+    assert started == ["openai", "xai"]
+    assert chunks[-1] == {"delta": "hi"}
+    assert "after failover" in chunks[0]["step"]
+
+
+def test_error_without_failover_is_raised():
+    start, _ = make_start({"openai": [RuntimeError("down")], "xai": [{"delta": "hi"}]})
+    dispatcher = ProviderDispatcher([PRIMARY, BACKUP], FailoverPolicy(hedge_after=5), start)
+    with pytest.raises(RuntimeError):
+        collect(dispatcher)
+
+
+def test_missing_first_token_fails_over():
+    start, started = make_start({"openai": [("sleep", 5), {"delta": "late"}], "xai": [{"delta": "hi"}]})
+    policy = FailoverPolicy(failover=True, first_token_timeout=0.1)
+    chunks = collect(ProviderDispatcher([PRIMARY, BACKUP], policy, start))
+    assert started == ["openai", "xai"]
+    assert chunks[-1] == {"delta": "hi"}
+
+
+def test_queue_wait_does_not_count_against_first_token_deadline():
+    queued = {"status": "queued", "provider": "openai", "position": 1}
+    running = {"status": "running", "provider": "openai"}
+    start, started = make_start({
+        "openai": [queued, ("sleep", 0.3), running, ("sleep", 0.05), {"delta": "hi"}],
+        "xai": [{"delta": "backup"}],
+    })
+    policy = FailoverPolicy(failover=True, first_token_timeout=0.2)
+    chunks = collect(ProviderDispatcher([PRIMARY, BACKUP], policy, start))
+    assert started == ["openai"]
+    assert chunks[:2] == [queued, running]
+    assert chunks[-1] == {"delta": "hi"}
+
+
+def test_first_token_deadline_runs_from_admission():
+    queued = {"status": "queued", "provider": "openai", "position": 1}
+    running = {"status": "running", "provider": "openai"}
+    start, started = make_start({
+        "openai": [queued, ("sleep", 0.05), running, ("sleep", 5), {"delta": "late"}],
+        "xai": [{"delta": "backup"}],
+    })
+    policy = FailoverPolicy(failover=True, first_token_timeout=0.2)
+    chunks = collect(ProviderDispatcher([PRIMARY, BACKUP], policy, start))
+    assert started == ["openai", "xai"]
+    assert chunks[-1] == {"delta": "backup"}
+
+
+def test_non_streaming_runs_have_no_first_token_deadline():
+    start, started = make_start({"openai": [("sleep", 0.3), {"delta": "whole answer"}], "xai": [{"delta": "backup"}]})
+    policy = FailoverPolicy(failover=True, first_token_timeout=0.1)
+    chunks = collect(ProviderDispatcher([PRIMARY, BACKUP], policy, start, streaming=False))
+    assert started == ["openai"]
+    assert chunks[-1] == {"delta": "whole answer"}
+
+
+def test_hedge_wins_and_slow_primary_is_kept_until_then():
+    start, started = make_start({"openai": [("sleep", 0.4), {"delta": "slow"}], "xai": [{"delta": "fast"}]})
+    # Without failover the first-token deadline does not drop the primary
+    policy = FailoverPolicy(first_token_timeout=0.05, hedge_after=0.1)
+    dispatcher = ProviderDispatcher([PRIMARY, BACKUP], policy, start)
+    chunks = collect(dispatcher)
+    assert started == ["openai", "xai"]
+    assert "as hedge" in chunks[0]["step"]
+    assert chunks[-1] == {"delta": "fast"}
+    assert dispatcher.winner.settings is BACKUP
+
+
+def test_hedge_only_primary_still_answers_after_deadline():
+    start, started = make_start({"openai": [("sleep", 0.2), {"delta": "primary"}], "xai": [("sleep", 5), {"delta": "hedge"}]})
+    policy = FailoverPolicy(first_token_timeout=0.05, hedge_after=0.1)
+    chunks = collect(ProviderDispatcher([PRIMARY, BACKUP], policy, start))
+    assert started == ["openai", "xai"]
+    assert chunks[-1] == {"delta": "primary"}
+
+
+def test_steps_of_losing_attempt_are_not_shown():
+    start, _ = make_start({
+        "openai": [{"step": "primary step"}, ("sleep", 0.5), {"delta": "slow"}],
+        "xai": [{"step": "hedge step"}, {"delta": "fast"}],
+    })
+    policy = FailoverPolicy(hedge_after=0.05)
+    chunks = collect(ProviderDispatcher([PRIMARY, BACKUP], policy, start))
+    steps = [chunk["step"] for chunk in chunks if "step" in chunk]
+    assert "hedge step" in steps and "primary step" not in steps
@@ -0,0 +1,85 @@
+import asyncio
+
+from src.agent.history import (
+    ConversationSummary,
+    HistoryManager,
+    cap_summary,
+    estimate_tokens,
+    extractive_summarizer,
+)
+
+
+def conversation(turns, chars=40):
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"question {turn} " + "x" * chars})
+        messages.append({"role": "assistant", "content": f"answer {turn} " + "y" * chars})
+    return messages
+
+
+def build(manager, messages, summary):
+    return asyncio.run(manager.build(messages, summary))
+
+
+def test_recent_turns_are_sent_verbatim_until_enough_extra_turns_pile_up():
+    manager = HistoryManager(token_budget=100000, keep_turns=2, fold_turns=2)
+    summary = ConversationSummary()
+    assert build(manager, conversation(4), summary) == conversation(4)
+    assert summary == ConversationSummary()
+
+    window = build(manager, conversation(5), summary)
+    assert summary.folded == 6
+    assert window[0]["role"] == "system" and "question 0" in window[0]["content"]
+    assert window[1:] == conversation(5)[6:]
+
+
+def test_window_folds_further_while_over_budget():
+    manager = HistoryManager(token_budget=200, keep_turns=6, fold_turns=0)
+    messages = conversation(6, chars=200)
+    start = manager._window_start(messages, ConversationSummary(), 0)
+    # About 57 tokens a message: only the latest turn fits
+    assert start == 10
+
+
+def test_window_keeps_the_latest_turn_over_budget():
+    manager = HistoryManager(token_budget=10, keep_turns=6, fold_turns=0)
+    assert manager._window_start(conversation(3, chars=400), ConversationSummary(), 0) == 4
+
+
+def test_summary_is_folded_incrementally():
+    seen = []
+
+    async def summarizer(summary, messages):
+        seen.append(len(messages))
+        return (summary + "\n" if summary else "") + f"{len(messages)} messages"
+
+    manager = HistoryManager(token_budget=100000, keep_turns=1, fold_turns=0, summarizer=summarizer)
+    summary = ConversationSummary()
+    build(manager, conversation(2), summary)
+    build(manager, conversation(3), summary)
+    assert seen == [2, 2]
+    assert summary == ConversationSummary("2 messages\n2 messages", 4)
+
+
+def test_summary_is_capped_to_its_share_of_the_budget():
+    manager = HistoryManager(token_budget=2000, keep_turns=6, fold_turns=4, summarizer=extractive_summarizer)
+    summary = ConversationSummary()
+    messages = []
+    for turn in conversation(300, chars=300):
+        messages.append(turn)
+        if turn["role"] == "user":
+            window = build(manager, messages, summary)
+    assert estimate_tokens(summary.text) <= manager.summary_tokens
+    assert "question 299" in window[-1]["content"]
+    assert sum(estimate_tokens(m["content"]) for m in window) <= 2000
+    # The newest folded messages are the ones kept
+    assert "question 0 " not in summary.text
+
+
+def test_cap_summary_keeps_the_latest_lines():
+    text = "\n".join(f"line {i} " + "z" * 36 for i in range(10))
+    capped = cap_summary(text, 35)
+    assert capped.splitlines()[-1].startswith("line 9")
+    assert estimate_tokens(capped) <= 35
+    assert cap_summary(text, 1000) == text
+    assert cap_summary("w" * 400, 10).endswith("w") and estimate_tokens(cap_summary("w" * 400, 10)) <= 10
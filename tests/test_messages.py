@@ -0,0 +1,62 @@
+from src.agent.messages import ChatMessage, Handoff, SessionHistory, SessionRegistry, format_handoff
+from src.agent.store import MemoryConversationStore
+
+
+def chat(count, store=None):
+    """A history of `count` messages, written to the store as well if given."""
+    history = SessionHistory()
+    for i in range(count):
+        index = history.append(ChatMessage("user" if i % 2 == 0 else "assistant", f"message {i}"))
+        if store is not None:
+            store.append_message("c", index, history.get(index).to_dict())
+    return history
+
+
+def contents(messages):
+    return [message.content for message in messages]
+
+
+def test_handoff_steps_are_stored_compactly():
+    message = ChatMessage("assistant", "hi", steps=[format_handoff("Triage", "Riddle Master"), "🔮 kept"])
+    assert message.steps == (Handoff("Triage", "Riddle Master"), "🔮 kept")
+    assert ChatMessage.from_dict(message.to_dict()).steps == message.steps
+
+
+def test_trim_caps_resident_messages_on_its_own():
+    history = chat(10)
+    assert history.trim(4) == 6
+    assert len(history) == 10 and history.offset == 6
+    assert contents(history.resident()) == ["message 6", "message 7", "message 8", "message 9"]
+    assert history.get(5) is None and history.get(6).content == "message 6"
+    assert history.trim(4) == 0
+
+
+def test_trim_keeps_messages_that_cannot_be_read_back():
+    history = chat(10)
+    assert history.trim(4, keep_from=3) == 3
+    assert history.offset == 3
+
+
+def test_trimmed_messages_are_read_back_from_the_store():
+    store = MemoryConversationStore()
+    history = chat(10, store)
+    history.trim(4)
+    load = lambda offset, limit: store.load_messages("c", offset, limit)
+    assert contents(history.since(2, load)) == [f"message {i}" for i in range(2, 10)]
+    assert contents(history.since(8, load)) == ["message 8", "message 9"]
+
+
+def test_idle_sessions_are_evicted_and_restored_from_the_store():
+    store = MemoryConversationStore()
+    history = chat(6, store)
+    registry = SessionRegistry()
+    registry.register("s", history)
+    history.last_active -= 100
+    assert registry.sweep(idle_after=10, force=True) == 1
+    assert history.evicted and history.resident() == [] and len(history) == 6
+
+    restored = SessionHistory([ChatMessage.from_dict(m) for m in store.load_messages("c", 2)], offset=2)
+    assert len(restored) == 6
+    assert contents(restored.since(0, lambda offset, limit: store.load_messages("c", offset, limit))) == [
+        f"message {i}" for i in range(6)
+    ]
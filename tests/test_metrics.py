@@ -0,0 +1,53 @@
+from src.agent.metrics import LATENCY_BUCKETS, MetricsRegistry, TurnMetrics
+
+
+def series(text):
+    """The sample lines of a Prometheus text rendering, by series name with labels."""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_counters_and_gauges_render_with_help_and_type():
+    registry = MetricsRegistry()
+    registry.inc("requests_total", "Requests.", provider="openai")
+    registry.inc("requests_total", "Requests.", 2, provider="openai")
+    registry.set_gauge("queued", "Waiting runs.", 3)
+    text = registry.render_prometheus()
+    assert "# HELP requests_total Requests.\n# TYPE requests_total counter\n" in text
+    assert "# TYPE queued gauge" in text
+    assert series(text) == {'requests_total{provider="openai"}': 3.0, "queued": 3.0}
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.inc("calls_total", "Calls.", tool='say "hi"\\\nbye')
+    assert 'calls_total{tool="say \\"hi\\"\\\\\\nbye"} 1' in registry.render_prometheus()
+
+
+def test_histograms_render_cumulative_buckets_sum_and_count():
+    registry = MetricsRegistry()
+    for value in (0.07, 0.3, 0.3, 100.0):
+        registry.observe("turn_seconds", "Turn latency.", value, provider="xai")
+    samples = series(registry.render_prometheus())
+    assert samples['turn_seconds_bucket{provider="xai",le="0.05"}'] == 0
+    assert samples['turn_seconds_bucket{provider="xai",le="0.1"}'] == 1
+    assert samples['turn_seconds_bucket{provider="xai",le="0.5"}'] == 3
+    assert samples[f'turn_seconds_bucket{{provider="xai",le="{LATENCY_BUCKETS[-1]}"}}'] == 3
+    assert samples['turn_seconds_bucket{provider="xai",le="+Inf"}'] == 4
+    assert samples['turn_seconds_count{provider="xai"}'] == 4
+    assert abs(samples['turn_seconds_sum{provider="xai"}'] - 100.67) < 1e-9
+
+
+def test_turn_is_aggregated_by_provider_and_model():
+    registry = MetricsRegistry()
+    turn = TurnMetrics(provider="xai", model="m")
+    turn.input_tokens, turn.cached_tokens = 100, 25
+    turn.total = 1.0
+    registry.observe_turn(turn)
+    samples = series(registry.render_prometheus())
+    assert samples['agent_turns_total{model="m",provider="xai",status="ok"}'] == 1
+    assert samples['agent_prompt_cache_hit_ratio{model="m",provider="xai"}'] == 0.25
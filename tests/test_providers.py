@@ -0,0 +1,25 @@
+from agents.tracing import processors
+
+from src.agent import config as agent_config
+from src.agent.providers import build_run_config, set_tracing_key
+
+
+def test_runs_are_not_traced_without_tracing_section():
+    config = {"openai": {"api_key": "sk-session", "model": "test-model"}}
+    settings = agent_config.get_provider_settings(config, "openai")
+    agent_config.get_provider_graph(config, settings)
+    assert build_run_config(settings).tracing_disabled
+
+
+def test_tracing_exports_with_operator_key():
+    config = {"openai": {"api_key": "sk-operator", "model": "test-model"}, "tracing": {"enabled": True}}
+    try:
+        agent_config.configure_tracing(config)
+        settings = agent_config.get_provider_settings(config, "openai", api_key="sk-session")
+        assert not build_run_config(settings).tracing_disabled
+        assert processors.default_exporter()._api_key == "sk-operator"
+
+        xai = agent_config.get_provider_settings({"xai": {"api_key": "key"}}, "xai")
+        assert build_run_config(xai).tracing_disabled
+    finally:
+        set_tracing_key(None)
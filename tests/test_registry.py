@@ -0,0 +1,40 @@
+from src.agent.config import get_provider_fingerprint
+from src.agent.registry import AgentRegistry
+
+SECTION = {"api_key": "key", "model": "model-a"}
+
+
+def test_graph_is_shared_while_the_configuration_is_unchanged():
+    registry = AgentRegistry()
+    fingerprint = get_provider_fingerprint(SECTION)
+    graph = registry.get("xai", "model-a", fingerprint=fingerprint)
+    assert registry.get("xai", "model-a", fingerprint=fingerprint) is graph
+    assert registry.get("xai", "model-a") is graph
+
+
+def test_changed_secrets_rebuild_the_graph_and_drop_the_stale_one():
+    registry = AgentRegistry()
+    stale = registry.get("xai", "model-a", fingerprint=get_provider_fingerprint(SECTION))
+    other_provider = registry.get("openai", "model-a", fingerprint="openai")
+
+    fresh = registry.get("xai", "model-a", fingerprint=get_provider_fingerprint(dict(SECTION, api_key="rotated")))
+    assert fresh is not stale
+    assert stale not in registry._graphs.values()
+    assert registry.get("openai", "model-a", fingerprint="openai") is other_provider
+
+
+def test_changed_model_rebuilds_the_graph_and_drops_the_stale_one():
+    registry = AgentRegistry()
+    stale = registry.get("xai", "model-a", fingerprint=get_provider_fingerprint(SECTION))
+    section = dict(SECTION, model="model-b")
+    fresh = registry.get("xai", "model-b", fingerprint=get_provider_fingerprint(section))
+    assert fresh is not stale
+    assert fresh.triage.model == "model-b"
+    assert list(registry._graphs.values()) == [fresh]
+
+
+def test_invalidate_drops_graphs():
+    registry = AgentRegistry()
+    graph = registry.get("xai", "model-a", fingerprint="f")
+    registry.invalidate("xai")
+    assert registry.get("xai", "model-a", fingerprint="f") is not graph
@@ -0,0 +1,66 @@
+import pytest
+
+from src.agent import config as agent_config
+from src.agent.agent import create_agent_graph
+from src.agent.router import KeywordClassifier, PreRouter
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return create_agent_graph(model="test-model")
+
+
+def user(text):
+    return [{"role": "user", "content": text}]
+
+
+@pytest.mark.parametrize("text", [
+    "Help me solve this tax form",
+    "Tell me a joke about death",
+    "Can you guess what I had for lunch?",
+    "I drew a stick figure, is it good?",
+])
+def test_off_topic_prompt_with_one_keyword_goes_through_triage(graph, text):
+    route = agent_config.get_pre_router({}).route(graph, user(text))
+    assert route.path == "triage"
+    assert route.agent is graph.triage
+
+
+def test_rule_match_takes_the_fast_path(graph):
+    route = agent_config.get_pre_router({}).route(graph, user("Tell me a riddle"))
+    assert route.path == "fast"
+    assert route.agent is graph.specialists["riddles_agent"]
+
+
+def test_classifier_fast_path_needs_several_hits(graph):
+    route = agent_config.get_pre_router({}).route(graph, user("something grim and twisted about a funeral"))
+    assert route.path == "fast"
+    assert route.agent is graph.specialists["dark_humor_agent"]
+
+
+def test_classifier_requires_margin_over_runner_up():
+    classifier = KeywordClassifier()
+    assert classifier.classify("a corny and cheesy but dark and edgy bit") == (None, 0.0)
+    target, confidence = classifier.classify("a corny cheesy pun with one dark turn")
+    assert target == "dad_jokes_agent"
+    assert confidence == pytest.approx(0.75)
+
+
+def test_single_keyword_is_enough_when_configured():
+    assert KeywordClassifier(min_hits=1).classify("solve this")[0] == "riddles_agent"
+
+
+def test_classifier_can_be_turned_off(graph):
+    router = agent_config.get_pre_router({"routing": {"classifier": "none"}})
+    assert router.classifier is None
+    assert router.route(graph, user("something grim and twisted about a funeral")).path == "triage"
+
+
+def test_fast_path_disabled_always_triages(graph):
+    router = agent_config.get_pre_router({"routing": {"fast_path": False}})
+    assert router.route(graph, user("show me an xkcd")).agent is graph.triage
+
+
+def test_conflicting_rules_fall_back_to_triage(graph):
+    route = PreRouter().route(graph, user("a riddle told as an xkcd comic"))
+    assert route.path == "triage"
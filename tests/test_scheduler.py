@@ -0,0 +1,156 @@
+import asyncio
+import email.utils
+import threading
+import time
+
+import httpx
+
+from src.agent.scheduler import ProviderLimits, RequestScheduler, parse_retry_after
+
+
+def test_limits_changed_from_another_thread_admit_waiting_runs():
+    scheduler = RequestScheduler()
+    scheduler.configure("p", ProviderLimits(max_concurrency=1))
+    errors = []
+
+    async def main():
+        queue = scheduler.queue_for("p")
+        first = queue.enqueue("a", 1)
+        second = queue.enqueue("b", 1)
+        assert first.future.done() and not second.future.done()
+
+        # As on a Streamlit rerun: the script thread applies new limits while runs wait on the loop
+        def rerun():
+            try:
+                scheduler.configure("p", ProviderLimits(max_concurrency=2))
+            except Exception as exc:
+                errors.append(exc)
+
+        thread = threading.Thread(target=rerun)
+        thread.start()
+        thread.join()
+        await asyncio.wait_for(second.future, 1)
+        assert queue.limits.max_concurrency == 2
+        assert queue.running == 2
+
+    asyncio.run(main())
+    assert errors == []
+
+
+def test_limits_changed_from_another_thread_while_waiting_for_tokens():
+    scheduler = RequestScheduler()
+    scheduler.configure("p", ProviderLimits(tokens_per_minute=6000))
+    errors = []
+
+    async def main():
+        queue = scheduler.queue_for("p")
+        queue.enqueue("a", 6000)
+        waiting = queue.enqueue("b", 60)
+        assert not waiting.future.done()
+
+        def rerun():
+            try:
+                scheduler.configure("p", ProviderLimits(tokens_per_minute=12000))
+            except Exception as exc:
+                errors.append(exc)
+
+        thread = threading.Thread(target=rerun)
+        thread.start()
+        thread.join()
+        # Refill at 200 tokens/s: the timer set on the loop admits the run after about 0.3s
+        await asyncio.wait_for(waiting.future, 5)
+
+    asyncio.run(main())
+    assert errors == []
+
+
+def test_waiting_runs_are_admitted_round_robin_across_sessions():
+    async def main():
+        queue = RequestScheduler().queue_for("p")
+        queue.configure(ProviderLimits(max_concurrency=1))
+        running = queue.enqueue("x", 1)
+        tickets = {name: queue.enqueue(name[0], 1) for name in ("a1", "a2", "a3", "b1")}
+        assert [queue.position(tickets[name]) for name in ("a1", "b1", "a2", "a3")] == [1, 2, 3, 4]
+
+        order = []
+        while len(order) < len(tickets):
+            queue.release(running)
+            name, running = next((n, t) for n, t in tickets.items() if n not in order and t.future.done())
+            order.append(name)
+        return order
+
+    # Session a queued three runs first, but b's run goes second
+    assert asyncio.run(main()) == ["a1", "b1", "a2", "a3"]
+
+
+def test_token_bucket_holds_runs_until_refilled():
+    async def main():
+        queue = RequestScheduler().queue_for("p")
+        queue.configure(ProviderLimits(tokens_per_minute=60000))
+        queue.enqueue("a", 60000)
+        waiting = queue.enqueue("b", 100)
+        assert not waiting.future.done()
+        # Refill at 1000 tokens/s admits the run after about 0.1s
+        await asyncio.wait_for(waiting.future, 2)
+
+    asyncio.run(main())
+
+
+def test_release_refunds_unused_tokens():
+    async def main():
+        queue = RequestScheduler().queue_for("p")
+        queue.configure(ProviderLimits(tokens_per_minute=6000))
+        first = queue.enqueue("a", 6000)
+        waiting = queue.enqueue("b", 3000)
+        assert not waiting.future.done()
+        queue.release(first, used_tokens=3000)
+        assert waiting.future.done()
+
+    asyncio.run(main())
+
+
+def test_retry_after_pauses_admissions():
+    scheduler = RequestScheduler()
+
+    async def main():
+        scheduler.observe_response("p", httpx.Response(429, headers={"retry-after": "0.2"}))
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        ticket = scheduler.queue_for("p").enqueue("a", 1)
+        assert not ticket.future.done()
+        await asyncio.wait_for(ticket.future, 2)
+        return loop.time() - started
+
+    assert asyncio.run(main()) >= 0.15
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(httpx.Headers({"retry-after-ms": "250"})) == 0.25
+    assert parse_retry_after(httpx.Headers({"retry-after": "3"})) == 3.0
+    retry_at = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 < parse_retry_after(httpx.Headers({"retry-after": retry_at})) <= 30
+    assert parse_retry_after(httpx.Headers({"retry-after": "soon"})) is None
+    assert parse_retry_after(httpx.Headers()) is None
+
+
+def test_stream_reports_queue_position_until_admitted():
+    scheduler = RequestScheduler()
+    scheduler.configure("p", ProviderLimits(max_concurrency=1))
+
+    async def reply():
+        yield {"delta": "hi"}
+
+    async def main():
+        blocker = scheduler.queue_for("p").enqueue("other", 1)
+        chunks = []
+        async for chunk in scheduler.stream("p", "s", "prompt", reply):
+            chunks.append(chunk)
+            if chunk.get("status") == "queued":
+                scheduler.queue_for("p").release(blocker)
+        return chunks
+
+    chunks = asyncio.run(main())
+    assert chunks[0] == {"status": "queued", "provider": "p", "position": 1}
+    assert chunks[1] == {"status": "running", "provider": "p"}
+    assert "Queued" in chunks[2]["step"]
+    assert chunks[3] == {"delta": "hi"}
@@ -0,0 +1,81 @@
+import asyncio
+
+from benchmarks.fake_openai import FakeOpenAIServer, FakeServerConfig
+from src.agent.metrics import TurnMetrics, get_metrics_registry
+from src.agent.providers import ProviderSettings, build_run_config
+from src.agent.registry import get_agent_graph
+from src.agent.speculation import Speculator, speculative_response_stream
+
+PROMPT = [{"role": "user", "content": "make me laugh"}]
+
+
+def handover(target):
+    return f"🔄 Handover **Humor Routing Agent** -> **{target}**"
+
+
+def outcomes():
+    registry = get_metrics_registry()
+    return {outcome: registry.get("agent_speculations_total", outcome=outcome) for outcome in ("hit", "miss")}
+
+
+def speculate(handoff, specialist):
+    """Run a speculative triage turn against the fake server; returns the chunks and metrics."""
+    async def main():
+        fake = FakeOpenAIServer(FakeServerConfig(ttft=0.1, token_rate=500, tokens=10, handoff=handoff))
+        base_url = await fake.start()
+        try:
+            settings = ProviderSettings(provider="xai", model="model", base_url=base_url, api_key="key")
+            graph = get_agent_graph("xai", "model")
+            metrics = TurnMetrics(provider="xai", model="model")
+            stream = speculative_response_stream(
+                graph.triage, graph.agent_named(specialist), PROMPT,
+                run_config=build_run_config(settings), metrics=metrics,
+            )
+            return [chunk async for chunk in stream], metrics
+        finally:
+            await fake.stop()
+
+    return asyncio.run(main())
+
+
+def test_prediction_prefers_the_classifier_hint():
+    graph = get_agent_graph("xai", "model")
+    predicted = Speculator().predict("s", graph, [{"role": "user", "content": "tell me a riddle"}])
+    assert predicted.name == "Riddle Master"
+
+
+def test_prediction_follows_the_session_transitions():
+    graph = get_agent_graph("xai", "model")
+    speculator = Speculator()
+    for target in ("Riddle Master", "Dad Jokes Master", "Riddle Master", "Dad Jokes Master", "Riddle Master"):
+        speculator.record("s", [handover(target)])
+    # Triage switches styles, so the last specialist is not predicted again
+    assert speculator.predict("s", graph, [{"role": "user", "content": "again"}]).name == "Dad Jokes Master"
+    assert Speculator().predict("s", graph, [{"role": "user", "content": "again"}]) is None
+
+
+def test_correct_prediction_keeps_the_speculative_run():
+    before = outcomes()
+    chunks, metrics = speculate("transfer_to_riddle_master", "Riddle Master")
+    steps = [chunk["step"] for chunk in chunks if "step" in chunk]
+    assert "Speculative run of **Riddle Master** kept" in steps[1]
+    assert "".join(chunk.get("delta", "") for chunk in chunks)
+    assert outcomes()["hit"] == before["hit"] + 1
+    assert metrics.output_tokens > 0
+
+
+def test_wrong_prediction_continues_on_the_triage_run():
+    before = outcomes()
+    chunks, _ = speculate("transfer_to_dad_jokes_master", "Riddle Master")
+    steps = [chunk["step"] for chunk in chunks if "step" in chunk]
+    assert "triage chose **Dad Jokes Master**" in steps[1]
+    assert "".join(chunk.get("delta", "") for chunk in chunks)
+    assert outcomes()["miss"] == before["miss"] + 1
+
+
+def test_triage_answering_itself_is_a_miss():
+    before = outcomes()
+    chunks, _ = speculate("none", "Riddle Master")
+    assert not any("step" in chunk for chunk in chunks)
+    assert "".join(chunk.get("delta", "") for chunk in chunks)
+    assert outcomes()["miss"] == before["miss"] + 1
@@ -0,0 +1,47 @@
+import pytest
+from streamlit.runtime.scriptrunner import RerunData, RerunException
+
+from src.agent.metrics import get_metrics_registry
+from src.ui import startup, streamlit_app
+from src.ui import utils as ui_utils
+
+
+@pytest.fixture
+def fresh_process(monkeypatch):
+    """No script run has finished yet in this process."""
+    monkeypatch.setattr(startup, "_cold_start", None)
+
+
+def reruns() -> float:
+    for line in get_metrics_registry().render_prometheus().splitlines():
+        if line.startswith("app_rerun_seconds_count"):
+            return float(line.split()[-1])
+    return 0.0
+
+
+def test_first_run_is_the_cold_start_and_later_runs_are_reruns(fresh_process):
+    timer = startup.RunTimer()
+    timer.mark("painted")
+    timings = timer.finish()
+    assert list(timings) == ["painted", "total"]
+    assert startup.get_cold_start() == timings
+
+    before = reruns()
+    startup.RunTimer().finish()
+    assert startup.get_cold_start() == timings
+    assert reruns() == before + 1
+
+
+def test_run_ending_in_a_rerun_is_timed(fresh_process, monkeypatch):
+    startup.RunTimer().finish()
+
+    def chat_turn(graph):
+        raise RerunException(RerunData())
+
+    for name in ("start_metrics_exporter", "setup_sidebar", "initialize_session_state", "display_chat_history"):
+        monkeypatch.setattr(ui_utils, name, lambda: None)
+    monkeypatch.setattr(ui_utils, "handle_chat_interaction", chat_turn)
+    before = reruns()
+    with pytest.raises(RerunException):
+        streamlit_app.main()
+    assert reruns() == before + 1
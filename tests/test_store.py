@@ -0,0 +1,50 @@
+import pytest
+
+from src.agent.history import ConversationSummary
+from src.agent.store import create_conversation_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    return create_conversation_store(request.param, str(tmp_path / "conversations.sqlite3"))
+
+
+def message(content, role="user"):
+    return {"role": role, "content": content, "emoji": None, "steps": ["🔄 Handover **A** -> **B**"]}
+
+
+def test_messages_round_trip_in_pages(store):
+    for index in range(5):
+        assert store.append_message("c", index, message(f"m{index}"))
+    assert store.count_messages("c") == 5
+    assert [m["content"] for m in store.load_messages("c", offset=1, limit=2)] == ["m1", "m2"]
+    assert store.load_messages("c")[0]["steps"] == ["🔄 Handover **A** -> **B**"]
+
+
+def test_tab_that_is_behind_cannot_overwrite_messages(store):
+    # Both tabs opened the conversation with two messages
+    store.append_message("c", 0, message("hi"))
+    store.append_message("c", 1, message("hello", "assistant"))
+    assert store.append_message("c", 2, message("tab A question"))
+    assert store.append_message("c", 3, message("tab A answer", "assistant"))
+
+    assert not store.append_message("c", 2, message("tab B question"))
+    assert [m["content"] for m in store.load_messages("c")] == ["hi", "hello", "tab A question", "tab A answer"]
+
+
+def test_feedback_and_summary_are_updated_in_place(store):
+    store.append_message("c", 0, message("hi"))
+    store.set_feedback("c", 0, 1)
+    store.save_summary("c", ConversationSummary("summary", 4))
+    store.save_summary("c", ConversationSummary("newer", 6))
+    assert store.load_messages("c")[0]["feedback"] == 1
+    assert store.load_summary("c") == ConversationSummary("newer", 6)
+    assert store.load_summary("other") is None
+
+
+def test_message_past_the_end_is_rejected(store):
+    store.append_message("c", 0, message("hi"))
+    with pytest.raises(ValueError):
+        store.append_message("c", 2, message("gap"))
+    assert [m["content"] for m in store.load_messages("c")] == ["hi"]
+    assert store.append_message("c", 1, message("next"))
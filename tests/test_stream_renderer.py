@@ -0,0 +1,66 @@
+import pytest
+
+from src.ui import utils
+from src.ui.utils import StreamRenderer
+
+
+class Container:
+    """Records what a Streamlit placeholder would render."""
+
+    def __init__(self):
+        self.renders = []
+
+    def markdown(self, text):
+        self.renders.append(text)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(utils.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_deltas_within_a_frame_are_rendered_together(clock):
+    container = Container()
+    renderer = StreamRenderer(container, fps=10, flush_chars=1000)
+    for delta in ("Why ", "did ", "the "):
+        renderer.append(delta)
+        clock[0] += 0.01
+    assert container.renders == []
+    clock[0] += 0.1
+    renderer.append("chicken")
+    assert container.renders == ["Why did the chicken"]
+
+
+def test_large_buffer_is_flushed_before_the_frame_ends(clock):
+    container = Container()
+    renderer = StreamRenderer(container, fps=10, flush_chars=10)
+    renderer.append("12345")
+    renderer.append("67890")
+    assert container.renders == ["1234567890"]
+
+
+def test_heartbeat_flushes_a_stalled_stream(clock):
+    container = Container()
+    renderer = StreamRenderer(container, fps=10, flush_chars=1000)
+    renderer.append("Why ")
+    renderer.tick()
+    assert container.renders == []
+    clock[0] += 0.2
+    renderer.tick()
+    assert container.renders == ["Why "]
+    # Nothing new to show
+    clock[0] += 0.2
+    renderer.tick()
+    assert container.renders == ["Why "]
+
+
+def test_final_flush_renders_the_rest(clock):
+    container = Container()
+    renderer = StreamRenderer(container, fps=10, flush_chars=1000)
+    renderer.append("Why ")
+    renderer.append("not")
+    renderer.flush()
+    assert container.renders == ["Why not"]
+    assert renderer.text == "Why not"
@@ -0,0 +1,106 @@
+import asyncio
+
+from openai.types.chat import ChatCompletionChunk
+
+from benchmarks.fake_openai import FakeOpenAIServer, FakeServerConfig
+from src.agent import streaming
+from src.agent.pipeline import generate_response_stream
+from src.agent.providers import ProviderSettings, build_run_config
+from src.agent.registry import get_agent_graph
+from src.agent.streaming import normalize_chunks
+
+
+def chunk(tool_calls=None, content=None, usage=None, drop_index=False):
+    parsed = ChatCompletionChunk.model_validate({
+        "id": "chunk",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "model",
+        "choices": [{"index": 0, "delta": {"content": content, "tool_calls": tool_calls}}],
+        "usage": usage,
+    })
+    if drop_index:
+        # Some providers leave the index out, which the type does not allow
+        for tool_call in parsed.choices[0].delta.tool_calls:
+            tool_call.index = None
+    return parsed
+
+
+def tool_call(index, id=None, name=None, arguments=None):
+    return {"index": index, "id": id, "type": "function", "function": {"name": name, "arguments": arguments}}
+
+
+def normalize(chunks):
+    async def main():
+        async def stream():
+            for item in chunks:
+                yield item
+        return [item async for item in normalize_chunks(stream())]
+    return asyncio.run(main())
+
+
+def calls_of(chunks):
+    return [
+        (call.index, call.id, call.function.name, call.function.arguments)
+        for item in chunks
+        for call in item.choices[0].delta.tool_calls or []
+    ]
+
+
+def test_repeated_tool_call_id_and_name_are_passed_once():
+    chunks = normalize([
+        chunk([tool_call(0, "call_1", "transfer_to_x", "")]),
+        chunk([tool_call(0, "call_1", "transfer_to_x", "{}")]),
+    ])
+    assert calls_of(chunks) == [(0, "call_1", "transfer_to_x", ""), (0, None, None, "{}")]
+
+
+def test_name_fragments_are_kept():
+    chunks = normalize([
+        chunk([tool_call(0, "call_1", "transfer_", "")]),
+        chunk([tool_call(0, None, "to_x", "{}")]),
+    ])
+    assert calls_of(chunks) == [(0, "call_1", "transfer_", ""), (0, None, "to_x", "{}")]
+
+
+def test_missing_indices_are_derived_from_call_ids():
+    chunks = normalize([
+        chunk([tool_call(0, "call_1", "first", "")], drop_index=True),
+        chunk([tool_call(0, None, None, "{}")], drop_index=True),
+        chunk([tool_call(0, "call_2", "second", "")], drop_index=True),
+        chunk([tool_call(0, "call_1", None, "")], drop_index=True),
+    ])
+    assert [call[0] for call in calls_of(chunks)] == [0, 0, 1, 0]
+
+
+def test_usage_is_kept_on_following_chunks():
+    usage = {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}
+    chunks = normalize([chunk(content="hi"), chunk(content="!", usage=usage), chunk()])
+    assert chunks[0].usage is None
+    assert chunks[1].usage.total_tokens == chunks[2].usage.total_tokens == 12
+
+
+def test_streamed_runs_go_through_the_normalizing_model(monkeypatch):
+    # StreamingChatCompletionsModel overrides a private SDK method, see the pin in requirements.txt
+    normalized = []
+
+    async def counting(stream):
+        async for item in normalize_chunks(stream):
+            normalized.append(item)
+            yield item
+
+    monkeypatch.setattr(streaming, "normalize_chunks", counting)
+
+    async def main():
+        fake = FakeOpenAIServer(FakeServerConfig(ttft=0.0, token_rate=0, tokens=5, handoff="none"))
+        base_url = await fake.start()
+        try:
+            settings = ProviderSettings(provider="xai", model="model", base_url=base_url, api_key="key")
+            agent = get_agent_graph("xai", "model").agent_named("Riddle Master")
+            stream = generate_response_stream(agent, "a riddle", run_config=build_run_config(settings))
+            return "".join([chunk.get("delta", "") async for chunk in stream])
+        finally:
+            await fake.stop()
+
+    assert asyncio.run(main())
+    assert normalized
@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fake_openai import FakeOpenAIServer, FakeServerConfig
+from src.agent import config as agent_config
+from src.agent.agent import create_agent_graph
+from src.agent.history import estimate_tokens
+from src.agent.metrics import TurnMetrics
+from src.agent.pipeline import get_agent_response
+from src.agent.providers import build_run_config
+from src.agent.tokens import count_tokens, instruction_tokens, precompute_instruction_tokens
+
+
+def test_instruction_tokens_are_counted_once_per_model():
+    graph = create_agent_graph(model="test-model")
+    counts = precompute_instruction_tokens(graph, "test-model")
+    assert set(counts) == {graph.triage.name, *(agent.name for agent in graph.specialists.values())}
+    assert counts[graph.triage.name] == count_tokens(graph.triage.instructions, "test-model")
+    assert instruction_tokens(graph.triage) == counts[graph.triage.name]
+
+
+def test_count_falls_back_to_estimate_without_tiktoken(monkeypatch):
+    from src.agent import tokens
+    monkeypatch.setattr(tokens, "_encoding", lambda model: None)
+    assert tokens.count_tokens("x" * 40, "test-model") == estimate_tokens("x" * 40)
+
+
+def test_prompt_usage_reads_cached_tokens():
+    metrics = TurnMetrics(provider="openai", model="test-model")
+    metrics.add_prompt_usage(SimpleNamespace(input_tokens_details=SimpleNamespace(cached_tokens=1024)), 300)
+    metrics.add_prompt_usage(None, 200)
+    assert (metrics.cached_tokens, metrics.instruction_tokens) == (1024, 500)
+    assert "1024 cached, 500 instructions" in metrics.breakdown_steps()[-1]
+
+
+@pytest.mark.parametrize("provider", ["openai", "xai"])
+def test_non_streamed_turn_reports_instruction_tokens(provider):
+    async def main():
+        fake = FakeOpenAIServer(FakeServerConfig(ttft=0.0, token_rate=0, tokens=5, handoff="transfer_to_riddle_master"))
+        base = await fake.start()
+        try:
+            config = {provider: {"api_key": "key", "model": "test-model", "base_url": base}}
+            settings = agent_config.get_provider_settings(config, provider)
+            graph = agent_config.get_provider_graph(config, settings)
+            metrics = TurnMetrics(provider=provider, model=settings.model)
+            await get_agent_response(
+                graph.triage, [{"role": "user", "content": "hi"}], stream=False,
+                run_config=build_run_config(settings), metrics=metrics,
+            )
+            return graph, metrics
+        finally:
+            await fake.stop()
+
+    graph, metrics = asyncio.run(main())
+    # One call by the triage agent, which hands off, and one by the riddle agent
+    expected = instruction_tokens(graph.triage, "test-model") + instruction_tokens(graph.specialists["riddles_agent"], "test-model")
+    assert metrics.instruction_tokens == expected
+    assert metrics.input_tokens > 0
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import threading
+import time
+
+from agents import FunctionTool, RunContextWrapper, function_tool
+
+from src.agent.tools import ToolExecutor, ToolPolicy, tool_function
+
+calls = []
+
+
+@function_tool
+def slow_lookup(word: str) -> str:
+    """Looks a word up slowly."""
+    calls.append(threading.current_thread().name)
+    time.sleep(0.2)
+    return word.upper()
+
+
+def invoke(tool, arguments):
+    return tool.on_invoke_tool(RunContextWrapper(context=None), arguments)
+
+
+def test_finds_function_behind_tool():
+    # tool_function reads SDK internals, see the pin in requirements.txt
+    assert tool_function(slow_lookup) is not None, "FunctionTool internals changed; update tool_function"
+    assert tool_function(slow_lookup).__name__ == "slow_lookup"
+
+
+def test_synchronous_tools_run_in_parallel_off_the_loop():
+    calls.clear()
+    tool = ToolExecutor().wrap(slow_lookup)
+
+    async def main():
+        started = time.perf_counter()
+        results = await asyncio.gather(*(invoke(tool, '{"word": "a"}') for _ in range(4)))
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(main())
+    assert results == ["A"] * 4
+    assert elapsed < 0.6
+    assert all(name.startswith("agent-tool") for name in calls)
+
+
+def test_timeout_is_reported_to_the_model():
+    executor = ToolExecutor()
+    executor.configure(2, ToolPolicy(timeout=0.05))
+    result = asyncio.run(invoke(executor.wrap(slow_lookup), '{"word": "a"}'))
+    assert "did not answer within" in result
+
+
+def test_results_are_cached_for_same_arguments():
+    calls.clear()
+    executor = ToolExecutor()
+    executor.configure(2, ToolPolicy(), {"slow_lookup": ToolPolicy(cache_ttl=60)})
+    tool = executor.wrap(slow_lookup)
+
+    async def main():
+        first = await invoke(tool, '{"word": "a"}')
+        second = await invoke(tool, '{ "word":"a" }')
+        return first, second
+
+    assert asyncio.run(main()) == ("A", "A")
+    assert len(calls) == 1
+
+
+def test_unknown_tool_function_is_warned_about(caplog):
+    async def on_invoke(context, arguments):
+        return "ok"
+
+    tool = FunctionTool(name="opaque", description="", params_json_schema={}, on_invoke_tool=on_invoke)
+    with caplog.at_level(logging.WARNING, logger="src.agent.tools"):
+        wrapped = ToolExecutor().wrap(tool)
+    assert "cannot find the function behind tool opaque" in caplog.text
+    assert asyncio.run(invoke(wrapped, "{}")) == "ok"
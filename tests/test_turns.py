@@ -0,0 +1,134 @@
+import asyncio
+import concurrent.futures
+import time
+
+import pytest
+
+from benchmarks.fake_openai import FakeServerConfig
+from src.agent.clients import get_client_manager
+from src.agent.messages import ChatMessage
+from src.agent.metrics import TurnMetrics, get_metrics_registry
+from src.agent.pipeline import generate_response_stream
+from src.agent.providers import ProviderSettings, build_run_config
+from src.agent.registry import get_agent_graph
+from src.agent.turns import DISCONNECTED, STOPPED, SUPERSEDED, TurnHandle, TurnRegistry, cancelled_step
+from src.ui.utils import EMPTY_MESSAGE, get_conversation_history_for_agent
+from tests.test_server import CountingServer
+
+
+def cancellations(reason):
+    return get_metrics_registry().get("agent_turns_cancelled_total", reason=reason)
+
+
+def test_cancel_cancels_attached_futures_once():
+    before = cancellations(STOPPED)
+    handle = TurnHandle("s")
+    future = concurrent.futures.Future()
+    handle.attach(future)
+    assert handle.cancel(STOPPED)
+    assert not handle.cancel(STOPPED)
+    assert future.cancelled()
+    assert cancellations(STOPPED) == before + 1
+
+    late = concurrent.futures.Future()
+    handle.attach(late)
+    assert late.cancelled()
+
+
+def test_partial_output_ends_with_the_cancelled_marker():
+    handle = TurnHandle("s")
+    for chunk in ({"step": "route"}, {"delta": "Why did "}, {"status": "running"}, {"delta": "the"}):
+        handle.record(chunk)
+    assert handle.partial() == {"response": "Why did the", "steps": ["route"]}
+    handle.cancel(DISCONNECTED)
+    assert handle.partial() == {"response": "Why did the", "steps": ["route", cancelled_step(DISCONNECTED)]}
+
+
+def test_new_turn_supersedes_the_one_in_flight():
+    registry = TurnRegistry()
+    first = registry.begin("s")
+    second = registry.begin("s")
+    assert first.reason == SUPERSEDED and not second.cancelled
+
+    # The superseded turn ending late must not forget its successor
+    registry.finish(first)
+    assert registry.cancel("s", STOPPED)
+    assert second.reason == STOPPED
+    registry.finish(second)
+    assert not registry.cancel("s", STOPPED)
+
+
+def test_cancelling_the_handle_stops_the_producer():
+    closed = []
+
+    async def chunks():
+        try:
+            for i in range(1000):
+                yield {"delta": str(i)}
+                await asyncio.sleep(0.01)
+        finally:
+            closed.append(True)
+
+    handle = TurnHandle("s")
+    received = []
+    with pytest.raises(concurrent.futures.CancelledError):
+        for chunk in get_client_manager().iterate(chunks(), handle=handle, heartbeat=0.05):
+            if chunk is not None:
+                received.append(chunk)
+                if len(received) == 3:
+                    handle.cancel(STOPPED)
+    time.sleep(0.1)
+    assert closed == [True]
+    assert len(received) < 10
+
+
+def test_cancelled_turn_stops_the_provider_stream():
+    manager = get_client_manager()
+    fake = CountingServer(FakeServerConfig(ttft=0.1, token_rate=40, tokens=60, handoff="none"))
+    base_url = manager.run(fake.start())
+    try:
+        settings = ProviderSettings(provider="xai", model="model", base_url=base_url, api_key="key")
+        graph = get_agent_graph("xai", "model")
+        stream = generate_response_stream(
+            graph.agent_named("Riddle Master"), [{"role": "user", "content": "a riddle"}],
+            run_config=build_run_config(settings),
+        )
+        handle = TurnHandle("s")
+        deltas = 0
+        with pytest.raises(concurrent.futures.CancelledError):
+            for chunk in manager.iterate(stream, handle=handle, heartbeat=0.05):
+                deltas += chunk is not None and "delta" in chunk
+                if deltas == 5:
+                    handle.cancel(STOPPED)
+
+        time.sleep(0.3)
+        produced = fake.produced
+        time.sleep(0.5)
+        assert fake.produced == produced < fake.config.tokens
+    finally:
+        manager.run(fake.stop())
+
+
+def turns_by_status():
+    registry = get_metrics_registry()
+    return {
+        status: registry.get("agent_turns_total", status=status, provider="p", model="m")
+        for status in ("cancelled", "error")
+    }
+
+
+def test_cancelled_turns_are_counted_apart_from_errors():
+    before = turns_by_status()
+    TurnMetrics(provider="p", model="m").finish(asyncio.CancelledError())
+    TurnMetrics(provider="p", model="m").finish(RuntimeError("down"))
+    assert turns_by_status() == {"cancelled": before["cancelled"] + 1, "error": before["error"] + 1}
+
+
+def test_empty_messages_are_not_sent_to_the_provider():
+    messages = [ChatMessage("user", "a joke"), ChatMessage("assistant", ""), ChatMessage("user", "a riddle")]
+    # Positions must still match the summary's count of folded messages
+    assert get_conversation_history_for_agent(messages) == [
+        {"role": "user", "content": "a joke"},
+        {"role": "assistant", "content": EMPTY_MESSAGE},
+        {"role": "user", "content": "a riddle"},
+    ]
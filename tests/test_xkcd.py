@@ -0,0 +1,118 @@
+import asyncio
+import json
+import logging
+
+import httpx
+import pytest
+
+from src.agent import xkcd
+from src.agent.xkcd import XkcdIndex
+
+RECORDS = [
+    {"num": 353, "safe_title": "Python", "img": "https://imgs.xkcd.com/comics/python.png", "alt": "import antigravity"},
+    {"num": 927, "title": "Standards", "img": "https://imgs.xkcd.com/comics/standards.png", "alt": "Fortunately..."},
+]
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    """Every request fails as if there were no network; returns the list of requested URLs."""
+    requested = []
+
+    def handler(request):
+        requested.append(str(request.url))
+        raise httpx.ConnectError("no network", request=request)
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(xkcd.httpx, "AsyncClient", lambda **kwargs: real_client(
+        transport=httpx.MockTransport(handler), timeout=kwargs.get("timeout")
+    ))
+    monkeypatch.setattr(xkcd, "MAX_ATTEMPTS", 1)
+    return requested
+
+
+@pytest.fixture
+def seed_file(tmp_path, monkeypatch):
+    path = tmp_path / "seed.json"
+    path.write_text(json.dumps(RECORDS))
+    monkeypatch.setenv("XKCD_INDEX_SEED", str(path))
+    return path
+
+
+def test_index_is_seeded_from_environment(tmp_path, seed_file):
+    index = XkcdIndex(path=tmp_path / "index.json")
+    index.load()
+    assert set(index.comics) == {353, 927}
+    assert index.latest == 927
+    assert index.comics[353]["title"] == "Python"
+    assert index.comics[927]["alt_text"] == "Fortunately..."
+
+
+def test_random_comic_comes_from_seeded_index_offline(tmp_path, seed_file, offline, caplog):
+    index = XkcdIndex(path=tmp_path / "index.json")
+
+    async def main():
+        comic = await index.random_comic()
+        await asyncio.sleep(0.05)  # let the background prefetch fail
+        return comic
+
+    with caplog.at_level(logging.WARNING, logger="src.agent.xkcd"):
+        comic = asyncio.run(main())
+    assert comic["comic_url"] in {"https://xkcd.com/353/", "https://xkcd.com/927/"}
+    assert comic["title"] in {"Python", "Standards"}
+    # The prefetch tried the network and gave up quietly
+    assert offline and "giving up" in caplog.text
+
+
+def test_saved_index_is_loaded_back(tmp_path, seed_file, monkeypatch):
+    index = XkcdIndex(path=tmp_path / "index.json")
+    index.load()
+    index.save()
+    monkeypatch.delenv("XKCD_INDEX_SEED")
+    reloaded = XkcdIndex(path=tmp_path / "index.json")
+    reloaded.load()
+    assert reloaded.comics == index.comics
+    assert reloaded.latest == 927
+
+
+def test_unreadable_seed_is_skipped(tmp_path, monkeypatch):
+    bad = tmp_path / "bad.json"
+    bad.write_text("not json")
+    monkeypatch.setenv("XKCD_INDEX_SEED", str(bad))
+    index = XkcdIndex(path=tmp_path / "index.json")
+    index.load()
+    assert index.comics == {}
+
+
+def test_prefetch_failures_are_logged(tmp_path, caplog):
+    index = XkcdIndex(path=tmp_path / "index.json")
+
+    async def broken_prefetch(count=xkcd.PREFETCH_COUNT):
+        raise RuntimeError("disk full")
+
+    index.prefetch = broken_prefetch
+
+    async def main():
+        index.start_prefetch()
+        await asyncio.sleep(0.01)
+
+    with caplog.at_level(logging.WARNING, logger="src.agent.xkcd"):
+        asyncio.run(main())
+    assert "XKCD prefetch failed: disk full" in caplog.text
+
+
+def test_client_replaced_for_new_loop_is_closed(tmp_path):
+    index = XkcdIndex(path=tmp_path / "index.json")
+
+    async def client():
+        return index._http_client()
+
+    async def replace():
+        new = index._http_client()
+        await asyncio.sleep(0.01)
+        return new
+
+    first = asyncio.run(client())
+    second = asyncio.run(replace())
+    assert first is not second
+    assert first.is_closed and not second.is_closed